@@ -0,0 +1,192 @@
+"""
+Admission control, deadlines and load shedding for inference requests
+
+Each model has an AdmissionController. At most ``max_concurrent`` requests
+run on the model at once and at most ``max_queue`` more wait for a slot. A
+request that finds the queue full is rejected at once with Overloaded. A
+request whose deadline passes while it waits gets DeadlineExceeded. app.py
+turns both into HTTP 503 with a Retry-After header, so a traffic spike
+sheds a few requests cleanly instead of timing all of them out.
+
+While a request holds a slot, its deadline is kept for the current thread.
+llm.py adds a stopping criterion from it, so generation is cut off once the
+deadline passes. Under pressure ``token_budget`` shrinks max_new_tokens in
+proportion to the queue depth, down to ``min_token_ratio`` of the request,
+so queued work drains sooner and tail latency stays bounded. app.py applies
+it to chat replies only; analyses are cached, so they keep their limits.
+
+Limits come from ADMISSION_<MODEL>_CONCURRENCY, ADMISSION_<MODEL>_QUEUE and
+ADMISSION_MIN_TOKEN_RATIO.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED
+
+
+class AdmissionError(Exception):
+    """A request was not run; clients may retry after ``retry_after`` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionError):
+    """Raised when a model's admission queue is full"""
+
+
+class DeadlineExceeded(AdmissionError):
+    """Raised when a request's deadline passes before its work is done"""
+
+
+_local = threading.local()
+
+
+def current_deadline():
+    """Deadline (a ``time.time()`` value) of this thread's request, or None"""
+    return getattr(_local, "deadline", None)
+
+
+def deadline_passed():
+    deadline = current_deadline()
+    return deadline is not None and time.time() >= deadline
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if this thread's request has run out of time"""
+    if deadline_passed():
+        controller = getattr(_local, "controller", None)
+        retry_after = controller.retry_after() if controller else 1
+        raise DeadlineExceeded("Request deadline exceeded", retry_after)
+
+
+def token_budget(max_tokens):
+    """``max_tokens`` shrunk for the load on this thread's model, if any"""
+    controller = getattr(_local, "controller", None)
+    return controller.token_budget(max_tokens) if controller else max_tokens
+
+
+@contextmanager
+def deadline_scope(deadline, controller=None):
+    """Make ``deadline`` the current thread's deadline inside the block"""
+    previous = (current_deadline(), getattr(_local, "controller", None))
+    _local.deadline, _local.controller = deadline, controller
+    try:
+        yield
+    finally:
+        _local.deadline, _local.controller = previous
+
+
+class AdmissionController:
+    """Bounded concurrency and queue for the requests served by one model"""
+
+    def __init__(self, name, max_concurrent=1, max_queue=8, min_token_ratio=0.5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.min_token_ratio = min_token_ratio
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._mean_seconds = None  # moving average of time held per request
+
+    def retry_after(self):
+        """Whole seconds until a slot is likely to be free (at least 1)"""
+        per_request = self._mean_seconds or 1.0
+        slots = max(1, self.max_concurrent)
+        return max(1, math.ceil(per_request * (self.waiting + 1) / slots))
+
+    def acquire(self, deadline):
+        """Wait for a slot; returns a start time to pass to ``release``"""
+        with self._cond:
+            if self.running >= self.max_concurrent and self.waiting >= self.max_queue:
+                self.rejected += 1
+                ADMISSION_REJECTED.inc(model=self.name, reason="overloaded")
+                raise Overloaded(
+                    f"{self.name} is overloaded, try again later", self.retry_after()
+                )
+            self.waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self.waiting, model=self.name)
+            try:
+                while self.running >= self.max_concurrent:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.expired += 1
+                        ADMISSION_REJECTED.inc(model=self.name, reason="deadline")
+                        raise DeadlineExceeded(
+                            f"Request deadline passed while queued for {self.name}",
+                            self.retry_after(),
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self.waiting, model=self.name)
+            self.running += 1
+            self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, started):
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            self.running -= 1
+            if self._mean_seconds is None:
+                self._mean_seconds = elapsed
+            else:
+                self._mean_seconds = 0.8 * self._mean_seconds + 0.2 * elapsed
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, timeout):
+        """Hold a slot for the block, with a deadline ``timeout`` seconds away"""
+        deadline = time.time() + timeout
+        started = self.acquire(deadline)
+        try:
+            with deadline_scope(deadline, self):
+                yield deadline
+        finally:
+            self.release(started)
+
+    def token_budget(self, max_tokens):
+        """Shrink ``max_tokens`` linearly with queue depth, to min_token_ratio"""
+        waiting = self.waiting
+        if not waiting or self.max_queue <= 0:
+            return max_tokens
+        pressure = min(1.0, waiting / self.max_queue)
+        ratio = 1 - (1 - self.min_token_ratio) * pressure
+        return max(1, int(max_tokens * ratio))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "mean_seconds": (
+                    round(self._mean_seconds, 3) if self._mean_seconds else None
+                ),
+            }
+
+
+def admission_controller_from_env(name, max_concurrent=1, max_queue=8):
+    """AdmissionController for one model, configured by ADMISSION_* variables"""
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionController(
+        name,
+        max_concurrent=int(
+            os.environ.get(f"{prefix}_CONCURRENCY", str(max_concurrent))
+        ),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE", str(max_queue))),
+        min_token_ratio=float(os.environ.get("ADMISSION_MIN_TOKEN_RATIO", "0.5")),
+    )
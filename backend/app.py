@@ -1,270 +1,1351 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 from datetime import datetime
 import json
+import os
 import re
-from llm import query_flan_t5, query_llama2_chat, query_hf_model
+import threading
+import time
+from contextlib import closing, contextmanager
+from admission import (
+    AdmissionError,
+    admission_controller_from_env,
+    check_deadline,
+    deadline_passed,
+    token_budget,
+)
+from bulk import run_bulk_analysis
+from cache import (
+    analysis_cache_from_env,
+    chat_response_cache_from_env,
+    make_cache_key,
+    template_version,
+)
+from chunking import chunk_cv, merge_ranked
+from constrained import Field
+from conversation import (
+    CHAT_SUMMARY_TOKENS,
+    HISTORY_HEADING,
+    ConversationMemory,
+    estimate_tokens,
+    format_turn,
+)
+from extraction import (
+    UPLOAD_MAX_BYTES,
+    ExtractionError,
+    UploadTooLarge,
+    detect_format,
+    extract_text,
+    upload_file,
+    upload_stream,
+)
+from jobs import JobManager, QueueFull
+import metrics
+from metrics import (
+    ANALYSIS_FALLBACKS,
+    ANALYSIS_STAGE_SECONDS,
+    CHAT_TTFT_SECONDS,
+    HTTP_IN_FLIGHT,
+    HTTP_REQUEST_SECONDS,
+)
+from retrieval import CHAT_RETRIEVAL_K, PassageIndex
+from stopping import (
+    COMMA,
+    QUESTION_END,
+    SENTENCE_END,
+    ItemsComplete,
+    SectionComplete,
+    section_items,
+    split_items,
+)
+from prompts import (
+    KEYWORDS_PROMPT,
+    QUESTIONS_PROMPT,
+    ROLE_PROMPT,
+    STRENGTHS_PROMPT,
+    STRUCTURED_PROMPT,
+    SUGGESTIONS_PROMPT,
+)
+from storage import SORTABLE_FIELDS, store_from_env
+from taxonomy import skill_matcher
+from llm import (
+    FLAN_T5_DECODING,
+    FLAN_T5_ENGINE,
+    FLAN_T5_MAX_INPUT_TOKENS,
+    FLAN_T5_MODEL,
+    FLAN_T5_PRECISION,
+    LLAMA2_ENGINE,
+    LLAMA2_PRECISION,
+    SYSTEM_PREFIX_KEY,
+    PromptAssembler,
+)
+
+# With MODEL_SERVER_SOCKET set the models live in model_server.py, shared by
+# all web workers; otherwise this process loads them itself
+USE_MODEL_SERVER = bool(os.environ.get("MODEL_SERVER_SOCKET"))
+if USE_MODEL_SERVER:
+    from llm_client import (
+        model_registry,
+        prefix_cache,
+        render_server_metrics,
+        warm_up_from_env,
+        embed_texts,
+        query_flan_t5,
+        query_flan_t5_ids,
+        query_flan_t5_structured,
+        query_llama2_chat,
+        query_hf_model,
+        stream_llama2_chat,
+    )
+else:
+    from llm import (
+        model_registry,
+        prefix_cache,
+        warm_up_from_env,
+        embed_texts,
+        query_flan_t5,
+        query_flan_t5_ids,
+        query_flan_t5_structured,
+        query_llama2_chat,
+        query_hf_model,
+        stream_llama2_chat,
+    )
+
+
+class BoundedRequest(Request):
+    """Request whose body is limited to MAX_CONTENT_LENGTH, except for bulk.
+
+    Bulk uploads are NDJSON streams read line by line, so their size is
+    not limited. CV uploads are written to a named temporary file, which
+    text extraction reads in place.
+    """
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == "analyze_bulk":
+            return None
+        return super().max_content_length
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        if self.endpoint == "analyze_upload":
+            return upload_stream(filename)
+        return super()._get_file_stream(
+            total_content_length, content_type, filename, content_length
+        )
+
 
 app = Flask(__name__)
+app.request_class = BoundedRequest
+# Werkzeug rejects larger bodies while parsing them; the extra 64 KB leaves
+# room for the multipart headers and form fields around the file
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES + 64 * 1024
 CORS(app)  # Enable CORS for all routes
 
-# In-memory storage for demo (replace with database in production)
-sessions = {}
-analyses = {}
+# Models load lazily on first use; MODEL_WARMUP starts loading them up front
+warm_up_from_env()
+
+# Session and analysis storage (STORAGE_BACKEND=memory | sqlite)
+store = store_from_env()
+
+# Time-to-first-token of recent streamed chat responses, in milliseconds
+chat_ttft_ms = deque(maxlen=1000)
+
+# Fixed-size inference worker pool for asynchronous analysis jobs
+analysis_jobs = JobManager(
+    workers=int(os.environ.get("ANALYSIS_WORKERS", "1")),
+    max_queue=int(os.environ.get("ANALYSIS_QUEUE_SIZE", "32")),
+)
+
+# Admission control for synchronous model requests: each model runs a bounded
+# number of them at once and queues a bounded number more. Requests beyond
+# that, or still unfinished at their deadline, get 503 with Retry-After.
+# Asynchronous jobs and bulk runs are bounded by their own worker pools.
+flan_t5_admission = admission_controller_from_env("flan_t5", max_concurrent=1)
+llama2_admission = admission_controller_from_env(
+    "llama2", max_concurrent=int(os.environ.get("CHAT_MAX_BATCH_SIZE", "1"))
+)
+ANALYZE_DEADLINE_SECONDS = float(os.environ.get("ANALYZE_DEADLINE_SECONDS", "120"))
+CHAT_DEADLINE_SECONDS = float(os.environ.get("CHAT_DEADLINE_SECONDS", "60"))
+
+# Long CVs are analyzed in chunks: at most ANALYSIS_MAX_CHUNKS per CV, and at
+# most ANALYSIS_MAX_BATCH prompts per Flan-T5 generate call
+ANALYSIS_MAX_CHUNKS = int(os.environ.get("ANALYSIS_MAX_CHUNKS", "6"))
+ANALYSIS_MAX_BATCH = int(os.environ.get("ANALYSIS_MAX_BATCH", "16"))
+CHUNK_TOKEN_MARGIN = 16
+
+# Worker pool and batch size for bulk NDJSON analysis
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", "1"))
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "4"))
+# Saved progress of a bulk upload is dropped once it has not been updated
+# for this long (default one week)
+BULK_PROGRESS_TTL_SECONDS = int(os.environ.get("BULK_PROGRESS_TTL_SECONDS", "604800"))
+bulk_executor = ThreadPoolExecutor(
+    max_workers=BULK_WORKERS, thread_name_prefix="bulk-worker"
+)
+
+
+# Template fixed text is tokenized once; CV chunks are spliced in as token IDs
+ANALYSIS_PROMPTS = PromptAssembler(
+    {
+        "keywords": KEYWORDS_PROMPT,
+        "role": ROLE_PROMPT,
+        "suggestions": SUGGESTIONS_PROMPT,
+        "questions": QUESTIONS_PROMPT,
+        "strengths": STRENGTHS_PROMPT,
+        "structured": STRUCTURED_PROMPT,
+    }
+)
+
+# Items each parser takes from one chunk's response
+KEYWORDS_PER_CHUNK = 10
+SUGGESTIONS_PER_CHUNK = 4
+QUESTIONS_PER_CHUNK = 5
+STRENGTHS_PER_CHUNK = 3
+
+STRENGTHS_HEADINGS = ["STRENGTHS:", "AREAS TO IMPROVE:", "WEAKNESSES:"]
+
+# Generation for a stage stops as soon as its parser has what it needs. The
+# separators are ones Flan-T5 can emit (see stopping.py); it has no newline.
+ANALYSIS_STOPS = {
+    "keywords": ItemsComplete(COMMA, KEYWORDS_PER_CHUNK),
+    "role": ItemsComplete(SENTENCE_END, 1),
+    "suggestions": ItemsComplete(SENTENCE_END, SUGGESTIONS_PER_CHUNK),
+    "questions": ItemsComplete(QUESTION_END, QUESTIONS_PER_CHUNK, must_contain="?"),
+    "strengths": SectionComplete(STRENGTHS_HEADINGS[1:], STRENGTHS_PER_CHUNK),
+}
+
+# Flan-T5 decoding mode per stage (see llm.FLAN_T5_DECODING). ANALYSIS_DECODING
+# sets every stage, ANALYSIS_DECODING_<STAGE> overrides one. The default,
+# greedy, gives the same analysis for the same CV every time.
+ANALYSIS_DECODING = {
+    name: os.environ.get(
+        f"ANALYSIS_DECODING_{name.upper()}",
+        os.environ.get("ANALYSIS_DECODING", "greedy"),
+    )
+    for name in ANALYSIS_PROMPTS.templates
+}
+for name, decoding in ANALYSIS_DECODING.items():
+    if decoding not in FLAN_T5_DECODING:
+        raise ValueError(f"Unknown decoding mode for {name}: {decoding}")
+
+# ANALYSIS_MODE=structured generates the whole analysis of a chunk in one
+# schema-constrained pass (constrained.py) instead of one prompt per stage
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "stages")
+if ANALYSIS_MODE not in ("stages", "structured"):
+    raise ValueError(f"Unknown ANALYSIS_MODE: {ANALYSIS_MODE}")
+
+# Schema of a structured analysis, in generation order. The role comes
+# before the interview questions, so the questions are written for it.
+ANALYSIS_FIELDS = (
+    Field("keywords", "Keywords:", KEYWORDS_PER_CHUNK, ",", max_item_tokens=8),
+    Field("identified_role", "Job Role:", max_item_tokens=12),
+    Field(
+        "suggestions",
+        "Suggestions:",
+        SUGGESTIONS_PER_CHUNK,
+        ".",
+        max_item_tokens=40,
+    ),
+    Field("strengths", "Strengths:", STRENGTHS_PER_CHUNK, ".", max_item_tokens=24),
+    Field(
+        "areas_to_improve",
+        "Areas to improve:",
+        STRENGTHS_PER_CHUNK,
+        ".",
+        max_item_tokens=24,
+    ),
+    Field(
+        "interview_questions",
+        "Interview questions:",
+        QUESTIONS_PER_CHUNK,
+        "?",
+        suffix="?",
+        max_item_tokens=32,
+    ),
+)
+
+# Bump ANALYSIS_REVISION when parsing or CV truncation changes; template,
+# decoding, engine, precision and skill taxonomy edits change PROMPT_VERSION
+# automatically.
+# Cached analyses from other versions are never served and are purged on
+# startup.
+ANALYSIS_REVISION = "5"
+PROMPT_VERSION = template_version(
+    ANALYSIS_REVISION,
+    ANALYSIS_MODE,
+    json.dumps(ANALYSIS_DECODING, sort_keys=True),
+    # Results differ between engines and precisions, so each has its own
+    json.dumps([FLAN_T5_ENGINE, FLAN_T5_PRECISION, LLAMA2_ENGINE, LLAMA2_PRECISION]),
+    KEYWORDS_PROMPT,
+    ROLE_PROMPT,
+    SUGGESTIONS_PROMPT,
+    QUESTIONS_PROMPT,
+    STRENGTHS_PROMPT,
+    STRUCTURED_PROMPT,
+    json.dumps([skill_matcher.skills, skill_matcher.roles], sort_keys=True),
+)
+
+analysis_cache = analysis_cache_from_env()
+analysis_cache.invalidate(keep_version=PROMPT_VERSION)
+
+# Returned by the query functions when generation fails
+GENERATION_ERROR = "Error generating response"
+
+# Fallback results used when the model output cannot be parsed
+DEFAULT_KEYWORDS = ["Python", "JavaScript", "React", "Node.js"]
+DEFAULT_ROLE = "Software Developer"
+DEFAULT_SUGGESTIONS = [
+    "Add quantified achievements with specific numbers",
+    "Include relevant technical keywords",
+    "Improve formatting consistency",
+    "Add a professional summary section",
+]
+DEFAULT_STRENGTHS = [
+    "Strong technical skills",
+    "Relevant experience",
+    "Well-structured content",
+]
+DEFAULT_AREAS_TO_IMPROVE = [
+    "Add quantified achievements",
+    "Include more keywords",
+    "Improve formatting",
+]
+
+
+def default_interview_questions(role):
+    """Generic interview questions used when generation fails"""
+    return [
+        f"Tell me about your experience as a {role}.",
+        "What has been your most challenging project?",
+        "How do you stay updated with new technologies?",
+        "Describe a time when you solved a complex problem.",
+        "What motivates you in your work?",
+    ]
+
+
+# Stages that fell back to defaults while tracked_fallbacks() is active
+_fallbacks = threading.local()
+
+
+def analysis_fallback(stage):
+    """Count a stage whose results were replaced by the defaults"""
+    ANALYSIS_FALLBACKS.inc(stage=stage)
+    stages = getattr(_fallbacks, "stages", None)
+    if stages is not None:
+        stages.add(stage)
+
+
+@contextmanager
+def tracked_fallbacks():
+    """Collect the stages that fall back to defaults inside the block"""
+    previous = getattr(_fallbacks, "stages", None)
+    _fallbacks.stages = stages = set()
+    try:
+        yield stages
+    finally:
+        _fallbacks.stages = previous
+
+
+def usable_responses(responses):
+    """``(responses, failed)``: failed generations become empty responses"""
+    failed = any(response == GENERATION_ERROR for response in responses)
+    return [
+        "" if response == GENERATION_ERROR else response for response in responses
+    ], failed
+
+
+def parse_keywords(response):
+    """Parse a comma-separated keyword response"""
+    return split_items(response, COMMA)[:KEYWORDS_PER_CHUNK]
+
+
+def merge_keywords(responses):
+    """Keywords from every chunk's response, deduplicated and ranked"""
+    return rank_keywords([parse_keywords(r) for r in responses])
+
+
+def rank_keywords(keyword_lists):
+    """Top keywords across every chunk's keyword list"""
+    keywords = merge_ranked(keyword_lists, 10)
+    if not keywords:
+        analysis_fallback("keywords")
+        return list(DEFAULT_KEYWORDS)
+    return keywords
+
+
+def parse_role(response):
+    """Parse a job title response"""
+    return merge_roles([response])
+
+
+def merge_roles(responses):
+    """The job title given by most chunks; the earliest chunk breaks ties"""
+    roles = []
+    for r in responses:
+        # The title is the first sentence; a full stop after it is dropped
+        titles = split_items(r.replace("Job Role:", ""), SENTENCE_END)
+        roles.append([titles[0].rstrip(".")] if titles else [])
+    merged = merge_ranked(roles, 1)
+    if not merged:
+        analysis_fallback("role")
+        return DEFAULT_ROLE
+    return merged[0]
+
+
+def parse_suggestions(response):
+    """Parse one suggestion per sentence or line"""
+    return merge_suggestions([response])
+
+
+def merge_suggestions(responses):
+    """Suggestions from every chunk, ranked by how many chunks gave them"""
+    return rank_suggestions(
+        [split_items(r, SENTENCE_END)[:SUGGESTIONS_PER_CHUNK] for r in responses]
+    )
+
+
+def rank_suggestions(suggestion_lists):
+    """Top suggestions across every chunk's suggestion list"""
+    suggestions = merge_ranked(suggestion_lists, 4)
+    if not suggestions:
+        analysis_fallback("suggestions")
+        return list(DEFAULT_SUGGESTIONS)
+    return suggestions
+
+
+def parse_interview_questions(response, role):
+    """Parse the questions, each ending with a question mark"""
+    return merge_interview_questions([response], role)
+
+
+def merge_interview_questions(responses, role):
+    """Questions from every chunk, deduplicated and ranked"""
+    questions = [
+        [q for q in split_items(r, QUESTION_END) if "?" in q][:QUESTIONS_PER_CHUNK]
+        for r in responses
+    ]
+    return rank_interview_questions(questions, role)
 
 
+def rank_interview_questions(question_lists, role):
+    """Top interview questions across every chunk's question list"""
+    questions = merge_ranked(question_lists, 5)
+    if not questions:
+        analysis_fallback("interview_questions")
+        return default_interview_questions(role)
+    return questions
+
+
+def strengths_sections(response):
+    """Items of the STRENGTHS / AREAS TO IMPROVE bullet blocks, unlimited"""
+    strengths = []
+    areas_to_improve = []
+    for heading, items in section_items(response, STRENGTHS_HEADINGS):
+        section = strengths if heading == "STRENGTHS:" else areas_to_improve
+        section.extend(item for item in items if item)
+    return strengths, areas_to_improve
+
+
+def parse_strengths_weaknesses(response):
+    """Parse the STRENGTHS / AREAS TO IMPROVE bullet blocks"""
+    return merge_strengths_weaknesses([response])
+
+
+def merge_strengths_weaknesses(responses):
+    """Top three strengths and areas to improve across every chunk"""
+    sections = [strengths_sections(r) for r in responses]
+    return rank_strengths_weaknesses(
+        [s[:STRENGTHS_PER_CHUNK] for s, _ in sections],
+        [a[:STRENGTHS_PER_CHUNK] for _, a in sections],
+    )
+
+
+def rank_strengths_weaknesses(strength_lists, area_lists):
+    """Top three strengths and areas to improve across every chunk's lists"""
+    strengths = merge_ranked(strength_lists, 3)
+    areas_to_improve = merge_ranked(area_lists, 3)
+
+    # Fallbacks if parsing fails
+    if not strengths or not areas_to_improve:
+        analysis_fallback("strengths")
+    if not strengths:
+        strengths = list(DEFAULT_STRENGTHS)
+    if not areas_to_improve:
+        areas_to_improve = list(DEFAULT_AREAS_TO_IMPROVE)
+
+    return strengths, areas_to_improve
+
+
+def chunk_for_analysis(cv_text):
+    """Tokenize a CV once into section-aware chunks that fit every prompt"""
+    overhead = max(
+        ANALYSIS_PROMPTS.overhead(name) for name in ANALYSIS_PROMPTS.templates
+    )
+    # The margin covers the role name in the questions prompt
+    budget = FLAN_T5_MAX_INPUT_TOKENS - overhead - CHUNK_TOKEN_MARGIN
+    return chunk_cv(cv_text, budget, ANALYSIS_PROMPTS.encode, ANALYSIS_MAX_CHUNKS)
+
+
+def chunk_cvs_for_analysis(cv_texts):
+    """Chunks of every CV; a CV that cannot be tokenized gets none.
+
+    That happens when the tokenizer fails to load, for example. Such a CV
+    gets the default results, like a failed generation, and is not cached.
+    """
+    chunks_per_cv = []
+    for cv_text in cv_texts:
+        try:
+            chunks_per_cv.append(chunk_for_analysis(cv_text))
+        except Exception as e:
+            print(f"Error chunking CV for analysis: {e}")
+            chunks_per_cv.append([])
+    return chunks_per_cv
+
+
+def generate_in_batches(prompts, max_tokens, stages):
+    """Run token ID prompts through Flan-T5 in batches of ANALYSIS_MAX_BATCH.
+
+    ``stages`` names the analysis stage of each prompt (or of all of them),
+    which picks its decoding mode and stop condition. Prompts with the same
+    decoding mode, the same output limit and similar length share a batch,
+    which keeps padding and wasted decoding steps low. Responses come back
+    in the order of ``prompts``. DeadlineExceeded is raised once the
+    request's deadline has passed. Output limits do not shrink under load
+    like chat replies do, since a shortened analysis would be cached.
+    """
+    if isinstance(max_tokens, int):
+        max_tokens = [max_tokens] * len(prompts)
+    if isinstance(stages, str):
+        stages = [stages] * len(prompts)
+    decoding = [ANALYSIS_DECODING[stage] for stage in stages]
+    order = sorted(
+        range(len(prompts)),
+        key=lambda i: (decoding[i], max_tokens[i], len(prompts[i])),
+    )
+    groups = []
+    for i in order:
+        if (
+            groups
+            and len(groups[-1]) < ANALYSIS_MAX_BATCH
+            and decoding[groups[-1][0]] == decoding[i]
+        ):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+
+    responses = [""] * len(prompts)
+    for group in groups:
+        outputs = query_flan_t5_ids(
+            [prompts[i] for i in group],
+            max_tokens=[max_tokens[i] for i in group],
+            decoding=decoding[group[0]],
+            stop=[ANALYSIS_STOPS[stages[i]] for i in group],
+        )
+        # Outputs cut off at the deadline are incomplete, so they are not used
+        check_deadline()
+        for i, output in zip(group, outputs):
+            responses[i] = output
+    return responses
+
+
+def map_chunks(name, cv_text, max_tokens, **fields):
+    """Responses to prompt ``name`` for every chunk of the CV"""
+    field_ids = {field: ANALYSIS_PROMPTS.encode(text) for field, text in fields.items()}
+    prompts = [
+        ANALYSIS_PROMPTS.build(name, cv_text=chunk, **field_ids)
+        for chunk in chunk_for_analysis(cv_text)
+    ]
+    responses, _ = usable_responses(generate_in_batches(prompts, max_tokens, name))
+    return responses
+
+
+@ANALYSIS_STAGE_SECONDS.timed(stage="keywords")
 def extract_keywords_from_cv(cv_text):
     """Extract technical keywords from CV text using Flan-T5"""
-    prompt = f"""
-    Extract technical skills, programming languages, frameworks, and tools mentioned in this CV.
-    Return only a comma-separated list of keywords.
-    
-    CV Text: {cv_text[:2000]}
-    
-    Keywords:"""
-
     try:
-        response = query_flan_t5(prompt, max_tokens=100)
-        # Clean and parse the response
-        keywords = [k.strip() for k in response.split(",") if k.strip()]
-        return keywords[:10]  # Limit to 10 keywords
+        return merge_keywords(map_chunks("keywords", cv_text, 100))
     except Exception as e:
         print(f"Error extracting keywords: {e}")
-        return ["Python", "JavaScript", "React", "Node.js"]  # Fallback
+        analysis_fallback("keywords")
+        return list(DEFAULT_KEYWORDS)  # Fallback
 
 
+@ANALYSIS_STAGE_SECONDS.timed(stage="role")
 def identify_role_from_cv(cv_text):
     """Identify the most likely job role from CV content using Flan-T5"""
-    prompt = f"""
-    Based on this CV, what is the most likely job role/position this person is applying for?
-    Return only the job title (e.g., "Software Engineer", "Data Scientist", "Product Manager").
-    
-    CV Text: {cv_text[:1500]}
-    
-    Job Role:"""
-
     try:
-        response = query_flan_t5(prompt, max_tokens=50)
-        # Clean the response
-        role = response.strip().replace("Job Role:", "").strip()
-        return role if role else "Software Developer"
+        return merge_roles(map_chunks("role", cv_text, 50))
     except Exception as e:
         print(f"Error identifying role: {e}")
-        return "Software Developer"  # Fallback
+        analysis_fallback("role")
+        return DEFAULT_ROLE  # Fallback
 
 
+@ANALYSIS_STAGE_SECONDS.timed(stage="suggestions")
 def generate_cv_suggestions(cv_text):
     """Generate improvement suggestions for the CV using Flan-T5"""
-    prompt = f"""
-    Analyze this CV and provide 4 specific improvement suggestions.
-    Focus on content, formatting, and missing elements.
-    Return each suggestion on a new line.
-    
-    CV Text: {cv_text[:2000]}
-    
-    Suggestions:"""
-
     try:
-        response = query_flan_t5(prompt, max_tokens=200)
-        # Parse suggestions
-        suggestions = [s.strip() for s in response.split("\n") if s.strip()]
-        return (
-            suggestions[:4]
-            if suggestions
-            else [
-                "Add quantified achievements with specific numbers",
-                "Include relevant technical keywords",
-                "Improve formatting consistency",
-                "Add a professional summary section",
-            ]
-        )
+        return merge_suggestions(map_chunks("suggestions", cv_text, 200))
     except Exception as e:
         print(f"Error generating suggestions: {e}")
-        return [
-            "Add quantified achievements with specific numbers",
-            "Include relevant technical keywords",
-            "Improve formatting consistency",
-            "Add a professional summary section",
-        ]
+        analysis_fallback("suggestions")
+        return list(DEFAULT_SUGGESTIONS)
 
 
+@ANALYSIS_STAGE_SECONDS.timed(stage="interview_questions")
 def generate_interview_questions(cv_text, role):
     """Generate role-specific interview questions based on CV using Flan-T5"""
-    prompt = f"""
-    Generate 5 interview questions for a {role} position based on this CV.
-    Focus on the candidate's experience and skills mentioned in the CV.
-    
-    CV Text: {cv_text[:1500]}
-    Role: {role}
-    
-    Questions:"""
-
     try:
-        response = query_flan_t5(prompt, max_tokens=250)
-        # Parse questions
-        questions = [q.strip() for q in response.split("\n") if q.strip() and "?" in q]
-        return (
-            questions[:5]
-            if questions
-            else [
-                f"Tell me about your experience as a {role}.",
-                "What has been your most challenging project?",
-                "How do you stay updated with new technologies?",
-                "Describe a time when you solved a complex problem.",
-                "What motivates you in your work?",
-            ]
-        )
+        responses = map_chunks("questions", cv_text, 250, role=role)
+        return merge_interview_questions(responses, role)
     except Exception as e:
         print(f"Error generating questions: {e}")
-        return [
-            f"Tell me about your experience as a {role}.",
-            "What has been your most challenging project?",
-            "How do you stay updated with new technologies?",
-            "Describe a time when you solved a complex problem.",
-            "What motivates you in your work?",
-        ]
+        analysis_fallback("interview_questions")
+        return default_interview_questions(role)
 
 
+@ANALYSIS_STAGE_SECONDS.timed(stage="ats_score")
 def calculate_ats_score(cv_text, keywords):
     """Calculate ATS compatibility score based on CV content"""
-    # Simple scoring based on various factors
-    score = 70  # Base score
-
-    # Check for common ATS-friendly elements
-    if len(cv_text) > 500:
-        score += 5
-    if any(keyword.lower() in cv_text.lower() for keyword in keywords):
-        score += 10
-    if "experience" in cv_text.lower():
-        score += 5
-    if any(
-        word in cv_text.lower() for word in ["achieved", "developed", "managed", "led"]
-    ):
-        score += 10
-
-    return min(score, 95)  # Cap at 95
+    # Length, keyword, experience and action-verb checks in one taxonomy scan
+    return skill_matcher.match(cv_text, keywords=keywords)["ats_score"]
 
 
+@ANALYSIS_STAGE_SECONDS.timed(stage="strengths")
 def analyze_cv_strengths_weaknesses(cv_text):
     """Analyze CV strengths and areas for improvement using Flan-T5"""
-    prompt = f"""
-    Analyze this CV and identify:
-    1. Three main strengths
-    2. Three areas that need improvement
-    
-    Format your response as:
-    STRENGTHS:
-    - strength 1
-    - strength 2
-    - strength 3
-    AREAS TO IMPROVE:
-    - area 1
-    - area 2  
-    - area 3
-    
-    CV Text: {cv_text[:1500]}"""
-
     try:
-        response = query_flan_t5(prompt, max_tokens=200)
-
-        # Parse strengths and weaknesses
-        strengths = []
-        areas_to_improve = []
-
-        lines = response.split("\n")
-        current_section = None
-
-        for line in lines:
-            line = line.strip()
-            if "STRENGTHS:" in line.upper():
-                current_section = "strengths"
-            elif "AREAS TO IMPROVE:" in line.upper() or "WEAKNESSES:" in line.upper():
-                current_section = "improve"
-            elif line.startswith("-") or line.startswith("•"):
-                item = line[1:].strip()
-                if current_section == "strengths" and len(strengths) < 3:
-                    strengths.append(item)
-                elif current_section == "improve" and len(areas_to_improve) < 3:
-                    areas_to_improve.append(item)
-
-        # Fallbacks if parsing fails
-        if not strengths:
-            strengths = [
-                "Strong technical skills",
-                "Relevant experience",
-                "Well-structured content",
+        return merge_strengths_weaknesses(map_chunks("strengths", cv_text, 200))
+    except Exception as e:
+        print(f"Error analyzing strengths/weaknesses: {e}")
+        analysis_fallback("strengths")
+        return list(DEFAULT_STRENGTHS), list(DEFAULT_AREAS_TO_IMPROVE)
+
+
+# Per-chunk analysis prompts that only need the CV text, with output limits
+CHUNK_STAGES = [
+    ("keywords", 100),
+    ("role", 50),
+    ("suggestions", 200),
+    ("strengths", 200),
+]
+
+
+def run_cv_analysis_batch(cv_texts, progress=None):
+    """Run every LLM analysis stage for several CVs and return their results.
+
+    Each CV is tokenized once into section-aware chunks that fit Flan-T5's
+    input window, so no part of a long CV is cut off. Every stage prompt is
+    assembled from those token IDs. The keyword, role,
+    suggestion and strengths/weaknesses prompts only need the CV text, so
+    every chunk's prompts for every CV go to Flan-T5 in shared batches.
+    Interview questions depend on the identified role and are generated
+    afterwards as a second round of batches. Per-chunk results are merged
+    deterministically (deduplicated, ranked by agreement across chunks).
+    The ATS score and the found/missing taxonomy skills come from one scan
+    of each CV by the skill matcher, with no LLM call.
+    ``progress(stage, state)`` is called as each stage starts and finishes.
+    With ANALYSIS_MODE=structured, run_structured_analysis_batch is used.
+
+    Returns ``(results, degraded)``. ``degraded[i]`` is True when a stage of
+    CV ``i`` failed or fell back to default results, so it must not be
+    cached.
+    """
+    if ANALYSIS_MODE == "structured":
+        return run_structured_analysis_batch(cv_texts, progress)
+    progress = progress or (lambda stage, state: None)
+    batched_stages = ["keywords", "role", "suggestions", "strengths"]
+
+    for stage in batched_stages:
+        progress(stage, "running")
+    results = []
+    degraded = [False] * len(cv_texts)
+    with ANALYSIS_STAGE_SECONDS.time(stage="batched"):
+        chunks_per_cv = chunk_cvs_for_analysis(cv_texts)
+        prompts = []
+        limits = []
+        stages = []
+        for chunks in chunks_per_cv:
+            for chunk in chunks:
+                for name, limit in CHUNK_STAGES:
+                    prompts.append(ANALYSIS_PROMPTS.build(name, cv_text=chunk))
+                    limits.append(limit)
+                    stages.append(name)
+        try:
+            responses = generate_in_batches(prompts, limits, stages)
+        except AdmissionError:
+            raise
+        except Exception as e:
+            print(f"Error running batched analysis: {e}")
+            responses = [""] * len(prompts)
+
+        position = 0
+        for i, chunks in enumerate(chunks_per_cv):
+            cv_responses, failed = usable_responses(
+                responses[position : position + len(chunks) * len(CHUNK_STAGES)]
+            )
+            position += len(chunks) * len(CHUNK_STAGES)
+            # One list of per-chunk responses for each stage
+            per_stage = [
+                cv_responses[stage :: len(CHUNK_STAGES)]
+                for stage in range(len(CHUNK_STAGES))
             ]
-        if not areas_to_improve:
-            areas_to_improve = [
-                "Add quantified achievements",
-                "Include more keywords",
-                "Improve formatting",
+            keywords, roles, suggestions, strengths = per_stage
+            with tracked_fallbacks() as fallbacks:
+                strengths, areas_to_improve = merge_strengths_weaknesses(strengths)
+                results.append(
+                    {
+                        "keywords": merge_keywords(keywords),
+                        "identified_role": merge_roles(roles),
+                        "suggestions": merge_suggestions(suggestions),
+                        "strengths": strengths,
+                        "areas_to_improve": areas_to_improve,
+                    }
+                )
+            degraded[i] = failed or bool(fallbacks)
+    for stage in batched_stages:
+        progress(stage, "done")
+
+    progress("interview_questions", "running")
+    with ANALYSIS_STAGE_SECONDS.time(stage="interview_questions"):
+        prompts = []
+        for chunks, result in zip(chunks_per_cv, results):
+            if not chunks:
+                continue
+            role_ids = ANALYSIS_PROMPTS.encode(result["identified_role"])
+            prompts += [
+                ANALYSIS_PROMPTS.build("questions", cv_text=chunk, role=role_ids)
+                for chunk in chunks
             ]
+        try:
+            responses = generate_in_batches(prompts, 250, "questions")
+        except AdmissionError:
+            raise
+        except Exception as e:
+            print(f"Error generating questions: {e}")
+            responses = [""] * len(prompts)
+        position = 0
+        for i, (chunks, result) in enumerate(zip(chunks_per_cv, results)):
+            chunk_responses, failed = usable_responses(
+                responses[position : position + len(chunks)]
+            )
+            position += len(chunks)
+            with tracked_fallbacks() as fallbacks:
+                result["interview_questions"] = merge_interview_questions(
+                    chunk_responses, result["identified_role"]
+                )
+            degraded[i] = degraded[i] or failed or bool(fallbacks)
+    progress("interview_questions", "done")
 
-        return strengths, areas_to_improve
+    score_skills(cv_texts, results, progress)
+    return results, degraded
 
-    except Exception as e:
-        print(f"Error analyzing strengths/weaknesses: {e}")
-        return (
-            [
-                "Strong technical skills",
-                "Relevant experience",
-                "Well-structured content",
-            ],
-            [
-                "Add quantified achievements",
-                "Include more keywords",
-                "Improve formatting",
-            ],
+
+def run_structured_analysis_batch(cv_texts, progress=None):
+    """Analyze several CVs with one schema-constrained generation per chunk.
+
+    Each chunk's prompt asks for the whole analysis, and Flan-T5 writes it
+    as one object with every field (see constrained.py). Prompts are
+    batched like the per-stage prompts, and per-chunk fields are merged
+    the same way. Returns ``(results, degraded)`` like run_cv_analysis_batch.
+    """
+    progress = progress or (lambda stage, state: None)
+    llm_stages = ["keywords", "role", "suggestions", "strengths", "interview_questions"]
+
+    for stage in llm_stages:
+        progress(stage, "running")
+    results = []
+    degraded = [False] * len(cv_texts)
+    with ANALYSIS_STAGE_SECONDS.time(stage="structured"):
+        chunks_per_cv = chunk_cvs_for_analysis(cv_texts)
+        prompts = [
+            ANALYSIS_PROMPTS.build("structured", cv_text=chunk)
+            for chunks in chunks_per_cv
+            for chunk in chunks
+        ]
+        try:
+            outputs = generate_structured_in_batches(prompts)
+        except AdmissionError:
+            raise
+        except Exception as e:
+            print(f"Error running structured analysis: {e}")
+            outputs = [None] * len(prompts)
+
+        position = 0
+        for i, chunks in enumerate(chunks_per_cv):
+            chunk_outputs = outputs[position : position + len(chunks)]
+            position += len(chunks)
+            # None marks a chunk whose generation failed
+            failed = any(output is None for output in chunk_outputs)
+            fields = [output or {} for output in chunk_outputs]
+            with tracked_fallbacks() as fallbacks:
+                role = merge_roles([f.get("identified_role", "") for f in fields])
+                strengths, areas_to_improve = rank_strengths_weaknesses(
+                    [f.get("strengths", []) for f in fields],
+                    [f.get("areas_to_improve", []) for f in fields],
+                )
+                results.append(
+                    {
+                        "keywords": rank_keywords(
+                            [f.get("keywords", []) for f in fields]
+                        ),
+                        "identified_role": role,
+                        "suggestions": rank_suggestions(
+                            [f.get("suggestions", []) for f in fields]
+                        ),
+                        "strengths": strengths,
+                        "areas_to_improve": areas_to_improve,
+                        "interview_questions": rank_interview_questions(
+                            [f.get("interview_questions", []) for f in fields], role
+                        ),
+                    }
+                )
+            degraded[i] = failed or bool(fallbacks)
+    for stage in llm_stages:
+        progress(stage, "done")
+
+    score_skills(cv_texts, results, progress)
+    return results, degraded
+
+
+def generate_structured_in_batches(prompts):
+    """Structured analyses for token ID prompts, in batches of ANALYSIS_MAX_BATCH"""
+    order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+    outputs = [None] * len(prompts)
+    for start in range(0, len(order), ANALYSIS_MAX_BATCH):
+        group = order[start : start + ANALYSIS_MAX_BATCH]
+        results = query_flan_t5_structured(
+            [prompts[i] for i in group],
+            ANALYSIS_FIELDS,
+            decoding=ANALYSIS_DECODING["structured"],
+        )
+        check_deadline()
+        for i, result in zip(group, results):
+            outputs[i] = result
+    return outputs
+
+
+def score_skills(cv_texts, results, progress):
+    """Add the ATS score and taxonomy skills to each CV's analysis results"""
+    progress("ats_score", "running")
+    with ANALYSIS_STAGE_SECONDS.time(stage="ats_score"):
+        for cv_text, result in zip(cv_texts, results):
+            skills = skill_matcher.match(
+                cv_text, role=result["identified_role"], keywords=result["keywords"]
+            )
+            result["ats_score"] = skills["ats_score"]
+            result["skills"] = {
+                "found": skills["found_skills"],
+                "missing": skills["missing_skills"],
+                "role": skills["role"],
+                "role_match": skills["role_match"],
+            }
+    progress("ats_score", "done")
+
+
+def run_cv_analysis(cv_text, progress=None):
+    """Run every LLM analysis stage for one CV and return the combined results"""
+    results, _ = run_cv_analysis_batch([cv_text], progress)
+    return results[0]
+
+
+ANALYSIS_STAGES = [
+    "keywords",
+    "role",
+    "suggestions",
+    "strengths",
+    "interview_questions",
+    "ats_score",
+]
+
+
+def analyze_cv_texts(cv_texts, progress=None):
+    """Analysis results for several CVs, reusing cached results for known CVs"""
+    cache_keys = [
+        make_cache_key(cv_text, FLAN_T5_MODEL, PROMPT_VERSION) for cv_text in cv_texts
+    ]
+    results = [analysis_cache.get(key) for key in cache_keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        fresh, degraded = run_cv_analysis_batch(
+            [cv_texts[i] for i in misses], progress
         )
+        for i, result, incomplete in zip(misses, fresh, degraded):
+            results[i] = result
+            if incomplete:
+                # Default results would be served until PROMPT_VERSION changes
+                print("⚠️ Analysis used fallback results - not caching it")
+                continue
+            analysis_cache.put(cache_keys[i], result, PROMPT_VERSION)
+    else:
+        print("⚡ Analysis cache hit - skipping LLM passes")
+        if progress:
+            for stage in ANALYSIS_STAGES:
+                progress(stage, "cached")
+    return results
+
+
+def build_analysis_record(session_id, cv_text, filename, file_size, result):
+    """Stored analysis for one CV, built from its analysis results"""
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "filename": filename,
+        "file_size": file_size,
+        "created_at": datetime.now().isoformat(),
+        # DEBUG: Include parsed text info for debugging
+        "debug_info": {
+            "text_length": len(cv_text),
+            "word_count": len(cv_text.split()),
+            "first_100_chars": (
+                cv_text[:100] + "..." if len(cv_text) > 100 else cv_text
+            ),
+            "parsing_successful": True,
+        },
+        # Analysis results generated by LLM
+        "ats_score": result["ats_score"],
+        "identified_role": result["identified_role"],
+        "keywords": {
+            "found": result["keywords"],
+            "missing": result["skills"]["missing"],  # Taxonomy skills for the role
+            "role_match": result["skills"]["role_match"],
+            "skills": result["skills"]["found"],
+            "taxonomy_role": result["skills"]["role"],
+        },
+        "suggestions": result["suggestions"],
+        "interview_questions": result["interview_questions"],
+        "strengths": result["strengths"],
+        "areas_to_improve": result["areas_to_improve"],
+    }
+
+
+def create_analysis(session_id, cv_text, filename, file_size, progress=None):
+    """Analyze a CV, store the result and attach it to its session"""
+    # Use LLM to analyze CV content
+    print("🤖 Starting LLM analysis...")
+
+    # Extract information using LLM, reusing a cached result for a known CV
+    result = analyze_cv_texts([cv_text], progress)[0]
+    print(
+        f"✅ LLM analysis complete - Role: {result['identified_role']}, "
+        f"ATS: {result['ats_score']}"
+    )
+
+    analysis_result = build_analysis_record(
+        session_id, cv_text, filename, file_size, result
+    )
+
+    # Store analysis and add it to its session
+    store.save_analysis(analysis_result)
+    index_analysis(analysis_result["id"], cv_text)
+
+    return analysis_result
+
+
+def create_analyses(session_id, records):
+    """Analyze a batch of ``{"filename", "cv_text"}`` records and store them"""
+    results = analyze_cv_texts([record["cv_text"] for record in records])
+    analyses = []
+    for record, result in zip(records, results):
+        analysis = build_analysis_record(
+            session_id,
+            record["cv_text"],
+            record.get("filename"),
+            record.get("file_size", len(record["cv_text"])),
+            result,
+        )
+        store.save_analysis(analysis)
+        index_analysis(analysis["id"], record["cv_text"])
+        analyses.append(analysis)
+    return analyses
 
 
-def generate_chat_response(message, analysis_context=None):
-    """Generate chat response using LLaMA 2 with optional CV analysis context"""
+def index_analysis(analysis_id, cv_text):
+    """Embed the CV's passages and store them with the analysis for chat"""
+    if CHAT_RETRIEVAL_K <= 0:
+        return
     try:
-        if analysis_context:
-            # Chat with CV analysis context
-            cv_info = f"""
+        store.save_index(analysis_id, PassageIndex.build(cv_text, embed_texts))
+    except Exception as e:
+        # Chat still works without an index, just without CV excerpts
+        print(f"⚠️ Warning: Could not index CV passages: {e}")
+
+
+def retrieve_cv_passages(message, analysis_context=None):
+    """CV passages most relevant to a chat message, best first"""
+    if not analysis_context or CHAT_RETRIEVAL_K <= 0:
+        return []
+    try:
+        index = store.get_index(analysis_context["id"])
+        if index is None or not index.passages:
+            return []
+        hits = index.search(embed_texts([message])[0], k=CHAT_RETRIEVAL_K)
+    except Exception as e:
+        print(f"⚠️ Warning: CV passage retrieval failed: {e}")
+        return []
+    return [passage for passage, _ in hits]
+
+
+# Chat history per session: recent turns verbatim plus a rolling summary of
+# older ones, kept under CHAT_MEMORY_TOKENS tokens (see conversation.py)
+CHAT_SUMMARY_PROMPT = """Update the summary of a conversation between a user and a CV assistant. Keep the user's goals, target roles, skills and the advice already given. Use at most three sentences.
+
+Summary so far: {summary}
+
+New messages:
+{turns}
+
+Updated summary:"""
+CHAT_SUMMARY_PROMPTS = PromptAssembler({"summary": CHAT_SUMMARY_PROMPT})
+
+
+def chat_tokenizer():
+    """The tokenizer of the loaded LLaMA 2, or None.
+
+    Nothing is loaded for it: until LLaMA 2 is ready in this process (never
+    with a model server) the chat memory budget uses estimate_tokens.
+    """
+    if USE_MODEL_SERVER or model_registry.state("llama2") != "ready":
+        return None
+    loaded = model_registry.get("llama2", wait=False)
+    return loaded[0] if loaded else None
+
+
+def count_chat_tokens(text):
+    tokenizer = chat_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def summarize_chat_turns(summary, turns):
+    """Fold chat turns into a session's rolling summary with Flan-T5"""
+    encode = CHAT_SUMMARY_PROMPTS.encode
+    input_ids = CHAT_SUMMARY_PROMPTS.build(
+        "summary",
+        summary=encode(summary or "None yet."),
+        turns=encode("\n".join(format_turn(turn) for turn in turns)),
+    )
+    with flan_t5_admission.admit(CHAT_DEADLINE_SECONDS):
+        (response,) = query_flan_t5_ids(
+            [input_ids], max_tokens=CHAT_SUMMARY_TOKENS, decoding="greedy"
+        )
+        if deadline_passed():
+            # A summary cut off at the deadline would lose the newest turns
+            return None
+    if response == GENERATION_ERROR:
+        return None
+    return response.strip()
+
+
+chat_memory = ConversationMemory(store, summarize_chat_turns, count_chat_tokens)
+
+
+# Longest chat reply; shrinks while chat requests are queued
+CHAT_MAX_TOKENS = 150
+
+CHAT_EMPTY_RESPONSE = "I'd be happy to help you with your CV! Could you please provide more specific details about what you'd like assistance with?"
+
+# Message keywords that make the frontend show the analysis panel
+CHAT_ACTION_KEYWORDS = [
+    "analyze",
+    "score",
+    "keywords",
+    "suggestions",
+    "interview",
+    "improve",
+    "feedback",
+]
+
+
+# Responses to questions asked without a CV (CHAT_CACHE_SIZE=0 disables it).
+# embed_texts is looked up on each call, so a replaced embedder is used.
+chat_response_cache = chat_response_cache_from_env(
+    embed=lambda texts: embed_texts(texts)
+)
+
+
+def cached_chat_response(message, analysis_context=None, history=""):
+    """Cached reply to a question asked without a CV, as ``(response, embedding)``.
+
+    The session's rendered chat ``history`` (summary and recent turns) is
+    part of the lookup, so a reply is only reused after the same
+    conversation; a first message has an empty history.
+    """
+    if analysis_context or chat_response_cache is None:
+        return None, None
+    response, embedding = chat_response_cache.get(message, context=history)
+    if response is not None:
+        print("⚡ Chat cache hit - skipping generation")
+    return response, embedding
+
+
+def remember_chat_response(
+    message,
+    response,
+    embedding,
+    analysis_context=None,
+    history="",
+    max_tokens=None,
+    model=None,
+):
+    """Cache a reply to a question asked without a CV, under its ``history``.
+
+    Only replies LLaMA 2 wrote in full are cached. ``model`` is the model
+    that answered, as reported by query_llama2_chat; replies from the
+    Flan-T5 fallback and error replies are never cached.
+    """
+    if analysis_context or chat_response_cache is None or not response:
+        return
+    if model != "llama2" or response == GENERATION_ERROR:
+        return
+    if deadline_passed() or (max_tokens or CHAT_MAX_TOKENS) < CHAT_MAX_TOKENS:
+        # Generation was cut off at the deadline or shortened under load
+        return
+    chat_response_cache.put(message, response, embedding, context=history)
+
+
+def build_chat_prompt(message, analysis_context=None, passages=None, history=""):
+    """Build the chat prompt, with CV analysis details when available.
+
+    The conversation ``history`` goes right before the user's question and
+    retrieved CV ``passages`` after it, so the part before them stays the
+    same on every turn and keeps its prefix cache entry.
+    """
+    if analysis_context:
+        # Chat with CV analysis context
+        cv_info = f"""
             File: {analysis_context.get('filename', 'Unknown')}
             Role: {analysis_context.get('identified_role', 'Unknown')}
             ATS Score: {analysis_context.get('ats_score', 'Unknown')}
             Keywords: {', '.join(analysis_context.get('keywords', {}).get('found', []))}
             """
 
-            prompt = f"""You are a CV analysis assistant. The user has uploaded a CV with the following details:
+        return f"""You are a CV analysis assistant. The user has uploaded a CV with the following details:
 {cv_info}
-
+{history}
 User question: {message}
-
+{cv_excerpts(passages)}
 Provide a helpful, specific response about their CV. Be concise and actionable."""
-        else:
-            # General chat without context
-            prompt = f"""You are a CV analysis assistant. Help users with CV improvement, job search advice, and career guidance.
 
+    # General chat without context
+    return f"""You are a CV analysis assistant. Help users with CV improvement, job search advice, and career guidance.
+{history}
 User question: {message}
 
 Provide a helpful response. Be concise and professional."""
 
-        response = query_llama2_chat(prompt, max_tokens=150)
 
-        # Clean up the response
-        response = response.strip()
-        if response.startswith("Response:"):
-            response = response[9:].strip()
+def cv_excerpts(passages):
+    """Prompt section quoting retrieved CV passages (empty when there are none)"""
+    if not passages:
+        return ""
+    quoted = "\n\n".join(f'"{passage}"' for passage in passages)
+    return f"\nRelevant parts of their CV:\n{quoted}\n"
 
-        return (
-            response
-            if response
-            else "I'd be happy to help you with your CV! Could you please provide more specific details about what you'd like assistance with?"
-        )
 
+def chat_prefix_cache_args(prompt, analysis_context=None):
+    """KV-cache key and shared prefix for a chat prompt.
+
+    Everything before the conversation history and the user's question is
+    identical for every turn about the same analysis (or for every
+    context-free turn), so LLaMA only has to prefill it once per key.
+    """
+    end = prompt.index("User question:")
+    if HISTORY_HEADING in prompt[:end]:
+        end = prompt.index(HISTORY_HEADING)
+    prefix = prompt[:end]
+    key = analysis_context["id"] if analysis_context else SYSTEM_PREFIX_KEY
+    return {"prefix_key": key, "prefix": prefix}
+
+
+def clean_chat_response(response):
+    """Strip whitespace and a leading "Response:" label from model output"""
+    response = response.strip()
+    if response.startswith("Response:"):
+        response = response[9:].strip()
+    return response
+
+
+def chat_error_response(analysis_context=None):
+    """Canned reply used when chat generation fails"""
+    if analysis_context:
+        return f"I can see you've uploaded {analysis_context.get('filename', 'your CV')} with an ATS score of {analysis_context.get('ats_score', 'N/A')}%. What specific aspect would you like me to help you with?"
+    else:
+        return "I'd be happy to help you with your CV analysis! Please upload your CV file and I'll provide detailed feedback and suggestions."
+
+
+def chat_has_actions(message, analysis_context=None):
+    """Whether the response should trigger actions (like showing analysis panel)"""
+    return bool(analysis_context) and any(
+        keyword in message.lower() for keyword in CHAT_ACTION_KEYWORDS
+    )
+
+
+def generate_chat_response(message, analysis_context=None, session_id=None):
+    """Generate chat response using LLaMA 2 with optional CV analysis context.
+
+    With a ``session_id`` the session's earlier turns are part of the prompt
+    and the new turn is added to them.
+    """
+    try:
+        history = chat_memory.render(session_id)
+        cached, embedding = cached_chat_response(message, analysis_context, history)
+        if cached is not None:
+            chat_memory.record(session_id, message, cached)
+            return cached
+
+        with llama2_admission.admit(CHAT_DEADLINE_SECONDS):
+            passages = retrieve_cv_passages(message, analysis_context)
+            prompt = build_chat_prompt(message, analysis_context, passages, history)
+            max_tokens = token_budget(CHAT_MAX_TOKENS)
+            response, model = query_llama2_chat(
+                prompt,
+                max_tokens=max_tokens,
+                with_model=True,
+                **chat_prefix_cache_args(prompt, analysis_context),
+            )
+
+            # Clean up the response
+            response = clean_chat_response(response)
+            remember_chat_response(
+                message,
+                response,
+                embedding,
+                analysis_context,
+                history,
+                max_tokens,
+                model,
+            )
+            chat_memory.record(session_id, message, response)
+        return response if response else CHAT_EMPTY_RESPONSE
+
+    except AdmissionError:
+        raise
     except Exception as e:
         print(f"Error generating chat response: {e}")
-        if analysis_context:
-            return f"I can see you've uploaded {analysis_context.get('filename', 'your CV')} with an ATS score of {analysis_context.get('ats_score', 'N/A')}%. What specific aspect would you like me to help you with?"
-        else:
-            return "I'd be happy to help you with your CV analysis! Please upload your CV file and I'll provide detailed feedback and suggestions."
+        return chat_error_response(analysis_context)
+
+
+def stream_chat_response(message, analysis_context=None, session_id=None):
+    """Streaming variant of generate_chat_response.
+
+    Yields ``("ready", None)`` once the request is admitted, then
+    ``("token", text)`` pairs as text is generated, and finishes with one
+    ``("done", message)`` pair carrying the cleaned full response. Text
+    is held back at the start until it is clear whether the model opened
+    with a "Response:" label, so the streamed tokens never include it.
+    """
+    label = "Response:"
+    raw = []
+    pending = ""
+    label_checked = False
+
+    try:
+        history = chat_memory.render(session_id)
+        cached, embedding = cached_chat_response(message, analysis_context, history)
+        if cached is not None:
+            chat_memory.record(session_id, message, cached)
+            yield "ready", None
+            yield "token", cached
+            yield "done", cached
+            return
+
+        with llama2_admission.admit(CHAT_DEADLINE_SECONDS):
+            yield "ready", None
+            passages = retrieve_cv_passages(message, analysis_context)
+            prompt = build_chat_prompt(message, analysis_context, passages, history)
+            max_tokens = token_budget(CHAT_MAX_TOKENS)
+            models = set()
+            pairs = stream_llama2_chat(
+                prompt,
+                max_tokens=max_tokens,
+                with_model=True,
+                **chat_prefix_cache_args(prompt, analysis_context),
+            )
+            # Closing the stream stops generation before the slot is released
+            with closing(pairs):
+                for model, text in pairs:
+                    models.add(model)
+                    if not text:
+                        continue
+                    raw.append(text)
+                    if not label_checked:
+                        pending = (pending + text).lstrip()
+                        if len(pending) < len(label) and label.startswith(pending):
+                            continue
+                        label_checked = True
+                        if pending.startswith(label):
+                            pending = pending[len(label) :]
+                        text = pending
+                    if pending is not None:
+                        # Nothing sent yet: drop whitespace left over from the label
+                        text = text.lstrip()
+                        if not text:
+                            continue
+                        pending = None
+                    yield "token", text
+
+            response = clean_chat_response("".join(raw))
+            remember_chat_response(
+                message,
+                response,
+                embedding,
+                analysis_context,
+                history,
+                max_tokens,
+                # None marks a reply LLaMA 2 stopped writing part way through
+                models.pop() if len(models) == 1 else None,
+            )
+            chat_memory.record(session_id, message, response)
+        yield "done", response if response else CHAT_EMPTY_RESPONSE
+
+    except AdmissionError:
+        raise
+    except Exception as e:
+        print(f"Error generating chat response: {e}")
+        yield "done", chat_error_response(analysis_context)
+
+
+def admission_error_response(error):
+    """HTTP 503 telling the client when to retry a shed request"""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    """HTTP 413 for request bodies over MAX_CONTENT_LENGTH"""
+    return jsonify({"error": f"Upload exceeds {UPLOAD_MAX_BYTES} bytes"}), 413
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(endpoint=request.endpoint or "unknown")
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unknown"
+    start = g.pop("request_start", None)
+    if start is not None:
+        # A streamed response is still generating here; it stops being in
+        # flight when the server closes it
+        response.call_on_close(lambda: HTTP_IN_FLIGHT.dec(endpoint=endpoint))
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            endpoint=endpoint,
+            status=str(response.status_code),
+        )
+    return response
 
 
 @app.route("/health", methods=["GET"])
@@ -273,15 +1354,62 @@ def health_check():
     return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    """
+    Readiness probe reporting each model's load state
+    Optional query parameter: models - comma-separated models that must be
+    loaded (default: flan_t5, which serves analysis and the chat fallback).
+    Models that have not started loading are loaded in the background.
+    """
+    required = [
+        name.strip()
+        for name in request.args.get("models", "flan_t5").split(",")
+        if name.strip()
+    ]
+    models = model_registry.status()
+    unknown = [name for name in required if name not in models]
+    if unknown:
+        return jsonify({"error": f"Unknown models: {', '.join(unknown)}"}), 400
+
+    for name in required:
+        if models[name]["state"] == "not_loaded":
+            model_registry.warm_up([name], background=True)
+
+    ready = all(models[name]["state"] == "ready" for name in required)
+    body = {
+        "ready": ready,
+        "models": models,
+        "admission": {
+            controller.name: controller.stats()
+            for controller in (flan_t5_admission, llama2_admission)
+        },
+        "timestamp": datetime.now().isoformat(),
+    }
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    if USE_MODEL_SERVER:
+        # LLM metrics are recorded where the models run
+        body = metrics.render(exclude=metrics.MODEL_METRICS) + render_server_metrics()
+    else:
+        body = metrics.render()
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/session", methods=["POST"])
 def create_session():
     """Create a new session"""
     session_id = f"cv_session_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:8]}"
-    sessions[session_id] = {
-        "id": session_id,
-        "created_at": datetime.now().isoformat(),
-        "analyses": [],
-    }
+    store.create_session(
+        {
+            "id": session_id,
+            "created_at": datetime.now().isoformat(),
+        }
+    )
     return jsonify({"session_id": session_id})
 
 
@@ -332,7 +1460,8 @@ def analyze_cv():
         "session_id": "string",
         "cv_text": "string",
         "filename": "string",
-        "file_size": number
+        "file_size": number,
+        "async": boolean (optional) - queue the analysis and return a job ID
     }
     """
     try:
@@ -359,102 +1488,297 @@ def analyze_cv():
         print("🔚 END OF CV CONTENT")
         print("=" * 80)
 
-        # Create analysis ID
-        analysis_id = str(uuid.uuid4())
+        if data.get("async"):
+            try:
+                job = analysis_jobs.submit(
+                    lambda progress: create_analysis(
+                        session_id, cv_text, filename, file_size, progress
+                    ),
+                    ANALYSIS_STAGES,
+                    session_id=session_id,
+                    filename=filename,
+                )
+            except QueueFull as e:
+                return jsonify({"error": str(e)}), 503
+            print(f"📥 Queued analysis job {job['id']}")
+            return (
+                jsonify(
+                    {
+                        "job_id": job["id"],
+                        "status": job["status"],
+                        "status_url": f"/api/jobs/{job['id']}",
+                    }
+                ),
+                202,
+            )
 
-        # Use LLM to analyze CV content
-        print("🤖 Starting LLM analysis...")
+        with flan_t5_admission.admit(ANALYZE_DEADLINE_SECONDS):
+            analysis_result = create_analysis(session_id, cv_text, filename, file_size)
+        return jsonify(analysis_result)
 
-        # Extract information using LLM
-        keywords = extract_keywords_from_cv(cv_text)
-        identified_role = identify_role_from_cv(cv_text)
-        suggestions = generate_cv_suggestions(cv_text)
-        interview_questions = generate_interview_questions(cv_text, identified_role)
-        strengths, areas_to_improve = analyze_cv_strengths_weaknesses(cv_text)
-        ats_score = calculate_ats_score(cv_text, keywords)
+    except AdmissionError as e:
+        return admission_error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        print(f"✅ LLM analysis complete - Role: {identified_role}, ATS: {ats_score}")
 
-        analysis_result = {
-            "id": analysis_id,
-            "session_id": session_id,
-            "filename": filename,
-            "file_size": file_size,
-            "created_at": datetime.now().isoformat(),
-            # DEBUG: Include parsed text info for debugging
-            "debug_info": {
-                "text_length": len(cv_text),
-                "word_count": len(cv_text.split()),
-                "first_100_chars": (
-                    cv_text[:100] + "..." if len(cv_text) > 100 else cv_text
+@app.route("/api/analyze/upload", methods=["POST"])
+def analyze_upload():
+    """
+    Extract text from an uploaded CV file on the server and analyze it
+    Multipart form fields:
+        file - the CV (.pdf, .docx or .txt)
+        session_id - session the analysis is attached to
+        async (optional) - "true" to queue the analysis and return a job ID
+    Response: the analysis, plus "extraction": {"format", "pages", "chars",
+    "extraction_ms"} timing the text extraction on its own
+    """
+    session_id = request.form.get("session_id")
+    upload = request.files.get("file")
+    if not session_id or upload is None or not upload.filename:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    file_format = detect_format(upload.filename)
+    if file_format is None:
+        return jsonify({"error": "Unsupported file type (use PDF, DOCX or TXT)"}), 415
+
+    try:
+        with upload_file(upload.stream, suffix=f".{file_format}") as (path, file_size):
+            extracted = extract_text(path, file_format)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ExtractionError as e:
+        return jsonify({"error": str(e)}), 422
+
+    cv_text = extracted["text"]
+    extraction = {
+        "format": file_format,
+        "pages": extracted["pages"],
+        "chars": len(cv_text),
+        "extraction_ms": extracted["extraction_ms"],
+    }
+    print(
+        f"📄 Extracted {upload.filename}: {extraction['pages']} pages, "
+        f"{extraction['chars']} chars in {extraction['extraction_ms']}ms"
+    )
+
+    try:
+        if request.form.get("async", "").lower() == "true":
+            try:
+                job = analysis_jobs.submit(
+                    lambda progress: create_analysis(
+                        session_id, cv_text, upload.filename, file_size, progress
+                    ),
+                    ANALYSIS_STAGES,
+                    session_id=session_id,
+                    filename=upload.filename,
+                )
+            except QueueFull as e:
+                return jsonify({"error": str(e)}), 503
+            return (
+                jsonify(
+                    {
+                        "job_id": job["id"],
+                        "status": job["status"],
+                        "status_url": f"/api/jobs/{job['id']}",
+                        "extraction": extraction,
+                    }
                 ),
-                "parsing_successful": True,
-            },
-            # Analysis results generated by LLM
-            "ats_score": ats_score,
-            "identified_role": identified_role,
-            "keywords": {
-                "found": keywords,
-                "missing": [
-                    "Docker",
-                    "Kubernetes",
-                    "AWS",
-                    "GraphQL",
-                    "Unit Testing",
-                ],  # TODO: Could enhance to generate missing keywords with LLM
-                "role_match": min(85, ats_score + 5),
+                202,
+            )
+
+        with flan_t5_admission.admit(ANALYZE_DEADLINE_SECONDS):
+            analysis_result = create_analysis(
+                session_id, cv_text, upload.filename, file_size
+            )
+        return jsonify({**analysis_result, "extraction": extraction})
+
+    except AdmissionError as e:
+        return admission_error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/analyze/bulk", methods=["POST"])
+def analyze_bulk():
+    """
+    Analyze many CVs from an NDJSON upload, streaming NDJSON results
+    Request body: one {"filename": "string", "cv_text": "string"} per line,
+    either as the raw body or as a multipart "file" field
+    Query/form parameters:
+        session_id (required) - session the analyses are attached to
+        bulk_id (optional) - resume an earlier upload, skipping finished lines
+    Response: one line per record, in completion order
+        {"line": n, "status": "completed", "analysis": {...}}
+        {"line": n, "status": "skipped", "analysis_id": "string"}
+        {"line": n, "status": "failed", "error": "string"}
+    The bulk ID is returned in the X-Bulk-Id header.
+    """
+    session_id = request.args.get("session_id") or request.form.get("session_id")
+    bulk_id = (
+        request.args.get("bulk_id") or request.form.get("bulk_id") or str(uuid.uuid4())
+    )
+    if not session_id:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    upload = request.files.get("file")
+    lines = upload.stream if upload else request.stream
+    print(f"📦 Bulk analysis {bulk_id} - Session: {session_id}")
+    expired = store.prune_bulk_progress(BULK_PROGRESS_TTL_SECONDS)
+    if expired:
+        print(f"🧹 Dropped the saved progress of {expired} expired bulk upload(s)")
+
+    def results():
+        counts = {}
+        for result in run_bulk_analysis(
+            lines,
+            lambda records: create_analyses(session_id, records),
+            bulk_executor,
+            store,
+            bulk_id,
+            batch_size=BULK_BATCH_SIZE,
+            max_pending=2 * BULK_WORKERS,
+        ):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            yield json.dumps(result) + "\n"
+        print(f"✅ Bulk analysis {bulk_id} finished: {counts}")
+
+    return Response(
+        stream_with_context(results()),
+        mimetype="application/x-ndjson",
+        headers={"X-Bulk-Id": bulk_id, "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/analyze/bulk/<bulk_id>", methods=["GET"])
+def get_bulk_progress(bulk_id):
+    """
+    Lines of a bulk upload that have been analyzed so far
+    Optional query parameters:
+        start (first line, default 1), limit (lines, default 1000, max 1000)
+    "completed" counts every analyzed line; "analysis_ids" covers the range.
+    """
+    try:
+        start = int(request.args.get("start", 1))
+        limit = min(int(request.args.get("limit", 1000)), 1000)
+    except ValueError:
+        return jsonify({"error": "start and limit must be integers"}), 400
+    if limit < 0:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+
+    progress = store.get_bulk_progress(bulk_id, start, start + limit)
+    return jsonify(
+        {
+            "bulk_id": bulk_id,
+            "completed": store.count_bulk_progress(bulk_id),
+            "analysis_ids": {
+                str(line): entry["analysis_id"]
+                for line, entry in sorted(progress.items())
             },
-            "suggestions": suggestions,
-            "interview_questions": interview_questions,
-            "strengths": strengths,
-            "areas_to_improve": areas_to_improve,
         }
+    )
 
-        # Store analysis
-        analyses[analysis_id] = analysis_result
 
-        # Add to session
-        if session_id in sessions:
-            sessions[session_id]["analyses"].append(analysis_id)
+@app.route("/api/analyze/bulk/<bulk_id>", methods=["DELETE"])
+def delete_bulk_progress(bulk_id):
+    """Forget a bulk upload's saved progress; its analyses are kept"""
+    if not store.delete_bulk_progress(bulk_id):
+        return jsonify({"error": "Bulk upload not found"}), 404
+    return jsonify({"deleted": bulk_id})
 
-        return jsonify(analysis_result)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Get the status, per-stage progress and (when completed) result of a job"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job["analysis_result"] = job.pop("result")
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """Cancel a queued or running analysis job"""
+    job = analysis_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job["analysis_result"] = job.pop("result")
+    return jsonify(job)
+
+
+@app.route("/api/jobs", methods=["GET"])
+def get_job_stats():
+    """Analysis worker pool and queue statistics"""
+    return jsonify(analysis_jobs.stats())
 
 
 @app.route("/api/analysis/<analysis_id>", methods=["GET"])
 def get_analysis(analysis_id):
     """Get specific analysis by ID"""
-    if analysis_id not in analyses:
+    analysis = store.get_analysis(analysis_id)
+    if analysis is None:
+        return jsonify({"error": "Analysis not found"}), 404
+
+    return jsonify(analysis)
+
+
+@app.route("/api/analysis/<analysis_id>", methods=["DELETE"])
+def delete_analysis(analysis_id):
+    """Delete an analysis together with its passage index and chat KV cache"""
+    if not store.delete_analysis(analysis_id):
         return jsonify({"error": "Analysis not found"}), 404
 
-    return jsonify(analyses[analysis_id])
+    prefix_cache.invalidate(analysis_id)
+    return jsonify({"deleted": analysis_id})
 
 
 @app.route("/api/session/<session_id>/analyses", methods=["GET"])
 def get_session_analyses(session_id):
-    """Get all analyses for a session"""
-    if session_id not in sessions:
+    """
+    Get analyses for a session, one page at a time
+    Optional query parameters:
+        limit (default 50, max 200), offset (default 0),
+        sort (created_at | ats_score | filename | identified_role),
+        order (asc | desc, default asc)
+    The total number of analyses is returned in the X-Total-Count header.
+    """
+    if not store.session_exists(session_id):
         return jsonify({"error": "Session not found"}), 404
 
-    session = sessions[session_id]
-    session_analyses = []
-
-    for analysis_id in session["analyses"]:
-        if analysis_id in analyses:
-            analysis = analyses[analysis_id]
-            session_analyses.append(
-                {
-                    "id": analysis["id"],
-                    "filename": analysis["filename"],
-                    "ats_score": analysis["ats_score"],
-                    "identified_role": analysis["identified_role"],
-                    "created_at": analysis["created_at"],
-                }
-            )
-
-    return jsonify(session_analyses)
+    try:
+        limit = min(int(request.args.get("limit", 50)), 200)
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    sort = request.args.get("sort", "created_at")
+    order = request.args.get("order", "asc")
+    if sort not in SORTABLE_FIELDS or order not in ("asc", "desc") or limit < 0:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+
+    session_analyses, total = store.list_session_analyses(
+        session_id, limit=limit, offset=max(offset, 0), sort=sort, order=order
+    )
+    response = jsonify(session_analyses)
+    response.headers["X-Total-Count"] = str(total)
+    return response
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Analysis cache hit/miss counters and tier sizes"""
+    return jsonify({"prompt_version": PROMPT_VERSION, **analysis_cache.stats()})
+
+
+@app.route("/api/cache", methods=["DELETE"])
+def clear_cache():
+    """
+    Invalidate cached analyses
+    Optional query parameter: keep_version - only drop entries from other
+    prompt versions (defaults to clearing everything)
+    """
+    removed = analysis_cache.invalidate(keep_version=request.args.get("keep_version"))
+    return jsonify({"removed": removed})
 
 
 @app.route("/api/chat", methods=["POST"])
@@ -480,28 +1804,14 @@ def chat():
 
         # Generate response using LLM with optional CV analysis context
         analysis_context = None
-        if analysis_id and analysis_id in analyses:
-            analysis_context = analyses[analysis_id]
+        if analysis_id:
+            analysis_context = store.get_analysis(analysis_id)
+        if analysis_context:
             print(f"📋 Using analysis context: {analysis_context['filename']}")
 
         # Generate LLM response
-        llm_response = generate_chat_response(message, analysis_context)
-
-        # Determine if the response should trigger actions (like showing analysis panel)
-        has_actions = False
-        if analysis_context and any(
-            keyword in message.lower()
-            for keyword in [
-                "analyze",
-                "score",
-                "keywords",
-                "suggestions",
-                "interview",
-                "improve",
-                "feedback",
-            ]
-        ):
-            has_actions = True
+        llm_response = generate_chat_response(message, analysis_context, session_id)
+        has_actions = chat_has_actions(message, analysis_context)
 
         response = {
             "message": llm_response,
@@ -513,9 +1823,122 @@ def chat():
 
         return jsonify(response)
 
+    except AdmissionError as e:
+        return admission_error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Stream a chat response as Server-Sent Events
+    Expected payload: same as /api/chat
+    Events:
+        data: {"token": "string"}              - generated text, in order
+        event: done
+        data: {"message": "string", "timestamp": "string",
+               "has_actions": boolean, "ttft_ms": number}
+    Requests shed by admission control get a JSON 503 with Retry-After
+    instead of a stream.
+    """
+    data = request.get_json()
+    session_id = data.get("session_id")
+    message = data.get("message")
+    analysis_id = data.get("analysis_id")
+
+    if not all([session_id, message]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    print(f"💬 Streaming chat - Session: {session_id}, Message: {message[:50]}...")
+
+    analysis_context = None
+    if analysis_id:
+        analysis_context = store.get_analysis(analysis_id)
+    if analysis_context:
+        print(f"📋 Using analysis context: {analysis_context['filename']}")
+
+    start = time.perf_counter()
+    chunks = stream_chat_response(message, analysis_context, session_id)
+    try:
+        # Runs until the request is admitted, so shed requests get a plain 503
+        next(chunks)
+    except AdmissionError as e:
+        return admission_error_response(e)
+
+    def events():
+        ttft_ms = None
+        try:
+            for kind, text in chunks:
+                if kind == "token" and ttft_ms is None:
+                    # Only real tokens count; an error reply has no first token
+                    ttft = time.perf_counter() - start
+                    ttft_ms = round(ttft * 1000, 1)
+                    chat_ttft_ms.append(ttft_ms)
+                    CHAT_TTFT_SECONDS.observe(ttft)
+                if kind == "token":
+                    yield f"data: {json.dumps({'token': text})}\n\n"
+                else:
+                    done = {
+                        "message": text,
+                        "timestamp": datetime.now().isoformat(),
+                        "has_actions": chat_has_actions(message, analysis_context),
+                        "ttft_ms": ttft_ms,
+                    }
+                    print(
+                        f"✅ Chat stream complete: {len(text)} chars, TTFT {ttft_ms}ms"
+                    )
+                    yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        finally:
+            # Stops generation and frees the model slot if the client
+            # disconnects mid-stream
+            chunks.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/chat/stats", methods=["GET"])
+def get_chat_stats():
+    """Time-to-first-token percentiles of recent streamed chat responses"""
+    caches = {
+        "prefix_cache": prefix_cache.stats(),
+        "response_cache": chat_response_cache.stats() if chat_response_cache else None,
+        "memory": chat_memory.stats(),
+    }
+    samples = sorted(chat_ttft_ms)
+    if not samples:
+        return jsonify({"count": 0, **caches})
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    return jsonify(
+        {
+            "count": len(samples),
+            "ttft_ms_p50": percentile(0.50),
+            "ttft_ms_p95": percentile(0.95),
+            "ttft_ms_max": samples[-1],
+            **caches,
+        }
+    )
+
+
+@app.route("/api/session/<session_id>/chat", methods=["DELETE"])
+def clear_chat_history(session_id):
+    """Forget a session's chat history, so the next message starts afresh"""
+    return jsonify({"removed": chat_memory.clear(session_id)})
+
+
+@app.route("/api/chat/cache", methods=["DELETE"])
+def clear_chat_cache():
+    """Drop all cached responses to context-free chat questions"""
+    removed = chat_response_cache.clear() if chat_response_cache else 0
+    return jsonify({"removed": removed})
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark: assisted (speculative) decoding for LLaMA 2 chat
+
+Generates a reply to each chat prompt twice: once with normal decoding and
+once with the draft model proposing tokens for LLaMA 2 to verify. Reports
+generated tokens/sec for both, the speedup and the draft acceptance rate.
+
+Acceptance is derived from forward-pass counts. Every assisted step runs
+LLaMA 2 once and yields one token of its own plus the draft tokens it
+accepted. The draft model runs once per proposed token.
+
+Usage: python benchmarks/assisted_decoding.py [--draft MODEL] [--max-tokens 128]
+                                              [--greedy]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+import llm
+from samples import CHAT_PROMPTS
+
+
+class ForwardCounter:
+    """Counts a model's forward passes while installed"""
+
+    def __init__(self, model):
+        self.calls = 0
+        self._handle = model.register_forward_hook(self._hook)
+
+    def _hook(self, module, inputs, output):
+        self.calls += 1
+
+    def remove(self):
+        self._handle.remove()
+
+
+def generate(model, tokenizer, prompt, max_tokens, greedy, seed, **kwargs):
+    """Generate one reply; returns ``(new_tokens, seconds)``"""
+    inputs = llm._llama2_chat_inputs(tokenizer, model, prompt)
+    if greedy:
+        settings = {
+            "max_new_tokens": max_tokens,
+            "do_sample": False,
+            "pad_token_id": tokenizer.eos_token_id,
+        }
+    else:
+        settings = llm._llama2_sampling_kwargs(tokenizer, max_tokens)
+    torch.manual_seed(seed)
+    start = time.perf_counter()
+    with torch.no_grad():
+        output_ids = model.generate(**inputs, **settings, **kwargs)
+    elapsed = time.perf_counter() - start
+    return output_ids.shape[-1] - inputs["input_ids"].shape[-1], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--draft",
+        default=llm.LLAMA2_DRAFT_MODEL,
+        help="draft model (default: LLAMA2_DRAFT_MODEL)",
+    )
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument(
+        "--greedy", action="store_true", help="greedy decoding instead of sampling"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("🚀 Assisted decoding benchmark")
+    print("=" * 60)
+    if not args.draft:
+        print("❌ No draft model: set LLAMA2_DRAFT_MODEL or pass --draft")
+        return
+
+    loaded = llm.model_registry.get("llama2")
+    if loaded is None:
+        print("❌ LLaMA 2 is not available - nothing to benchmark")
+        return
+    tokenizer, model = loaded
+    try:
+        draft = llm.load_llama2_draft(args.draft)
+    except Exception as e:
+        print(f"❌ Could not load draft model {args.draft}: {e}")
+        return
+
+    # Warm up so the first measured prompt does not pay one-time costs
+    generate(model, tokenizer, CHAT_PROMPTS[0], 8, args.greedy, args.seed)
+    generate(
+        model,
+        tokenizer,
+        CHAT_PROMPTS[0],
+        8,
+        args.greedy,
+        args.seed,
+        assistant_model=draft,
+    )
+
+    mode = "greedy" if args.greedy else "sampling"
+    draft_tokens = draft.generation_config.num_assistant_tokens
+    print(f"Draft: {args.draft} ({draft_tokens} tokens per step, {mode})")
+    print(
+        f"\n{'prompt':<40} {'base tok/s':>10} {'assist tok/s':>12} "
+        f"{'speedup':>8} {'accept':>7}"
+    )
+
+    totals = dict.fromkeys(
+        ("base_tokens", "base_s", "tokens", "s", "accepted", "proposed"), 0
+    )
+    for prompt in CHAT_PROMPTS:
+        base_tokens, base_s = generate(
+            model, tokenizer, prompt, args.max_tokens, args.greedy, args.seed
+        )
+
+        target_calls = ForwardCounter(model)
+        draft_calls = ForwardCounter(draft)
+        try:
+            tokens, seconds = generate(
+                model,
+                tokenizer,
+                prompt,
+                args.max_tokens,
+                args.greedy,
+                args.seed,
+                assistant_model=draft,
+            )
+        finally:
+            target_calls.remove()
+            draft_calls.remove()
+        accepted = max(tokens - target_calls.calls, 0)
+        acceptance = accepted / draft_calls.calls if draft_calls.calls else 0.0
+
+        base_rate = base_tokens / base_s
+        rate = tokens / seconds
+        label = prompt if len(prompt) <= 40 else prompt[:38] + ".."
+        print(
+            f"{label:<40} "
+            f"{base_rate:>10.2f} {rate:>12.2f} {rate / base_rate:>7.2f}x "
+            f"{acceptance:>6.0%}"
+        )
+        totals["base_tokens"] += base_tokens
+        totals["base_s"] += base_s
+        totals["tokens"] += tokens
+        totals["s"] += seconds
+        totals["accepted"] += accepted
+        totals["proposed"] += draft_calls.calls
+
+    base_rate = totals["base_tokens"] / totals["base_s"]
+    rate = totals["tokens"] / totals["s"]
+    acceptance = totals["accepted"] / totals["proposed"] if totals["proposed"] else 0.0
+    print(
+        f"\n{'overall':<40} {base_rate:>10.2f} {rate:>12.2f} "
+        f"{rate / base_rate:>7.2f}x {acceptance:>6.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
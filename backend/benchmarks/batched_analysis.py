@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sequential vs batched Flan-T5 analysis passes for /api/analyze
+
+Runs the five analysis helpers one after another (the old code path) and
+then run_cv_analysis, which sends the role-independent prompts to Flan-T5
+as one padded batch, and reports the wall-clock difference along with the
+number of Flan-T5 generate calls each path makes.
+
+Usage: python benchmarks/batched_analysis.py [--runs N] [--cv path/to/cv.txt]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from app import (
+    analyze_cv_strengths_weaknesses,
+    calculate_ats_score,
+    extract_keywords_from_cv,
+    generate_cv_suggestions,
+    generate_interview_questions,
+    identify_role_from_cv,
+    run_cv_analysis,
+)
+from samples import SAMPLE_CV
+
+
+def run_sequential(cv_text):
+    """The pre-batching code path: one generate call per stage"""
+    keywords = extract_keywords_from_cv(cv_text)
+    role = identify_role_from_cv(cv_text)
+    generate_cv_suggestions(cv_text)
+    generate_interview_questions(cv_text, role)
+    analyze_cv_strengths_weaknesses(cv_text)
+    calculate_ats_score(cv_text, keywords)
+
+
+def count_generate_calls(fn, cv_text):
+    """Run ``fn`` once and return how many Flan-T5 generate calls it made"""
+    names = ["query_flan_t5", "query_flan_t5_ids", "query_flan_t5_structured"]
+    originals = {name: getattr(app, name) for name in names}
+    calls = 0
+
+    def counted(query):
+        def wrapper(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return query(*args, **kwargs)
+
+        return wrapper
+
+    for name, query in originals.items():
+        setattr(app, name, counted(query))
+    try:
+        fn(cv_text)
+    finally:
+        for name, query in originals.items():
+            setattr(app, name, query)
+    return calls
+
+
+def time_runs(fn, cv_text, runs):
+    """Return per-run wall-clock timings in seconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(cv_text)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per mode")
+    parser.add_argument("--cv", help="path to a plain-text CV (default: built-in)")
+    args = parser.parse_args()
+
+    cv_text = SAMPLE_CV
+    if args.cv:
+        with open(args.cv, encoding="utf-8") as f:
+            cv_text = f.read()
+
+    print("🚀 Benchmarking /api/analyze LLM passes")
+    print("=" * 50)
+
+    # Warm up both paths so lazy initialisation is not timed
+    seq_calls = count_generate_calls(run_sequential, cv_text)
+    batch_calls = count_generate_calls(run_cv_analysis, cv_text)
+
+    sequential = time_runs(run_sequential, cv_text, args.runs)
+    batched = time_runs(run_cv_analysis, cv_text, args.runs)
+
+    seq_median = statistics.median(sequential)
+    batch_median = statistics.median(batched)
+
+    print(f"\n📊 Results over {args.runs} runs (median wall-clock):")
+    seq_label = f"Sequential ({seq_calls} generate calls):"
+    batch_label = f"Batched ({batch_calls} generate calls):"
+    width = max(len(seq_label), len(batch_label))
+    print(f"{seq_label:<{width}} {seq_median:.2f}s")
+    print(f"{batch_label:<{width}} {batch_median:.2f}s")
+    print(f"Speedup: {seq_median / batch_median:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Load test: LLaMA 2 chat throughput vs dynamic batch size
+
+Fires concurrent chat requests at a ChatBatcher for each maximum batch size
+and reports requests/sec, generated tokens/sec and per-request latency, so
+CHAT_MAX_BATCH_SIZE and CHAT_BATCH_WAIT_MS can be tuned for the hardware.
+
+Usage: python benchmarks/chat_batching.py [--sizes 1,2,4,8] [--requests 16]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm import ChatBatcher, model_registry
+from samples import CHAT_PROMPTS
+
+
+def run_load(batcher, num_requests, max_tokens):
+    """Send num_requests concurrent prompts; return (elapsed, latencies, responses)"""
+    latencies = [None] * num_requests
+    responses = [None] * num_requests
+
+    def worker(i):
+        start = time.perf_counter()
+        responses[i] = batcher.submit(CHAT_PROMPTS[i % len(CHAT_PROMPTS)], max_tokens)
+        latencies[i] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_requests)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,2,4,8", help="max batch sizes to test")
+    parser.add_argument("--requests", type=int, default=16, help="concurrent requests")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    print("🚀 Chat batching load test")
+    print("=" * 50)
+
+    loaded = model_registry.get("llama2")
+    if loaded is None:
+        print("❌ LLaMA 2 is not available - nothing to benchmark")
+        return
+    tokenizer, _ = loaded
+
+    # Warm up so the first measured batch does not pay one-time costs
+    run_load(ChatBatcher(max_batch_size=1), 1, args.max_tokens)
+
+    print(f"\n{'batch':>5} {'req/s':>8} {'tok/s':>8} {'p50 lat':>9} {'max lat':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        batcher = ChatBatcher(max_batch_size=size, max_wait_ms=args.wait_ms)
+        elapsed, latencies, responses = run_load(
+            batcher, args.requests, args.max_tokens
+        )
+        tokens = sum(
+            len(tokenizer(r, add_special_tokens=False)["input_ids"]) for r in responses
+        )
+        print(
+            f"{size:>5} {args.requests / elapsed:>8.2f} {tokens / elapsed:>8.1f} "
+            f"{statistics.median(latencies):>8.2f}s {max(latencies):>8.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
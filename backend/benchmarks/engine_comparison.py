@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency, peak RSS and output agreement per inference engine
+
+Each engine (torch, onnx) loads the model in a fresh process and runs the
+same greedy workload as benchmarks/precision.py, in fp32. Outputs are
+compared with the torch engine: similarity is the mean difflib ratio (1.0 =
+identical text) and exact is the share of identical outputs. Use it to pick
+FLAN_T5_ENGINE / LLAMA2_ENGINE for a host. Run ``python export_onnx.py``
+first, otherwise the onnx load time includes the one-time export.
+
+Usage: python benchmarks/engine_comparison.py [--model flan_t5|llama2]
+                                              [--engines torch,onnx]
+                                              [--output out.json]
+"""
+
+import argparse
+import difflib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+
+# Add the backend directory to the Python path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from precision import build_workload, run_mode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", choices=["flan_t5", "llama2"], default="flan_t5")
+    parser.add_argument("--engines", default="torch,onnx")
+    parser.add_argument("--output", help="write the full results as JSON")
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(",")]
+    if "torch" in engines:
+        engines.remove("torch")
+    engines.insert(0, "torch")  # reference for the agreement scores
+
+    workload = build_workload(args.model)
+    print(f"🚀 Engine benchmark: {args.model}, {len(workload)} prompts")
+    print("=" * 50)
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for engine in engines:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_mode, (args.model, "fp32", workload, engine))
+            except Exception as e:
+                print(f"⚠️ {engine}: {e}")
+                continue
+        results.append(result)
+
+    if not results or results[0]["engine"] != "torch":
+        print("❌ The torch reference run failed")
+        return
+    reference = results[0]["outputs"]
+    for result in results:
+        pairs = list(zip(reference, result["outputs"]))
+        result["similarity"] = round(
+            statistics.mean(
+                difflib.SequenceMatcher(None, ref, out).ratio() for ref, out in pairs
+            ),
+            3,
+        )
+        result["exact"] = round(sum(ref == out for ref, out in pairs) / len(pairs), 3)
+
+    print(
+        f"\n{'engine':<7} {'load':>7} {'p50 lat':>9} {'tok/s':>8} {'peak RSS':>10} "
+        f"{'similarity':>11} {'exact':>6}"
+    )
+    for r in results:
+        print(
+            f"{r['engine']:<7} {r['load_seconds']:>6.1f}s {r['latency_p50']:>8.3f}s "
+            f"{r['tokens_per_second']:>8.1f} {r['peak_rss_mb']:>8.0f}MB "
+            f"{r['similarity']:>11.3f} {r['exact']:>6.2f}"
+        )
+    fastest = max(results, key=lambda r: r["tokens_per_second"])
+    print(f"\n🏁 Fastest on this host: {fastest['engine']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
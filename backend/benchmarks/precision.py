@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency, peak RSS and output similarity per precision mode
+
+Each precision mode (fp32, bf16, int8, ...) is loaded in a fresh process so
+peak RSS is measured per mode. Every mode runs the same fixed CV analysis
+prompts (Flan-T5) or chat questions (LLaMA 2) with greedy decoding, so the
+outputs can be compared with the fp32 reference. Similarity is the mean
+difflib ratio against fp32 (1.0 = identical text).
+
+Usage: python benchmarks/precision.py [--model flan_t5|llama2]
+                                      [--modes fp32,bf16,int8] [--output out.json]
+"""
+
+import argparse
+import difflib
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+# Add the backend directory to the Python path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from samples import CHAT_PROMPTS, SAMPLE_CVS
+
+
+def build_workload(model_name):
+    """(prompt, max_new_tokens) pairs for the chosen model"""
+    if model_name == "flan_t5":
+        # The real analysis templates, so quality is judged on production prompts
+        from prompts import (
+            KEYWORDS_PROMPT,
+            ROLE_PROMPT,
+            STRENGTHS_PROMPT,
+            SUGGESTIONS_PROMPT,
+        )
+
+        tasks = [
+            (KEYWORDS_PROMPT, 100),
+            (ROLE_PROMPT, 50),
+            (SUGGESTIONS_PROMPT, 200),
+            (STRENGTHS_PROMPT, 200),
+        ]
+        return [
+            (template.format(cv_text=cv_text[:1500]), max_tokens)
+            for cv_text in SAMPLE_CVS
+            for template, max_tokens in tasks
+        ]
+    return [(prompt, 100) for prompt in CHAT_PROMPTS]
+
+
+def run_mode(model_name, precision, workload, engine=None):
+    """Load one model in one precision and engine, run the workload (child process)"""
+    sys.path.append(BACKEND_DIR)
+    import torch
+    import llm
+
+    if engine is None:
+        engine = llm.FLAN_T5_ENGINE if model_name == "flan_t5" else llm.LLAMA2_ENGINE
+    start = time.perf_counter()
+    if model_name == "flan_t5":
+        tokenizer, model = llm.load_flan_t5(precision, engine)
+    else:
+        tokenizer, model = llm.load_llama2(precision, engine)
+    load_seconds = time.perf_counter() - start
+
+    outputs, latencies, new_tokens = [], [], 0
+    for prompt, max_tokens in workload:
+        start = time.perf_counter()
+        with torch.no_grad():
+            if model_name == "flan_t5":
+                inputs = tokenizer(
+                    prompt, return_tensors="pt", truncation=True, max_length=512
+                )
+                ids = model.generate(**inputs, max_new_tokens=max_tokens, do_sample=False)
+                generated = ids[0][1:]  # drop the decoder start token
+            else:
+                inputs = llm._llama2_chat_inputs(tokenizer, model, prompt)
+                ids = model.generate(
+                    **inputs,
+                    max_new_tokens=max_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id,
+                )
+                generated = ids[0][inputs["input_ids"].shape[-1] :]
+        latencies.append(time.perf_counter() - start)
+        new_tokens += len(generated)
+        outputs.append(tokenizer.decode(generated, skip_special_tokens=True).strip())
+
+    return {
+        "precision": precision,
+        "engine": engine,
+        "load_seconds": round(load_seconds, 2),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_total": round(sum(latencies), 2),
+        "tokens_per_second": round(new_tokens / sum(latencies), 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", choices=["flan_t5", "llama2"], default="flan_t5")
+    parser.add_argument("--modes", default="fp32,bf16,int8")
+    parser.add_argument("--output", help="write the full results as JSON")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",")]
+    if "fp32" in modes:
+        modes.remove("fp32")
+    modes.insert(0, "fp32")  # reference for the similarity scores
+
+    workload = build_workload(args.model)
+    print(f"🚀 Precision benchmark: {args.model}, {len(workload)} prompts")
+    print("=" * 50)
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for precision in modes:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_mode, (args.model, precision, workload))
+            except Exception as e:
+                print(f"⚠️ {precision}: {e}")
+                continue
+        results.append(result)
+
+    if not results or results[0]["precision"] != "fp32":
+        print("❌ The fp32 reference run failed")
+        return
+    reference = results[0]["outputs"]
+    for result in results:
+        result["similarity"] = round(
+            statistics.mean(
+                difflib.SequenceMatcher(None, ref, out).ratio()
+                for ref, out in zip(reference, result["outputs"])
+            ),
+            3,
+        )
+
+    print(
+        f"\n{'mode':<6} {'p50 lat':>9} {'tok/s':>8} {'peak RSS':>10} {'similarity':>11}"
+    )
+    for r in results:
+        print(
+            f"{r['precision']:<6} {r['latency_p50']:>8.3f}s {r['tokens_per_second']:>8.1f} "
+            f"{r['peak_rss_mb']:>8.0f}MB {r['similarity']:>11.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
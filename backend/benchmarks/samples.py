@@ -0,0 +1,79 @@
+"""
+Fixed CVs and chat questions shared by the benchmark scripts
+"""
+
+SAMPLE_CV = """
+Jane Smith
+Senior Software Engineer
+
+SUMMARY
+Backend engineer with 6 years of experience building distributed systems and
+data pipelines. Led a team of 4 engineers and managed releases for a platform
+serving 2M users.
+
+SKILLS
+Python, Go, PostgreSQL, Redis, Kafka, Docker, AWS, Terraform, Flask, FastAPI
+
+EXPERIENCE
+Senior Software Engineer - Acme Corp (2021 - present)
+- Developed an event-driven billing service processing 40k events per second
+- Achieved a 35% reduction in p99 latency by redesigning the caching layer
+- Managed the migration of 12 services from EC2 to Kubernetes
+
+Software Engineer - Widgets Inc (2018 - 2021)
+- Built REST APIs in Flask used by 30 internal teams
+- Led the adoption of automated integration testing
+
+EDUCATION
+B.Sc. Computer Science, University of Somewhere (2018)
+"""
+
+SAMPLE_CV_DATA_SCIENTIST = """
+Priya Raman
+Data Scientist
+
+PROFILE
+Data scientist with 4 years of experience in forecasting and NLP. Developed
+demand models that cut inventory costs by 12%.
+
+SKILLS
+Python, pandas, scikit-learn, PyTorch, SQL, Spark, Airflow, Tableau
+
+EXPERIENCE
+Data Scientist - RetailCo (2020 - present)
+- Developed gradient-boosted demand forecasts for 8,000 products
+- Led an A/B testing programme across 3 product teams
+- Built an NLP pipeline that classifies 50k support tickets per day
+
+EDUCATION
+M.Sc. Statistics (2020)
+"""
+
+SAMPLE_CV_PRODUCT_MANAGER = """
+Tom Becker
+Product Manager
+
+Product manager with 5 years of experience shipping B2B SaaS features.
+Managed a roadmap for a team of 9 engineers and achieved 20% growth in
+monthly active users.
+
+Experience
+- Product Manager, CloudDesk (2019 - present): launched self-serve onboarding,
+  ran customer discovery interviews, owned pricing experiments
+- Business Analyst, FinServe (2017 - 2019): wrote requirements and SQL reports
+
+Skills: Jira, SQL, Figma, Amplitude, stakeholder management, agile
+"""
+
+SAMPLE_CVS = [SAMPLE_CV, SAMPLE_CV_DATA_SCIENTIST, SAMPLE_CV_PRODUCT_MANAGER]
+
+CHAT_PROMPTS = [
+    "How can I improve my CV to get better job opportunities?",
+    "What should a software engineer highlight in a CV?",
+    "How long should my CV be?",
+    "Should I include a professional summary section?",
+    "How do I describe a career gap on my CV?",
+    "What are common mistakes in data scientist CVs?",
+    "How do I make my CV ATS friendly?",
+    "Which skills should I list first on my CV?",
+]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: skill-taxonomy matcher throughput for bulk CV screening
+
+Scores the sample CVs repeatedly with SkillMatcher.match_many, in one
+process and across worker processes. It reports CVs per second next to
+the old substring ATS heuristic, which lowercased the CV once per check.
+
+Usage: python benchmarks/skill_matching.py [--cvs N] [--workers 1,4]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from samples import SAMPLE_CVS
+from taxonomy import skill_matcher
+
+KEYWORDS = ["Python", "Docker", "Kubernetes", "SQL", "React"]
+
+
+def legacy_ats_score(cv_text, keywords):
+    """The pre-taxonomy calculate_ats_score, kept for comparison"""
+    score = 70
+    if len(cv_text) > 500:
+        score += 5
+    if any(keyword.lower() in cv_text.lower() for keyword in keywords):
+        score += 10
+    if "experience" in cv_text.lower():
+        score += 5
+    if any(
+        word in cv_text.lower() for word in ["achieved", "developed", "managed", "led"]
+    ):
+        score += 10
+    return min(score, 95)
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cvs", type=int, default=20000, help="CVs per run")
+    parser.add_argument(
+        "--workers", default="1,4", help="comma-separated process counts"
+    )
+    args = parser.parse_args()
+
+    cv_texts = [SAMPLE_CVS[i % len(SAMPLE_CVS)] for i in range(args.cvs)]
+
+    print(f"🚀 Skill matching benchmark ({args.cvs} CVs)")
+    print("=" * 60)
+    legacy = rate(lambda: [legacy_ats_score(cv, KEYWORDS) for cv in cv_texts], args.cvs)
+    print(f"{'legacy ATS heuristic':<28} {legacy:>10.0f} CVs/s (ATS score only)")
+    for workers in (int(w) for w in args.workers.split(",")):
+        throughput = rate(
+            lambda: skill_matcher.match_many(cv_texts, workers=workers), args.cvs
+        )
+        print(f"{f'taxonomy matcher x{workers}':<28} {throughput:>10.0f} CVs/s")
+
+    sample = skill_matcher.match(SAMPLE_CVS[0])
+    print(f"\nSample: {sample['role']} ({sample['role_match']}% match)")
+    print(f"  found:   {', '.join(sample['found_skills'])}")
+    print(f"  missing: {', '.join(sample['missing_skills'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the analysis and chat pipelines
+
+Times every analysis stage (keywords, role, suggestions, questions,
+strengths, ATS), the chat response, and the full /api/analyze and /api/chat
+requests through Flask's test client. It reports p50/p95/p99 latency,
+generated tokens/sec and peak memory.
+
+Two backends:
+- real: the local Flan-T5 / LLaMA 2 models from llm.py
+- stub: a deterministic stand-in that returns canned, parseable replies
+  instantly, so Flask, parsing and storage overhead is measured on its own
+
+Results are written as JSON. Pass an earlier run with --baseline to flag
+stages whose p95 latency regressed by more than --tolerance.
+
+Usage: python benchmarks/suite.py --backend stub --runs 50 --output stub.json
+       python benchmarks/suite.py --backend real --baseline last_release.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import datetime
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend
+from llm import PromptAssembler
+from samples import CHAT_PROMPTS, SAMPLE_CVS
+
+STUB_REPLIES = [
+    ("Keywords:", "Python, Flask, PostgreSQL, Docker, AWS, Redis, Kafka"),
+    ("Job Role:", "Software Engineer"),
+    (
+        "Suggestions:",
+        "Quantify the impact of each project. Add a short professional summary. "
+        "List certifications in their own section. "
+        "Keep formatting consistent across roles.",
+    ),
+    (
+        "Questions:",
+        "How did you design the billing service? "
+        "How do you approach performance regressions? "
+        "Describe a production incident you handled? "
+        "How do you mentor junior engineers? "
+        "Which trade-offs did you make when migrating to Kubernetes?",
+    ),
+    (
+        "STRENGTHS:",
+        "STRENGTHS: - Quantified achievements - Broad backend skills "
+        "- Leadership experience AREAS TO IMPROVE: - Add a summary "
+        "- Mention testing practices - Shorten older roles",
+    ),
+]
+STUB_STRUCTURED_REPLY = {
+    "keywords": ["Python", "Flask", "PostgreSQL", "Docker", "AWS"],
+    "identified_role": "Software Engineer",
+    "suggestions": [
+        "Quantify the impact of each project",
+        "Add a short professional summary",
+    ],
+    "strengths": ["Quantified achievements", "Broad backend skills"],
+    "areas_to_improve": ["Add a summary", "Mention testing practices"],
+    "interview_questions": [
+        "How did you design the billing service?",
+        "How do you approach performance regressions?",
+    ],
+}
+STUB_CHAT_REPLY = (
+    "Lead with measurable results, tailor your keywords to the job posting, "
+    "and keep the CV to two pages."
+)
+STUB_CHAT_SUMMARY = "The user asked how to improve their CV and got advice."
+
+
+class StubTokenizer:
+    """Word-level tokenizer so prompt assembly runs without the real model"""
+
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self.words = ["<pad>", "</s>"]
+        self.vocab = {}
+
+    def __call__(self, text, add_special_tokens=False):
+        ids = []
+        for word in text.split():
+            if word not in self.vocab:
+                self.vocab[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.vocab[word])
+        return {"input_ids": ids}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(self.words[i] for i in ids if i > self.eos_token_id)
+
+
+class StubModel:
+    """Deterministic stand-in for the LLMs: canned replies, no inference"""
+
+    def __init__(self):
+        self.tokenizer = StubTokenizer()
+
+    def reply(self, prompt):
+        for marker, reply in STUB_REPLIES:
+            if marker in prompt:
+                return reply
+        return STUB_CHAT_REPLY
+
+    def query(self, prompt, max_tokens=512, **kwargs):
+        return self.reply(prompt)
+
+    def query_ids(self, input_ids, max_tokens=512, **kwargs):
+        return [self.reply(self.tokenizer.decode(ids)) for ids in input_ids]
+
+    def structured(self, input_ids, fields, decoding="greedy"):
+        return [json.loads(json.dumps(STUB_STRUCTURED_REPLY)) for _ in input_ids]
+
+    def embed(self, texts, dim=64):
+        """Hashed bag-of-words vectors, unit length like the real embeddings"""
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dim
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+    def chat(self, prompt, max_tokens=256, with_model=False, **kwargs):
+        response = self.reply(prompt)
+        return (response, "llama2") if with_model else response
+
+    def stream(self, prompt, max_tokens=256, with_model=False, **kwargs):
+        for word in self.reply(prompt).split(" "):
+            yield ("llama2", word + " ") if with_model else word + " "
+
+    def count(self, text):
+        return len(text.split())
+
+    def summarize(self, summary, turns):
+        return STUB_CHAT_SUMMARY
+
+
+class TokenCounter:
+    """Wraps the query functions used by app.py to count generated tokens"""
+
+    def __init__(self, count_tokens):
+        self.count_tokens = count_tokens
+        self.tokens = 0
+
+    def wrap(self, fn):
+        def counted(*args, **kwargs):
+            response = fn(*args, **kwargs)
+            responses = response if isinstance(response, list) else [response]
+            if isinstance(response, tuple):
+                responses = [response[0]]  # query_llama2_chat(with_model=True)
+            for r in responses:
+                if isinstance(r, dict):
+                    # A structured analysis: count the text of every field
+                    r = " ".join(
+                        " ".join(v) if isinstance(v, list) else v for v in r.values()
+                    )
+                self.tokens += self.count_tokens(r)
+            return response
+
+        return counted
+
+    def install(self):
+        for name in (
+            "query_flan_t5",
+            "query_flan_t5_ids",
+            "query_flan_t5_structured",
+            "query_llama2_chat",
+        ):
+            setattr(backend, name, self.wrap(getattr(backend, name)))
+
+
+def install_backend(name):
+    """Point app.py at the chosen models; returns a token counting function"""
+    if name == "stub":
+        stub = StubModel()
+        backend.query_flan_t5 = stub.query
+        backend.query_flan_t5_ids = stub.query_ids
+        backend.query_flan_t5_structured = stub.structured
+        backend.query_llama2_chat = stub.chat
+        backend.stream_llama2_chat = stub.stream
+        backend.embed_texts = stub.embed
+        backend.ANALYSIS_PROMPTS = PromptAssembler(
+            backend.ANALYSIS_PROMPTS.templates, tokenizer=stub.tokenizer
+        )
+        backend.CHAT_SUMMARY_PROMPTS = PromptAssembler(
+            backend.CHAT_SUMMARY_PROMPTS.templates, tokenizer=stub.tokenizer
+        )
+        # Chat memory holds its own references, so it would otherwise count
+        # with LLaMA 2's tokenizer and fold turns with Flan-T5 during timings
+        backend.count_chat_tokens = backend.chat_memory.count_tokens = stub.count
+        backend.summarize_chat_turns = backend.chat_memory.summarize = stub.summarize
+        return stub.count
+
+    import llm
+
+    tokenizer, _ = llm.model_registry.get("flan_t5")
+    llm.model_registry.get("llama2")  # load up front so it is not timed
+    llm.model_registry.get("embedder")
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def measure(fn, inputs, runs, counter):
+    """Time ``fn`` over ``runs`` calls cycling through ``inputs``"""
+    latencies = []
+    counter.tokens = 0
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        latencies.append(time.perf_counter() - start)
+    tokens = counter.tokens
+
+    # One extra traced call for Python-level peak memory, kept out of the timings
+    tracemalloc.start()
+    fn(inputs[0])
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "tokens_per_second": round(tokens / total, 2) if total else 0.0,
+        "py_peak_kb": round(py_peak / 1024, 1),
+    }
+
+
+def clear_chat_cache():
+    """Empty the chat response cache, so chat stages measure generation"""
+    if backend.chat_response_cache is not None:
+        backend.chat_response_cache.clear()
+
+
+def build_stages(client, session_id):
+    """Benchmark name -> callable taking one CV text or chat prompt"""
+
+    def analyze_request(cv_text):
+        backend.analysis_cache.invalidate()  # measure the pipeline, not the cache
+        response = client.post(
+            "/api/analyze",
+            json={
+                "session_id": session_id,
+                "cv_text": cv_text,
+                "filename": "benchmark.txt",
+                "file_size": len(cv_text),
+            },
+        )
+        assert response.status_code == 200, response.get_json()
+
+    def chat(message):
+        clear_chat_cache()
+        return backend.generate_chat_response(message)
+
+    def chat_request(message):
+        clear_chat_cache()
+        response = client.post(
+            "/api/chat", json={"session_id": session_id, "message": message}
+        )
+        assert response.status_code == 200, response.get_json()
+
+    cv_stages = {
+        "keywords": backend.extract_keywords_from_cv,
+        "role": backend.identify_role_from_cv,
+        "suggestions": backend.generate_cv_suggestions,
+        "questions": lambda cv: backend.generate_interview_questions(
+            cv, "Software Engineer"
+        ),
+        "strengths": backend.analyze_cv_strengths_weaknesses,
+        "ats": lambda cv: backend.calculate_ats_score(cv, ["Python", "Docker"]),
+        "analyze_request": analyze_request,
+    }
+    chat_stages = {
+        "chat": chat,
+        "chat_request": chat_request,
+    }
+    return cv_stages, chat_stages
+
+
+def compare(results, baseline, tolerance):
+    """Names of stages whose p95 latency regressed beyond the tolerance"""
+    regressions = []
+    for stage, stats in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous and stats["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{stage}: p95 {previous['p95_ms']:.1f}ms -> {stats['p95_ms']:.1f}ms"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=["stub", "real"], default="stub")
+    parser.add_argument("--runs", type=int, default=20, help="timed calls per stage")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier JSON results to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed p95 slowdown (0.2 = 20%%)"
+    )
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmark suite ({args.backend} models, {args.runs} runs per stage)")
+    print("=" * 60)
+
+    counter = TokenCounter(install_backend(args.backend))
+    counter.install()
+
+    client = backend.app.test_client()
+    session_id = client.post("/api/session").get_json()["session_id"]
+    cv_stages, chat_stages = build_stages(client, session_id)
+
+    results = {
+        "backend": args.backend,
+        "runs": args.runs,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "stages": {},
+    }
+    for stages, inputs in ((cv_stages, SAMPLE_CVS), (chat_stages, CHAT_PROMPTS)):
+        for name, fn in stages.items():
+            # The pipeline logs every request; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn(inputs[0])  # warm-up
+                results["stages"][name] = measure(fn, inputs, args.runs, counter)
+    # ru_maxrss is in kilobytes on Linux
+    results["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+
+    print(
+        f"{'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'tok/s':>9} {'py peak':>9}"
+    )
+    for name, s in results["stages"].items():
+        print(
+            f"{name:<16} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f} "
+            f"{s['tokens_per_second']:>9.1f} {s['py_peak_kb']:>7.0f}KB"
+        )
+    print(f"\nPeak RSS: {results['peak_rss_mb']:.0f}MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
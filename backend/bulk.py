@@ -0,0 +1,123 @@
+"""
+Bulk CV analysis of NDJSON uploads with resumable progress
+
+Each input line is one ``{"filename": ..., "cv_text": ...}`` record. Lines
+are read lazily and grouped into model-sized batches. The batches run on a
+worker pool with a bounded number in flight, so memory use does not grow
+with the size of the upload. One result line is yielded per record as its
+batch finishes.
+
+Every analyzed line is recorded in the store under the upload's bulk ID.
+Re-sending the same upload with that bulk ID skips the lines that already
+finished, as long as their CV text is unchanged. Saved progress is read
+PROGRESS_WINDOW lines at a time, so resuming a large upload does not load
+all of it at once.
+"""
+
+import hashlib
+import json
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Lines of saved progress read from the store at a time
+PROGRESS_WINDOW = 1000
+
+
+def record_digest(cv_text):
+    """Short content hash that ties saved progress to a line's CV text"""
+    return hashlib.sha256(cv_text.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_ndjson_records(lines):
+    """Yield ``(line_number, record, error)`` for each non-blank line.
+
+    Line numbers start at 1 and count blank lines, so they stay stable when
+    the same file is uploaded again.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get("cv_text"), str):
+            yield line_number, None, "Missing cv_text"
+        elif not record["cv_text"].strip():
+            yield line_number, None, "Empty cv_text"
+        else:
+            yield line_number, record, None
+
+
+def run_bulk_analysis(
+    lines, analyze_batch, executor, store, bulk_id, batch_size=4, max_pending=2
+):
+    """Analyze NDJSON ``lines`` and yield one result dict per record.
+
+    ``analyze_batch(records)`` returns one stored analysis per record and
+    runs on ``executor``. At most ``max_pending`` batches are queued or
+    running at once; input is not read further until one finishes.
+    """
+    completed = {}
+    window_end = 0  # completed holds the saved progress of lines before this
+    pending = {}
+    batch = []
+
+    def finished(futures):
+        for future in futures:
+            batch_records = pending.pop(future)
+            try:
+                analyses = future.result()
+            except Exception as e:
+                print(f"❌ Bulk batch failed: {e}")
+                for line_number, _, _ in batch_records:
+                    yield {"line": line_number, "status": "failed", "error": str(e)}
+                continue
+            for (line_number, _, digest), analysis in zip(batch_records, analyses):
+                store.save_bulk_progress(bulk_id, line_number, digest, analysis["id"])
+                yield {"line": line_number, "status": "completed", "analysis": analysis}
+
+    def submit():
+        future = executor.submit(analyze_batch, [record for _, record, _ in batch])
+        pending[future] = list(batch)
+        batch.clear()
+
+    try:
+        for line_number, record, error in iter_ndjson_records(lines):
+            if error:
+                yield {"line": line_number, "status": "failed", "error": error}
+                continue
+            digest = record_digest(record["cv_text"])
+            if line_number >= window_end:
+                window_end = line_number + PROGRESS_WINDOW
+                completed = store.get_bulk_progress(bulk_id, line_number, window_end)
+            previous = completed.get(line_number)
+            if previous and previous["digest"] == digest:
+                yield {
+                    "line": line_number,
+                    "status": "skipped",
+                    "analysis_id": previous["analysis_id"],
+                }
+                continue
+
+            batch.append((line_number, record, digest))
+            if len(batch) >= batch_size:
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from finished(done)
+                submit()
+            done = [future for future in pending if future.done()]
+            yield from finished(done)
+
+        if batch:
+            submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+    finally:
+        # Client went away: drop batches that have not started yet
+        for future in pending:
+            future.cancel()
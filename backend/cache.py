@@ -0,0 +1,378 @@
+"""
+Caches for CV analysis results and context-free chat responses
+
+Analysis entries are keyed on a hash of the normalized CV text, the analysis
+model name and the prompt-template version, so re-uploading the same CV
+returns the stored analysis instead of running the LLM passes again.
+
+Two tiers:
+- an in-process LRU (always on)
+- an optional SQLite file shared across restarts, evicted by total size
+
+Chat responses to questions asked without a CV are kept in an in-process
+LRU with a TTL. A question matches a cached one when it was asked in the
+same conversation context (the session's rendered chat memory, empty for a
+first message) and their normalized text is equal, or their sentence
+embeddings are close enough.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import CHAT_CACHE_LOOKUPS
+
+
+def normalize_cv_text(cv_text):
+    """Normalize CV text so trivially different uploads share a cache key"""
+    text = unicodedata.normalize("NFC", cv_text)
+    return " ".join(text.split())
+
+
+def normalize_question(question):
+    """Normalize a chat question: case, whitespace and closing punctuation"""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    return " ".join(text.split()).rstrip("?!. ")
+
+
+def context_id(context):
+    """Signed 64-bit ID of a chat context; 0 for no context"""
+    if not context:
+        return 0
+    digest = hashlib.sha256(context.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little", signed=True) or 1
+
+
+def template_version(*templates):
+    """Short, stable version string derived from the prompt templates"""
+    digest = hashlib.sha256("\x1e".join(templates).encode("utf-8")).hexdigest()
+    return digest[:12]
+
+
+def make_cache_key(cv_text, model_name, prompt_version):
+    """Cache key for one analysis: normalized CV text + model + prompt version"""
+    payload = "\x1f".join([normalize_cv_text(cv_text), model_name, prompt_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier (memory LRU + optional SQLite) cache of analysis results"""
+
+    def __init__(self, max_entries=256, db_path=None, max_disk_bytes=100 * 1024**2):
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (prompt_version, json string)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt_version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_access "
+                "ON analysis_cache (last_access)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """Return a cached result (a fresh dict) or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT prompt_version, value FROM analysis_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE analysis_cache SET last_access = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, prompt_version):
+        """Store a JSON-serializable result in both tiers"""
+        data = json.dumps(value)
+        with self._lock:
+            self._remember(key, prompt_version, data)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache "
+                    "(key, prompt_version, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, prompt_version, data, len(data), time.time()),
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def invalidate(self, keep_version=None):
+        """Drop entries whose prompt version differs from ``keep_version``.
+
+        With no version given, the whole cache is cleared. Returns the number
+        of entries removed across both tiers.
+        """
+        removed = 0
+        with self._lock:
+            stale = [
+                key
+                for key, (version, _) in self._memory.items()
+                if keep_version is None or version != keep_version
+            ]
+            for key in stale:
+                del self._memory[key]
+            removed += len(stale)
+
+            if self._db is not None:
+                if keep_version is None:
+                    cursor = self._db.execute("DELETE FROM analysis_cache")
+                else:
+                    cursor = self._db.execute(
+                        "DELETE FROM analysis_cache WHERE prompt_version != ?",
+                        (keep_version,),
+                    )
+                removed += cursor.rowcount
+                self._db.commit()
+        return removed
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._db is not None,
+            }
+            if self._db is not None:
+                count, size = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+                ).fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = size
+                stats["max_disk_bytes"] = self.max_disk_bytes
+            return stats
+
+    def _remember(self, key, prompt_version, data):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (prompt_version, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete least recently used rows until the tier fits its size budget"""
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM analysis_cache"
+        ).fetchone()
+        if total <= self.max_disk_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM analysis_cache ORDER BY last_access ASC"
+        )
+        stale = []
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM analysis_cache WHERE key = ?", stale)
+
+
+def analysis_cache_from_env():
+    """Build the analysis cache from ANALYSIS_CACHE_* environment variables"""
+    return AnalysisCache(
+        max_entries=int(os.environ.get("ANALYSIS_CACHE_SIZE", "256")),
+        db_path=os.environ.get("ANALYSIS_CACHE_DB") or None,
+        max_disk_bytes=int(
+            os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(100 * 1024**2))
+        ),
+    )
+
+
+class ChatResponseCache:
+    """LRU cache of chat responses with a TTL, matched exactly or by meaning.
+
+    A question is first looked up by its normalized text. On a miss, and
+    when an ``embed`` function is given, its embedding is compared with the
+    embeddings of all cached questions in one matrix-vector product. The
+    closest question is a hit if its cosine similarity reaches
+    ``threshold``. The embeddings live in a preallocated matrix with one
+    row per entry, so a lookup never copies them.
+
+    Entries are scoped by ``context``, the conversation that came before
+    the question: only questions asked after the same context match.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, threshold=0.9, embed=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.embed = embed
+        self._entries = OrderedDict()  # key -> (response, row)
+        self._keys = [None] * max_entries  # row -> key
+        self._contexts = np.zeros(max_entries, dtype=np.int64)  # row -> context
+        self._expires = np.zeros(max_entries)  # row -> expiry time, 0 when free
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._matrix = None  # row -> question embedding, allocated on first put
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, question, context=""):
+        """Return ``(response, embedding)``; ``response`` is None on a miss.
+
+        Pass the embedding on to ``put`` so the question is not embedded
+        twice. It is None when semantic matching is off or was not needed.
+        """
+        scope = context_id(context)
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expires[entry[1]] > time.time():
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                CHAT_CACHE_LOOKUPS.inc(result="exact")
+                return entry[0], None
+
+        embedding = None
+        if self.embed is not None:
+            try:
+                embedding = np.asarray(self.embed([question])[0], dtype=np.float32)
+            except Exception as e:
+                print(f"⚠️ Warning: Could not embed chat question: {e}")
+
+        with self._lock:
+            if embedding is not None and self._matrix is not None and self._entries:
+                scores = self._matrix @ embedding
+                scores[self._expires <= time.time()] = -np.inf
+                scores[self._contexts != scope] = -np.inf
+                row = int(np.argmax(scores))
+                if scores[row] >= self.threshold:
+                    key = self._keys[row]
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    CHAT_CACHE_LOOKUPS.inc(result="semantic")
+                    return self._entries[key][0], embedding
+            self.misses += 1
+            CHAT_CACHE_LOOKUPS.inc(result="miss")
+            return None, embedding
+
+    def put(self, question, response, embedding=None, context=""):
+        """Cache the response to a question, evicting expired entries first"""
+        if self.max_entries <= 0:
+            return
+        scope = context_id(context)
+        key = (scope, normalize_question(question))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if not self._free:
+                self._evict()
+            row = self._free.pop()
+            if embedding is not None and self._matrix is None:
+                self._matrix = np.zeros(
+                    (self.max_entries, len(embedding)), dtype=np.float32
+                )
+            if self._matrix is not None:
+                # A zero row never reaches the threshold, so it only matches exactly
+                self._matrix[row] = 0 if embedding is None else embedding
+            self._keys[row] = key
+            self._contexts[row] = scope
+            self._expires[row] = time.time() + self.ttl_seconds
+            self._entries[key] = (response, row)
+
+    def clear(self):
+        """Drop every entry; returns how many were removed"""
+        with self._lock:
+            removed = len(self._entries)
+            for key in list(self._entries):
+                self._drop(key)
+            return removed
+
+    def stats(self):
+        """Hit/miss counters and size"""
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.threshold if self.embed else None,
+            }
+
+    def _evict(self):
+        """Free rows: all expired entries, or else the least recently used one"""
+        expired = np.flatnonzero(
+            (self._expires > 0) & (self._expires <= time.time())
+        )
+        for row in expired:
+            self._drop(self._keys[row])
+        if not self._free:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, row = self._entries.pop(key)
+        self._keys[row] = None
+        self._expires[row] = 0
+        self._free.append(row)
+
+
+def chat_response_cache_from_env(embed=None):
+    """Build the chat response cache from CHAT_CACHE_* environment variables.
+
+    Returns None when CHAT_CACHE_SIZE is 0. A CHAT_CACHE_SIMILARITY of 0
+    turns off semantic matching, leaving exact matches only.
+    """
+    max_entries = int(os.environ.get("CHAT_CACHE_SIZE", "512"))
+    if max_entries <= 0:
+        return None
+    threshold = float(os.environ.get("CHAT_CACHE_SIMILARITY", "0.9"))
+    return ChatResponseCache(
+        max_entries=max_entries,
+        ttl_seconds=float(os.environ.get("CHAT_CACHE_TTL_SECONDS", "3600")),
+        threshold=threshold,
+        embed=embed if threshold > 0 else None,
+    )
@@ -0,0 +1,147 @@
+"""
+Section-aware chunking of CV text and deterministic merging of chunk results
+
+Flan-T5 sees at most 512 input tokens, so a long CV is split into chunks
+that fit the prompt's token budget. Splits happen at section headings
+(EXPERIENCE, EDUCATION, ...) where possible, then at line breaks, then
+between words. Each piece is tokenized once. Chunks are built by joining
+the pieces' token IDs, so the assembled prompts reuse them without
+tokenizing the CV again. Each analysis prompt is run once per chunk, and
+``merge_ranked`` combines the per-chunk lists. Results depend only on the
+chunk outputs, not on the order in which chunks finish.
+"""
+
+import re
+
+# Headings that start a new CV section (matched case-insensitively)
+SECTION_HEADINGS = {
+    "summary",
+    "profile",
+    "professional summary",
+    "objective",
+    "skills",
+    "technical skills",
+    "core competencies",
+    "experience",
+    "work experience",
+    "professional experience",
+    "employment history",
+    "education",
+    "projects",
+    "certifications",
+    "awards",
+    "achievements",
+    "publications",
+    "languages",
+    "interests",
+    "volunteering",
+}
+
+_BULLET_RE = re.compile(r"^\s*(?:[-•*]+|\d+[.)])\s*")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def is_section_heading(line):
+    """Known heading, or a short all-caps line such as WORK HISTORY"""
+    text = line.strip().rstrip(":").strip()
+    if not text or len(text) > 40:
+        return False
+    if text.lower() in SECTION_HEADINGS:
+        return True
+    return text.isupper() and len(text.split()) <= 4 and any(c.isalpha() for c in text)
+
+
+def split_sections(text):
+    """Split CV text into sections, each starting at its heading line"""
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if is_section_heading(line) and "".join(current).strip():
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if "".join(current).strip():
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _split_words(text, budget, encode):
+    """Token IDs of one over-long line, as word runs that fit ``budget``"""
+    ids = encode(text)
+    words = text.split()
+    if len(words) <= 1 or len(ids) <= budget:
+        return [ids[:budget]]
+    middle = len(words) // 2
+    left = _split_words(" ".join(words[:middle]), budget, encode)
+    right = _split_words(" ".join(words[middle:]), budget, encode)
+    return left + right
+
+
+def _pack(pieces, budget):
+    """Greedily join consecutive token ID lists into chunks of ``budget``"""
+    chunks = []
+    current = []
+    for piece in pieces:
+        if current and len(current) + len(piece) > budget:
+            chunks.append(current)
+            current = []
+        current.extend(piece)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_cv(text, budget, encode, max_chunks=None):
+    """Split ``text`` into token ID chunks of at most ``budget`` tokens.
+
+    Whole sections are packed together while they fit. Sections that are
+    too long on their own are split by line and, failing that, by word.
+    ``encode(text)`` returns the model tokenizer's IDs without special
+    tokens. Whitespace between pieces is dropped by the tokenizer anyway,
+    so joined IDs match the IDs of the joined text. With ``max_chunks``
+    set, chunks past the limit are dropped.
+    """
+    pieces = []
+    for section in split_sections(text):
+        ids = encode(section)
+        if len(ids) <= budget:
+            pieces.append(ids)
+            continue
+        lines = []
+        for line in section.splitlines():
+            if line.strip():
+                lines.extend(_split_words(line.strip(), budget, encode))
+        pieces.extend(_pack(lines, budget))
+
+    chunks = _pack(pieces, budget) or [[]]
+    if max_chunks and len(chunks) > max_chunks:
+        print(f"⚠️ CV needs {len(chunks)} chunks; analyzing the first {max_chunks}")
+        chunks = chunks[:max_chunks]
+    return chunks
+
+
+def _normalize(item):
+    """Comparison key: lowercase, no bullets, numbering or trailing punctuation"""
+    item = _BULLET_RE.sub("", item)
+    return _SPACE_RE.sub(" ", item).strip().rstrip(".;:!").lower()
+
+
+def merge_ranked(item_lists, limit):
+    """Merge per-chunk item lists into one deduplicated, ranked list.
+
+    Items are ranked by how many chunks produced them, then by their
+    first appearance in chunk order. The first spelling seen is kept.
+    """
+    first_seen = {}
+    counts = {}
+    for chunk_index, items in enumerate(item_lists):
+        seen_in_chunk = set()
+        for position, item in enumerate(items):
+            key = _normalize(item)
+            if not key or key in seen_in_chunk:
+                continue
+            seen_in_chunk.add(key)
+            counts[key] = counts.get(key, 0) + 1
+            first_seen.setdefault(key, ((chunk_index, position), item.strip()))
+    ranked = sorted(counts, key=lambda key: (-counts[key], first_seen[key][0]))
+    return [first_seen[key][1] for key in ranked[:limit]]
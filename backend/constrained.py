@@ -0,0 +1,250 @@
+"""
+Schema-constrained generation of the whole CV analysis in one pass
+
+Instead of one prompt per analysis stage, each parsed by string splitting,
+Flan-T5 writes every field of the analysis in a single generation. A
+LogitsProcessor masks the invalid tokens at each step, so the output
+always follows the schema:
+
+    Keywords: Python, Flask, AWS <end> Role: Backend Engineer <end> ...
+
+Field labels are forced token by token. Items of a list field are split by
+the field's separator token, and a field ends with the end token. When the
+model would emit EOS in the middle of the schema, that choice is turned into
+the end of the current field. Item and field sizes are capped, so generation
+always finishes. ``StructuredDecoder.parse`` turns the output into a dict
+that JSON-serializes to an object matching the schema, and it cannot fail.
+
+Flan-T5's vocabulary has no braces, quotes or newlines, so the model cannot
+write JSON syntax itself. The structure is therefore carried by labels and
+separator tokens that the vocabulary does have, and the JSON object is built
+from them after generation.
+"""
+
+import torch
+from transformers import LogitsProcessor
+
+
+class Field:
+    """One field of the schema.
+
+    With ``max_items`` None the value is a single string, otherwise a list
+    of up to ``max_items`` strings split by ``separator``. ``suffix`` is
+    added back to every item, for example the "?" of a question used as
+    the separator.
+    """
+
+    def __init__(
+        self, name, label, max_items=None, separator=None, suffix="", max_item_tokens=32
+    ):
+        if max_items is not None and not separator:
+            raise ValueError(f"List field {name} needs a separator")
+        self.name = name
+        self.label = label
+        self.max_items = max_items
+        self.separator = separator
+        self.suffix = suffix
+        self.max_item_tokens = max_item_tokens
+
+    def _key(self):
+        return (
+            self.name,
+            self.label,
+            self.max_items,
+            self.separator,
+            self.suffix,
+            self.max_item_tokens,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Field) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+# Decoding states: forcing a field label, inside a field value, finished
+LABEL, VALUE, DONE = "label", "value", "done"
+
+
+class StructuredDecoder:
+    """Token-level state machine for a list of Fields and one tokenizer"""
+
+    def __init__(self, tokenizer, fields, end_token):
+        self.tokenizer = tokenizer
+        self.fields = list(fields)
+        self.eos = tokenizer.eos_token_id
+        self.end = tokenizer.convert_tokens_to_ids(end_token)
+        if self.end is None or self.end == tokenizer.unk_token_id:
+            raise ValueError(f"End token {end_token!r} is not in the vocabulary")
+        self.labels = [
+            tokenizer(field.label, add_special_tokens=False)["input_ids"]
+            for field in self.fields
+        ]
+        if not all(self.labels):
+            raise ValueError("Every field needs a non-empty label")
+
+        # Every token that decodes to a field's separator counts as one
+        vocab_size = len(tokenizer)
+        separators = {field.separator for field in self.fields if field.separator}
+        self.separator_ids = {separator: set() for separator in separators}
+        for token_id in range(vocab_size):
+            text = tokenizer.decode([token_id]).strip()
+            if text in self.separator_ids:
+                self.separator_ids[text].add(token_id)
+        for separator, ids in self.separator_ids.items():
+            if not ids:
+                raise ValueError(f"Separator {separator!r} is not in the vocabulary")
+        self.special_ids = set(tokenizer.all_special_ids) | {self.end}
+        self.vocab_size = vocab_size
+
+        # Longest possible output: every label, item and separator, plus EOS
+        self.max_tokens = 1 + sum(
+            len(label) + (field.max_items or 1) * (field.max_item_tokens + 1)
+            for field, label in zip(self.fields, self.labels)
+        )
+
+    def start(self):
+        """State before the first generated token"""
+        return (0, LABEL, 0, 0)  # field, phase, items or label position, item size
+
+    def advance(self, state, token_id):
+        """State after ``token_id`` is generated in ``state``"""
+        field_index, phase, count, size = state
+        if phase == DONE:
+            return state
+        if phase == LABEL:
+            if count + 1 < len(self.labels[field_index]):
+                return (field_index, LABEL, count + 1, 0)
+            return (field_index, VALUE, 0, 0)
+        field = self.fields[field_index]
+        if token_id == self.end:
+            if field_index + 1 == len(self.fields):
+                return (field_index, DONE, 0, 0)
+            return (field_index + 1, LABEL, 0, 0)
+        if field.separator and token_id in self.separator_ids[field.separator]:
+            return (field_index, VALUE, count + 1, 0)
+        return (field_index, VALUE, count, size + 1)
+
+    def allowed(self, state):
+        """``(forced_token, may_separate, may_end)`` for the next token.
+
+        ``forced_token`` is the only allowed token when it is not None.
+        Otherwise content tokens are allowed until the item reaches
+        ``max_item_tokens``, plus the separator and end token where the
+        flags say so. An item cannot be empty.
+        """
+        field_index, phase, count, size = state
+        if phase == DONE:
+            return self.eos, False, False
+        if phase == LABEL:
+            return self.labels[field_index][count], False, False
+        field = self.fields[field_index]
+        more_items = field.max_items is not None and count + 1 < field.max_items
+        if size == 0:
+            return None, False, False
+        return None, more_items, True
+
+    def parse(self, output_ids):
+        """The analysis dict for one generated sequence of token IDs"""
+        result = {
+            field.name: [] if field.max_items is not None else ""
+            for field in self.fields
+        }
+        state = self.start()
+        item = []
+
+        def finish_item(field):
+            text = self.tokenizer.decode(item, skip_special_tokens=True).strip()
+            item.clear()
+            if not text:
+                return
+            if field.max_items is None:
+                result[field.name] = text
+            else:
+                result[field.name].append(text + field.suffix)
+
+        for token_id in output_ids:
+            token_id = int(token_id)
+            field_index, phase, _, _ = state
+            if phase == DONE:
+                break
+            if phase == VALUE:
+                field = self.fields[field_index]
+                if token_id == self.end or (
+                    field.separator and token_id in self.separator_ids[field.separator]
+                ):
+                    finish_item(field)
+                elif token_id not in self.special_ids:
+                    item.append(token_id)
+            state = self.advance(state, token_id)
+        if state[1] == VALUE:
+            # Cut off early, for example at a deadline
+            finish_item(self.fields[state[0]])
+        return result
+
+
+class StructuredLogitsProcessor(LogitsProcessor):
+    """Masks every token the schema does not allow at the current step.
+
+    ``skip`` is the number of leading IDs in each row that are not generated
+    output (1 for the decoder start token of an encoder-decoder model).
+    """
+
+    def __init__(self, decoder, skip=1):
+        self.decoder = decoder
+        self.skip = skip
+        self._states = {}
+        self._masks = {}
+
+    def _content_mask(self, field, size, device):
+        """True for the tokens allowed inside an item of ``field``"""
+        key = (field.separator, size, device)
+        if key not in self._masks:
+            mask = torch.zeros(size, dtype=torch.bool)
+            mask[: self.decoder.vocab_size] = True
+            excluded = set(self.decoder.special_ids)
+            if field.separator:
+                excluded |= self.decoder.separator_ids[field.separator]
+            mask[[token_id for token_id in excluded if token_id < size]] = False
+            self._masks[key] = mask.to(device)
+        return self._masks[key]
+
+    def _state(self, generated):
+        """Decoder state after the generated part of one row"""
+        if generated:
+            # Rows usually extend a row from the previous step
+            previous = self._states.get(tuple(generated[:-1]))
+            if previous is not None:
+                return self.decoder.advance(previous, generated[-1])
+        state = self.decoder.start()
+        for token_id in generated:
+            state = self.decoder.advance(state, token_id)
+        return state
+
+    def __call__(self, input_ids, scores):
+        states = {}
+        masked = torch.full_like(scores, float("-inf"))
+        for row, ids in enumerate(input_ids.tolist()):
+            generated = ids[self.skip :]
+            state = self._state(generated)
+            states[tuple(generated)] = state
+            forced, may_separate, may_end = self.decoder.allowed(state)
+            if forced is not None:
+                masked[row, forced] = 0.0
+                continue
+
+            field = self.decoder.fields[state[0]]
+            if state[3] < field.max_item_tokens:
+                allowed = self._content_mask(field, scores.shape[-1], scores.device)
+                masked[row] = scores[row].masked_fill(~allowed, float("-inf"))
+            if may_separate:
+                for token_id in self.decoder.separator_ids[field.separator]:
+                    masked[row, token_id] = scores[row, token_id]
+            if may_end:
+                # A model that wants to stop ends the current field instead
+                masked[row, self.decoder.end] = torch.maximum(
+                    scores[row, self.decoder.end], scores[row, self.decoder.eos]
+                )
+        self._states = states
+        return masked
@@ -0,0 +1,194 @@
+"""
+Bounded-context conversation memory for chat sessions
+
+Each chat session keeps its conversation in the store: the latest turns
+verbatim, and a rolling summary of everything older. ``render`` turns it
+into a prompt section of at most ``max_tokens`` tokens, with the summary
+first and then as many of the newest turns as fit. The chat prompt, and with
+it LLaMA's prefill time, therefore stays about the same length however long
+the conversation gets.
+
+Once more than ``recent_turns`` turns are kept verbatim, a background
+worker folds the oldest ones into the summary, ``fold_turns`` turns per
+model call. A summary is saved together with the index of the first turn it
+does not cover, and only if no other worker changed the summary since it was
+read, so a turn is never folded twice. Until a fold lands, turns that do not
+fit the budget are left out of the prompt.
+
+CHAT_MEMORY_TOKENS (0 turns memory off), CHAT_MEMORY_RECENT_TURNS,
+CHAT_SUMMARY_TOKENS and CHAT_MEMORY_FOLD_TURNS configure it.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHAT_MEMORY_TOKENS = int(os.environ.get("CHAT_MEMORY_TOKENS", "384"))
+CHAT_MEMORY_RECENT_TURNS = int(os.environ.get("CHAT_MEMORY_RECENT_TURNS", "3"))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", "96"))
+CHAT_MEMORY_FOLD_TURNS = int(os.environ.get("CHAT_MEMORY_FOLD_TURNS", "2"))
+
+# First line of the rendered history
+HISTORY_HEADING = "Conversation so far:"
+
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token for English text"""
+    return (len(text) + 3) // 4
+
+
+def clip_tokens(text, max_tokens, count_tokens=estimate_tokens):
+    """The longest word prefix of ``text`` with at most ``max_tokens`` tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def format_turn(turn):
+    return f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+
+
+class ConversationMemory:
+    """Per-session chat history kept under a fixed token budget.
+
+    ``summarize(summary, turns)`` returns ``summary`` extended with
+    ``turns`` (dicts with "user" and "assistant"), or None if it failed.
+    ``count_tokens(text)`` counts tokens the way the chat model does.
+    """
+
+    def __init__(
+        self,
+        store,
+        summarize,
+        count_tokens=estimate_tokens,
+        max_tokens=CHAT_MEMORY_TOKENS,
+        recent_turns=CHAT_MEMORY_RECENT_TURNS,
+        summary_tokens=CHAT_SUMMARY_TOKENS,
+        fold_turns=CHAT_MEMORY_FOLD_TURNS,
+    ):
+        self.store = store
+        self.summarize = summarize
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.recent_turns = max(1, recent_turns)
+        self.summary_tokens = summary_tokens
+        self.fold_turns = max(1, fold_turns)
+        self.folds = 0
+        self.fold_failures = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chat-summary"
+        )
+
+    @property
+    def enabled(self):
+        return self.max_tokens > 0
+
+    def render(self, session_id):
+        """Prompt section with a session's conversation so far ("" if none)"""
+        if not self.enabled or not session_id:
+            return ""
+        memory = self.store.get_chat_memory(session_id)
+        budget = self.max_tokens - self.count_tokens(HISTORY_HEADING)
+
+        summary = ""
+        if memory["summary"]:
+            # At most half the budget, so recent turns always have room
+            summary = clip_tokens(
+                f"Summary of earlier messages: {memory['summary']}",
+                min(self.summary_tokens, budget // 2),
+                self.count_tokens,
+            )
+            budget -= self.count_tokens(summary)
+
+        turns = []
+        for turn in reversed(memory["turns"]):
+            text = format_turn(turn)
+            cost = self.count_tokens(text)
+            if cost > budget:
+                if not turns:
+                    # The latest turn is what a follow-up most likely refers
+                    # to, so it is shortened rather than left out
+                    text = clip_tokens(text, max(budget, 0), self.count_tokens)
+                    if text:
+                        turns.append(text)
+                break
+            turns.append(text)
+            budget -= cost
+
+        if not summary and not turns:
+            return ""
+        lines = [HISTORY_HEADING]
+        if summary:
+            lines.append(summary)
+        lines.extend(reversed(turns))
+        return "\n".join(lines) + "\n"
+
+    def record(self, session_id, user, assistant):
+        """Store a finished turn and fold older turns in the background"""
+        if not self.enabled or not session_id or not assistant:
+            return
+        unsummarized = self.store.append_chat_turn(session_id, user, assistant)
+        if unsummarized > self.recent_turns:
+            self._schedule(session_id)
+
+    def clear(self, session_id):
+        """Forget a session's conversation; False if it had none"""
+        return self.store.clear_chat_memory(session_id)
+
+    def _schedule(self, session_id):
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._fold, session_id)
+
+    def _fold(self, session_id):
+        """Fold turns beyond the recent window into the summary"""
+        try:
+            while True:
+                memory = self.store.get_chat_memory(session_id)
+                excess = len(memory["turns"]) - self.recent_turns
+                if excess <= 0:
+                    return
+                turns = memory["turns"][: min(excess, self.fold_turns)]
+                summary = self.summarize(memory["summary"], turns)
+                if not summary:
+                    self.fold_failures += 1
+                    return
+                if not self.store.save_chat_summary(
+                    session_id,
+                    summary,
+                    memory["summarized_upto"],
+                    turns[-1]["index"] + 1,
+                ):
+                    # Another worker folded these turns first
+                    return
+                self.folds += 1
+        except Exception as e:
+            self.fold_failures += 1
+            print(f"⚠️ Warning: Could not summarize chat history: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "enabled": self.enabled,
+            "max_tokens": self.max_tokens,
+            "recent_turns": self.recent_turns,
+            "folds": self.folds,
+            "fold_failures": self.fold_failures,
+            "pending_folds": pending,
+        }
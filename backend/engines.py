@@ -0,0 +1,183 @@
+"""
+Inference engines that load the models behind llm.py
+
+An engine turns a model name and a precision mode into a model with
+transformers' ``generate`` API. The query functions in llm.py therefore run
+unchanged whichever engine loaded the model. FLAN_T5_ENGINE and
+LLAMA2_ENGINE pick the engine per model:
+
+- ``torch``: transformers with PyTorch eager execution (the default)
+- ``onnx``: ONNX Runtime through optimum (``pip install optimum[onnxruntime]``).
+  The first load exports the model to ONNX_CACHE_DIR as an encoder, a
+  decoder and a decoder that takes the past key/values, so every decoding
+  step after the first runs only the new token. Later loads, also in other
+  processes, read the exported files. ``python export_onnx.py`` runs the
+  export ahead of time.
+
+``python benchmarks/engine_comparison.py`` compares the engines' latency and outputs
+on the same prompts.
+"""
+
+import os
+import threading
+
+import torch
+from transformers import AutoModelForCausalLM, AutoModelForSeq2SeqLM
+
+# Precision modes: fp32, bf16, fp16 (GPU only in practice) and int8, which
+# applies dynamic int8 quantization to the Linear layers of an fp32 model (CPU)
+PRECISION_DTYPES = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+    "int8": torch.float32,
+}
+
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", "onnx_models")
+ONNX_PROVIDER = os.environ.get("ONNX_PROVIDER", "CPUExecutionProvider")
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))  # 0: ONNX Runtime default
+
+
+def check_precision(precision):
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(
+            f"Unknown precision {precision!r}; use one of {', '.join(PRECISION_DTYPES)}"
+        )
+
+
+def apply_precision(model, precision):
+    """Quantize the Linear layers for int8; other modes are set at load time"""
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model.eval()
+
+
+class TorchEngine:
+    """transformers models run eagerly by PyTorch"""
+
+    name = "torch"
+    # The model's KV cache is a plain PyTorch cache, so the prefix KV cache
+    # and assisted decoding can work with it
+    shares_kv_cache = True
+
+    MODEL_CLASSES = {"seq2seq": AutoModelForSeq2SeqLM, "causal": AutoModelForCausalLM}
+
+    def load(self, model_name, kind, precision):
+        """Load ``model_name`` as a ``seq2seq`` or ``causal`` language model"""
+        check_precision(precision)
+        kwargs = {"torch_dtype": PRECISION_DTYPES[precision]}
+        if kind == "causal":
+            # Dynamic quantization runs on CPU, so int8 never goes to the GPU
+            use_gpu = torch.cuda.is_available() and precision != "int8"
+            kwargs["device_map"] = "auto" if use_gpu else None
+        model = self.MODEL_CLASSES[kind].from_pretrained(model_name, **kwargs)
+        return apply_precision(model, precision)
+
+    def model_bytes(self, model):
+        """Bytes held by a model's weights, including int8 packed parameters"""
+        total = 0
+        for value in model.state_dict().values():
+            tensors = value if isinstance(value, tuple) else (value,)
+            for tensor in tensors:
+                if isinstance(tensor, torch.Tensor):
+                    total += tensor.numel() * tensor.element_size()
+        return total
+
+
+class OnnxEngine:
+    """Models exported to ONNX and run by ONNX Runtime"""
+
+    name = "onnx"
+    # Past key/values live inside the ONNX Runtime sessions
+    shares_kv_cache = False
+
+    def __init__(self, cache_dir=ONNX_CACHE_DIR, provider=ONNX_PROVIDER):
+        self.cache_dir = cache_dir
+        self.provider = provider
+        self._export_lock = threading.Lock()
+
+    @staticmethod
+    def _model_class(kind):
+        try:
+            from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise RuntimeError(
+                "The onnx engine needs optimum: pip install optimum[onnxruntime]"
+            ) from e
+        return {"seq2seq": ORTModelForSeq2SeqLM, "causal": ORTModelForCausalLM}[kind]
+
+    def model_dir(self, model_name):
+        """Directory holding the exported ONNX files of ``model_name``"""
+        return os.path.join(self.cache_dir, model_name.replace("/", "--"))
+
+    def is_exported(self, model_name):
+        path = self.model_dir(model_name)
+        return os.path.isdir(path) and any(
+            name.endswith(".onnx") for name in os.listdir(path)
+        )
+
+    def export(self, model_name, kind):
+        """Export ``model_name`` to the cache unless it is there already"""
+        path = self.model_dir(model_name)
+        with self._export_lock:
+            if self.is_exported(model_name):
+                return path
+            print(f"Exporting {model_name} to ONNX in {path} (one-time step)...")
+            model = self._model_class(kind).from_pretrained(
+                model_name, export=True, use_cache=True
+            )
+            # Export next to the final directory and move it into place, so
+            # another process never loads a half-written export
+            partial = f"{path}.partial-{os.getpid()}"
+            model.save_pretrained(partial)
+            try:
+                os.replace(partial, path)
+            except OSError:
+                if not self.is_exported(model_name):
+                    raise
+                print(f"{model_name} was exported by another process")
+            print(f"✅ Exported {model_name} to ONNX")
+        return path
+
+    def _session_options(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        return options
+
+    def load(self, model_name, kind, precision):
+        """Load the exported model, exporting it first if needed"""
+        check_precision(precision)
+        if precision != "fp32":
+            raise ValueError(f"The onnx engine runs fp32 models only, not {precision}")
+        model_class = self._model_class(kind)
+        return model_class.from_pretrained(
+            self.export(model_name, kind),
+            use_cache=True,
+            provider=self.provider,
+            session_options=self._session_options(),
+        )
+
+    def model_bytes(self, model):
+        """Bytes of the ONNX files (graphs and external weights) of a model"""
+        total = 0
+        for root, _, names in os.walk(str(model.model_save_dir)):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        return total
+
+
+ENGINES = {engine.name: engine for engine in (TorchEngine(), OnnxEngine())}
+
+
+def get_engine(name):
+    """The engine registered under ``name`` (``torch`` or ``onnx``)"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name!r}; use one of {', '.join(ENGINES)}")
+    return ENGINES[name]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+One-time export of the models to ONNX for the onnx inference engine
+
+The onnx engine exports a model on its first load anyway. Running this
+before deployment, for example while building the image, keeps that slow
+step out of the first request. The files are written to ONNX_CACHE_DIR,
+one directory per model, and are reused by every later load.
+
+Usage: python export_onnx.py [flan_t5] [llama2]   (default: flan_t5)
+"""
+
+import sys
+
+from engines import get_engine
+from llm import FLAN_T5_MODEL, LLAMA2_MODEL
+
+# Registry name -> (model, kind of language model)
+MODELS = {
+    "flan_t5": (FLAN_T5_MODEL, "seq2seq"),
+    "llama2": (LLAMA2_MODEL, "causal"),
+}
+
+
+def main():
+    names = sys.argv[1:] or ["flan_t5"]
+    unknown = [name for name in names if name not in MODELS]
+    if unknown:
+        print(f"❌ Unknown model(s): {', '.join(unknown)}; use {', '.join(MODELS)}")
+        sys.exit(1)
+
+    engine = get_engine("onnx")
+    for name in names:
+        model_name, kind = MODELS[name]
+        if engine.is_exported(model_name):
+            print(f"✅ {model_name} is already exported")
+            continue
+        path = engine.export(model_name, kind)
+        print(f"📁 {name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
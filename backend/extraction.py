@@ -0,0 +1,217 @@
+"""
+Server-side text extraction for uploaded CV files (PDF, DOCX, TXT)
+
+app.py has werkzeug write uploads straight into a named temporary file
+(upload_stream), and extraction reads that file in place; other streams are
+copied to a temporary file in fixed-size chunks first. The request body is
+bounded by Flask's MAX_CONTENT_LENGTH, which app.py sets from
+UPLOAD_MAX_BYTES. PDFs are read page by page. Large PDFs are split into page
+ranges and parsed by a process pool, because PyPDF2 is pure Python and
+threads would serialize on the GIL. The pool's workers are started by a
+fork server (or spawned), never forked from the multithreaded app process.
+
+Limits come from UPLOAD_MAX_BYTES and UPLOAD_MAX_PAGES. PDFs with at least
+PDF_PARALLEL_MIN_PAGES pages are parsed on EXTRACTION_WORKERS processes.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import docx
+from PyPDF2 import PdfReader
+
+from metrics import EXTRACTION_SECONDS
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.environ.get("UPLOAD_MAX_PAGES", "50"))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "8"))
+EXTRACTION_WORKERS = int(
+    os.environ.get("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+SUPPORTED_FORMATS = ("pdf", "docx", "txt")
+_CHUNK_SIZE = 64 * 1024
+
+
+class ExtractionError(Exception):
+    """Raised when an uploaded file cannot be turned into CV text"""
+
+
+class UploadTooLarge(ExtractionError):
+    """Raised when an upload exceeds the size or page limit"""
+
+
+def detect_format(filename):
+    """File format from the upload's extension, or None if unsupported"""
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    return extension if extension in SUPPORTED_FORMATS else None
+
+
+def upload_stream(filename=None):
+    """Named temporary file for werkzeug to write an upload into.
+
+    Unlike werkzeug's default spooled file it has a path, so extraction and
+    the PDF workers read the upload without another copy. It is deleted
+    when werkzeug closes it at the end of the request.
+    """
+    suffix = os.path.splitext(filename or "")[1]
+    return tempfile.NamedTemporaryFile("wb+", prefix="cv-upload-", suffix=suffix)
+
+
+@contextmanager
+def upload_file(stream, suffix="", max_bytes=UPLOAD_MAX_BYTES):
+    """``(path, size)`` of an upload on disk, for the duration of the block.
+
+    A stream that is already a named file (see upload_stream) is used in
+    place. Any other stream is spooled to a temporary file that is deleted
+    afterwards.
+    """
+    name = getattr(stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        stream.flush()
+        size = os.path.getsize(name)
+        if size > max_bytes:
+            raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+        yield name, size
+        return
+
+    path, size = spool_upload(stream, suffix, max_bytes)
+    try:
+        yield path, size
+    finally:
+        os.remove(path)
+
+
+def spool_upload(stream, suffix="", max_bytes=UPLOAD_MAX_BYTES):
+    """Copy an upload stream to a temporary file; returns ``(path, size)``.
+
+    Extraction works on the file's path. The caller owns the file and must
+    delete it.
+    """
+    handle, path = tempfile.mkstemp(prefix="cv-upload-", suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(handle, "wb") as f:
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def _pdf_page_range(path, start, stop):
+    """Text of pages ``[start, stop)``; runs in a worker process"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs threads can deadlock the child on
+            # a lock held by another thread, and copies the loaded models
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS, mp_context=context
+            )
+        return _pool
+
+
+def extract_pdf(path, max_pages=UPLOAD_MAX_PAGES):
+    """Text of each PDF page, in order.
+
+    Malformed PDFs make PyPDF2 raise almost anything (PdfReadError,
+    ValueError, KeyError, ...), also from the worker processes, so every
+    failure while reading becomes an ExtractionError.
+    """
+    try:
+        return _extract_pdf(path, max_pages)
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Could not read PDF: {e}")
+
+
+def _extract_pdf(path, max_pages):
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        raise ExtractionError("Encrypted PDFs are not supported")
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        raise UploadTooLarge(f"PDF has {page_count} pages (limit {max_pages})")
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or EXTRACTION_WORKERS <= 1:
+        return [page.extract_text() or "" for page in reader.pages]
+
+    # One contiguous page range per worker; each worker opens the file itself
+    step = -(-page_count // EXTRACTION_WORKERS)
+    ranges = [(s, min(s + step, page_count)) for s in range(0, page_count, step)]
+    futures = [
+        _process_pool().submit(_pdf_page_range, path, start, stop)
+        for start, stop in ranges
+    ]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def extract_docx(path):
+    """Paragraph and table text of a DOCX file, in document order"""
+    try:
+        document = docx.Document(path)
+    except Exception as e:
+        raise ExtractionError(f"Could not read DOCX: {e}")
+    parts = [p.text for p in document.paragraphs if p.text.strip()]
+    for table in document.tables:
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if cells:
+                parts.append(" | ".join(cells))
+    return ["\n".join(parts)]
+
+
+def extract_txt(path):
+    """Plain-text file contents, decoded as UTF-8"""
+    with open(path, "rb") as f:
+        return [f.read().decode("utf-8", errors="replace")]
+
+
+def extract_text(path, file_format):
+    """Extract CV text from a spooled file.
+
+    Returns ``{"text", "pages", "extraction_ms"}``. ``pages`` is the page
+    count for PDFs and 1 for other formats.
+    """
+    extractors = {"pdf": extract_pdf, "docx": extract_docx, "txt": extract_txt}
+    start = time.perf_counter()
+    with EXTRACTION_SECONDS.time(format=file_format):
+        pages = extractors[file_format](path)
+    text = "\n\n".join(page.strip() for page in pages if page.strip())
+    if not text:
+        raise ExtractionError("No text could be extracted from the file")
+    return {
+        "text": text,
+        "pages": len(pages),
+        "extraction_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
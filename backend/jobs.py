@@ -0,0 +1,163 @@
+"""
+Asynchronous analysis jobs processed by a fixed-size worker pool
+
+Jobs are queued in submission order and picked up by a fixed number of
+worker threads, so concurrent uploads cannot start more LLM passes than
+there are workers. Each job reports per-stage progress and can be
+cancelled while queued or between stages.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has reached its depth limit"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested"""
+
+
+class JobManager:
+    """Bounded FIFO queue of jobs served by a fixed pool of worker threads"""
+
+    def __init__(self, workers=1, max_queue=32, max_finished=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_finished = max_finished
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+        for i in range(workers):
+            threading.Thread(
+                target=self._worker, name=f"analysis-worker-{i}", daemon=True
+            ).start()
+
+    def submit(self, fn, stages, **metadata):
+        """Queue ``fn(progress)`` and return a snapshot of the new job.
+
+        ``fn`` receives a ``progress(stage, state)`` callback; calling it
+        raises JobCancelled once the job has been cancelled. Raises QueueFull
+        when the queue depth limit is reached.
+        """
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "stages": {stage: "pending" for stage in stages},
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            **metadata,
+        }
+        with self._lock:
+            try:
+                self._queue.put_nowait((job_id, fn))
+            except queue.Full:
+                raise QueueFull(f"Job queue is full ({self.max_queue} jobs)")
+            self._jobs[job_id] = job
+            return self._snapshot(job)
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def cancel(self, job_id):
+        """Cancel a job; returns its snapshot, or None if unknown.
+
+        Queued jobs are cancelled immediately. Running jobs stop at the next
+        stage boundary. Finished jobs are left as they are.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                self._finish(job, "cancelled")
+            elif job["status"] == "running":
+                job["status"] = "cancelling"
+            return self._snapshot(job)
+
+    def stats(self):
+        """Queue depth and job counts by status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "jobs": counts,
+            }
+
+    def _worker(self):
+        while True:
+            job_id, fn = self._queue.get()
+            try:
+                self._run(job_id, fn)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, fn):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return  # cancelled (or evicted) while waiting in the queue
+            job["status"] = "running"
+            job["started_at"] = datetime.now().isoformat()
+
+        def progress(stage, state):
+            with self._lock:
+                if job["status"] == "cancelling":
+                    raise JobCancelled(job_id)
+                job["stages"][stage] = state
+
+        start = time.perf_counter()
+        try:
+            result = fn(progress)
+        except JobCancelled:
+            with self._lock:
+                for stage, state in job["stages"].items():
+                    if state == "running":
+                        job["stages"][stage] = "cancelled"
+                self._finish(job, "cancelled")
+            print(f"🛑 Job {job_id} cancelled")
+            return
+        except Exception as e:
+            with self._lock:
+                job["error"] = str(e)
+                self._finish(job, "failed")
+            print(f"❌ Job {job_id} failed: {e}")
+            return
+
+        with self._lock:
+            job["result"] = result
+            self._finish(job, "completed")
+        print(f"✅ Job {job_id} completed in {time.perf_counter() - start:.1f}s")
+
+    def _finish(self, job, status):
+        """Mark a job finished and drop the oldest finished jobs over the limit"""
+        job["status"] = status
+        job["finished_at"] = datetime.now().isoformat()
+        finished = [
+            job_id
+            for job_id, other in self._jobs.items()
+            if other["finished_at"] is not None
+        ]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job):
+        return {**job, "stages": dict(job["stages"])}
@@ -1,42 +1,480 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModel,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+import functools
+import os
+import queue
+import string
+import threading
+import time
 import torch
+from admission import current_deadline
+from constrained import StructuredDecoder, StructuredLogitsProcessor
+from engines import check_precision, get_engine
+from metrics import (
+    LLM_DEADLINE_STOPS,
+    LLM_FALLBACKS,
+    LLM_GENERATED_TOKENS,
+    LLM_IN_FLIGHT,
+    LLM_PROMPT_TOKENS,
+    LLM_REQUEST_SECONDS,
+    MODEL_MEMORY_BYTES,
+)
 
 # Model configurations
 FLAN_T5_MODEL = "google/flan-t5-base"  # For CV analysis tasks
+FLAN_T5_MAX_INPUT_TOKENS = 512  # Longer prompts are truncated
 LLAMA2_MODEL = "meta-llama/Llama-2-7b-chat-hf"  # For chatting
+# Optional small causal model sharing LLaMA 2's tokenizer (for example
+# TinyLlama/TinyLlama-1.1B-Chat-v1.0). When set, chat uses assisted decoding:
+# the draft model proposes LLAMA2_DRAFT_TOKENS tokens and LLaMA 2 verifies
+# them in one forward pass. Unset means normal decoding.
+LLAMA2_DRAFT_MODEL = os.environ.get("LLAMA2_DRAFT_MODEL", "")
+LLAMA2_DRAFT_TOKENS = int(os.environ.get("LLAMA2_DRAFT_TOKENS", "5"))
+EMBEDDING_MODEL = os.environ.get(
+    "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)  # For retrieving CV passages in chat
+EMBEDDING_MAX_INPUT_TOKENS = 256
 
-# Initialize Flan-T5 for CV analysis
-print("Loading Flan-T5 model for CV analysis...")
-flan_tokenizer = AutoTokenizer.from_pretrained(FLAN_T5_MODEL)
-flan_model = AutoModelForSeq2SeqLM.from_pretrained(FLAN_T5_MODEL)
-
-# Initialize LLaMA 2 for chat (with error handling for availability)
-llama_tokenizer = None
-llama_model = None
-
-try:
-    print("Loading LLaMA 2 model for chat...")
-    llama_tokenizer = AutoTokenizer.from_pretrained(LLAMA2_MODEL)
-    llama_model = AutoModelForCausalLM.from_pretrained(
-        LLAMA2_MODEL,
-        torch_dtype=torch.float16,
-        device_map="auto" if torch.cuda.is_available() else None,
-    )
+# Flan-T5 decoding modes. "greedy" and "beam" give the same output for the
+# same prompt every time; "sample" varies it.
+FLAN_T5_DECODING = {
+    "sample": {"do_sample": True, "temperature": 0.7},
+    "greedy": {"do_sample": False},
+    "beam": {"do_sample": False, "num_beams": 4},
+}
+# Sentinel token that ends each field of a structured analysis
+FLAN_T5_FIELD_END = "<extra_id_0>"
+
+
+class ModelSlot:
+    """A model that is loaded once, on first use, by whichever thread needs it"""
+
+    def __init__(self, name, loader, **info):
+        self.name = name
+        self.info = info
+        self._loader = loader
+        self._lock = threading.Lock()
+        self.state = "not_loaded"  # not_loaded -> loading -> ready | failed
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+
+    def get(self, wait=True):
+        """Return the loaded model, loading it if needed.
+
+        With ``wait=False`` the call never blocks: if the model is not ready
+        yet a background load is started and None is returned.
+        """
+        if self.state == "ready":
+            return self.value
+        if not wait:
+            if self.state == "not_loaded":
+                self.load_in_background()
+            return None
+
+        with self._lock:
+            if self.state == "not_loaded":
+                self._load()
+            return self.value
+
+    def load_in_background(self):
+        """Start loading in a daemon thread; no-op if already started"""
+        if self.state != "not_loaded":
+            return
+        threading.Thread(
+            target=self.get, name=f"load-{self.name}", daemon=True
+        ).start()
+
+    def status(self):
+        """Load state for readiness reporting"""
+        return {
+            **self.info,
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+        }
+
+    def _load(self):
+        """Run the loader; called with the slot lock held"""
+        self.state = "loading"
+        start = time.perf_counter()
+        try:
+            self.value = self._loader()
+            self.state = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"⚠️ Warning: Could not load {self.name}: {e}")
+        self.load_seconds = round(time.perf_counter() - start, 2)
+
+
+class ModelRegistry:
+    """Named models, each loaded lazily and at most once"""
+
+    def __init__(self):
+        self._slots = {}
+
+    def register(self, name, loader, **info):
+        """Register a loader; ``info`` is reported alongside the load state"""
+        self._slots[name] = ModelSlot(name, loader, **info)
+
+    def get(self, name, wait=True):
+        return self._slots[name].get(wait=wait)
+
+    def state(self, name):
+        return self._slots[name].state
+
+    def status(self):
+        return {name: slot.status() for name, slot in self._slots.items()}
+
+    def warm_up(self, names=None, background=True):
+        """Load the given models (default: all) in order.
+
+        In the background the models load one after another in a single
+        daemon thread, so the first one listed becomes ready first.
+        """
+        slots = [self._slots[name] for name in (names or self._slots)]
+
+        def load_all():
+            for slot in slots:
+                slot.get()
+
+        if background:
+            threading.Thread(target=load_all, name="model-warmup", daemon=True).start()
+        else:
+            load_all()
+
+
+# Inference engine per model (see engines.py): torch or onnx
+FLAN_T5_ENGINE = os.environ.get("FLAN_T5_ENGINE", "torch")
+LLAMA2_ENGINE = os.environ.get("LLAMA2_ENGINE", "torch")
+
+FLAN_T5_PRECISION = os.environ.get("FLAN_T5_PRECISION", "fp32")
+# LLaMA 2 stays at 16 bits by default (about 14 GB for 7B): fp16 on GPU and
+# bf16 on CPU, where fp16 kernels are slow or missing. fp32 is opt-in, and
+# the default for the onnx engine, which runs fp32 models only.
+if LLAMA2_ENGINE == "onnx":
+    _LLAMA2_DEFAULT_PRECISION = "fp32"
+elif torch.cuda.is_available():
+    _LLAMA2_DEFAULT_PRECISION = "fp16"
+else:
+    _LLAMA2_DEFAULT_PRECISION = "bf16"
+LLAMA2_PRECISION = os.environ.get("LLAMA2_PRECISION", _LLAMA2_DEFAULT_PRECISION)
+llama2_engine = get_engine(LLAMA2_ENGINE)
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(model_name):
+    """A model's tokenizer, loaded once per process and without its weights"""
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def load_flan_t5(precision=None, engine=None):
+    """Load Flan-T5 for CV analysis"""
+    precision = precision or FLAN_T5_PRECISION
+    engine = get_engine(engine or FLAN_T5_ENGINE)
+    print(f"Loading Flan-T5 model for CV analysis ({precision}, {engine.name})...")
+    tokenizer = load_tokenizer(FLAN_T5_MODEL)
+    model = engine.load(FLAN_T5_MODEL, "seq2seq", precision)
+    MODEL_MEMORY_BYTES.set(engine.model_bytes(model), model="flan_t5")
+    print("✅ Flan-T5 model loaded successfully")
+    return tokenizer, model
+
+
+def load_llama2(precision=None, engine=None):
+    """Load LLaMA 2 for chat"""
+    precision = precision or LLAMA2_PRECISION
+    engine = get_engine(engine or LLAMA2_ENGINE)
+    print(f"Loading LLaMA 2 model for chat ({precision}, {engine.name})...")
+    tokenizer = AutoTokenizer.from_pretrained(LLAMA2_MODEL)
+    # Batched chat generation pads prompts on the left so that every row
+    # ends at the same position and generation continues from there
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = engine.load(LLAMA2_MODEL, "causal", precision)
+    MODEL_MEMORY_BYTES.set(engine.model_bytes(model), model="llama2")
     print("✅ LLaMA 2 model loaded successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not load LLaMA 2 model: {e}")
-    print("📝 Falling back to Flan-T5 for chat as well")
+    return tokenizer, model
+
+
+def load_llama2_draft(model_name=None, precision=None):
+    """Load the draft model that proposes tokens for LLaMA 2 to verify"""
+    model_name = model_name or LLAMA2_DRAFT_MODEL
+    precision = precision or LLAMA2_PRECISION
+    check_precision(precision)
+    print(f"Loading draft model {model_name} for assisted decoding ({precision})...")
+    # Draft tokens are verified by ID, so both models need the same vocabulary
+    draft_vocab = AutoTokenizer.from_pretrained(model_name).get_vocab()
+    if draft_vocab != AutoTokenizer.from_pretrained(LLAMA2_MODEL).get_vocab():
+        raise ValueError(f"{model_name} does not share LLaMA 2's tokenizer")
+    # Assisted decoding works on PyTorch KV caches, so the draft model
+    # always runs on the torch engine
+    engine = get_engine("torch")
+    model = engine.load(model_name, "causal", precision)
+    model.generation_config.num_assistant_tokens = LLAMA2_DRAFT_TOKENS
+    MODEL_MEMORY_BYTES.set(engine.model_bytes(model), model="llama2_draft")
+    print("✅ Draft model loaded successfully")
+    return model
+
+
+def load_embedder():
+    """Load the sentence-embedding model used for CV passage retrieval"""
+    print("Loading sentence-embedding model for CV retrieval...")
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL).eval()
+    MODEL_MEMORY_BYTES.set(get_engine("torch").model_bytes(model), model="embedder")
+    print("✅ Sentence-embedding model loaded successfully")
+    return tokenizer, model
+
+
+model_registry = ModelRegistry()
+model_registry.register(
+    "flan_t5",
+    load_flan_t5,
+    model=FLAN_T5_MODEL,
+    precision=FLAN_T5_PRECISION,
+    engine=FLAN_T5_ENGINE,
+)
+model_registry.register(
+    "llama2",
+    load_llama2,
+    model=LLAMA2_MODEL,
+    precision=LLAMA2_PRECISION,
+    engine=LLAMA2_ENGINE,
+)
+# Assisted decoding needs LLaMA 2's KV cache, which only the torch engine shares
+if LLAMA2_DRAFT_MODEL and llama2_engine.shares_kv_cache:
+    model_registry.register(
+        "llama2_draft",
+        load_llama2_draft,
+        model=LLAMA2_DRAFT_MODEL,
+        precision=LLAMA2_PRECISION,
+    )
+model_registry.register("embedder", load_embedder, model=EMBEDDING_MODEL)
+
+
+def warm_up_from_env():
+    """Start a background warm-up for the models listed in MODEL_WARMUP.
+
+    MODEL_WARMUP is a comma-separated list of model names (``flan_t5``,
+    ``llama2``, ``llama2_draft``, ``embedder``) or ``all``; unset or empty
+    means fully lazy loading.
+    """
+    value = os.environ.get("MODEL_WARMUP", "").strip()
+    if not value:
+        return
+    names = None if value == "all" else [n.strip() for n in value.split(",")]
+    model_registry.warm_up(names, background=True)
+
+
+def _instrumented(model, call):
+    """Record latency and in-flight count of an LLM entry point"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with LLM_IN_FLIGHT.track_in_progress(model=model, call=call):
+                with LLM_REQUEST_SECONDS.time(model=model, call=call):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class DeadlineCriteria(StoppingCriteria):
+    """Stop generating once the request's deadline has passed"""
+
+    def __init__(self, deadline, model):
+        self.deadline = deadline
+        self.model = model
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if time.time() < self.deadline:
+            return False
+        LLM_DEADLINE_STOPS.inc(model=self.model)
+        return True
+
 
+class CancelCriteria(StoppingCriteria):
+    """Stop generating once ``event`` is set"""
 
-def query_flan_t5(prompt: str, max_tokens=512):
-    """Query Flan-T5 model for CV analysis tasks"""
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+
+def _deadline_kwargs(model, deadline=None):
+    """generate() kwargs that cut generation off at the request deadline"""
+    if deadline is None:
+        deadline = current_deadline()
+    if deadline is None:
+        return {}
+    criteria = StoppingCriteriaList([DeadlineCriteria(deadline, model)])
+    return {"stopping_criteria": criteria}
+
+
+class TextStopCriteria(StoppingCriteria):
+    """Stop a Flan-T5 batch once every sequence is done.
+
+    ``conditions`` has one callable (or None) per prompt, taking the text
+    generated so far. A sequence is done when its condition returns True,
+    it has reached EOS, or it has reached its prompt's entry in ``limits``.
+    With beam search every beam of a prompt has to be done.
+    """
+
+    def __init__(self, tokenizer, conditions, limits):
+        self.tokenizer = tokenizer
+        self.conditions = conditions
+        self.limits = limits
+
+    def __call__(self, input_ids, scores, **kwargs):
+        beams = input_ids.shape[0] // len(self.conditions)
+        eos = self.tokenizer.eos_token_id
+        for row, ids in enumerate(input_ids):
+            prompt = row // beams
+            # Decoder outputs start with the decoder start token
+            if eos in ids or ids.shape[-1] - 1 >= self.limits[prompt]:
+                continue
+            condition = self.conditions[prompt]
+            if condition is None:
+                return False
+            if not condition(self.tokenizer.decode(ids, skip_special_tokens=True)):
+                return False
+        return True
+
+
+def _flan_t5_generate_kwargs(flan_tokenizer, decoding, stop, limits):
+    """generate() kwargs for a decoding mode, stop condition(s) and deadline.
+
+    ``stop`` is one condition shared by every prompt, a list with one per
+    prompt, or None. ``limits`` has each prompt's max_new_tokens.
+    """
+    if decoding not in FLAN_T5_DECODING:
+        raise ValueError(f"Unknown decoding mode: {decoding}")
+    kwargs = dict(FLAN_T5_DECODING[decoding])
+    criteria = StoppingCriteriaList()
+    conditions = stop if isinstance(stop, list) else [stop] * len(limits)
+    if any(condition is not None for condition in conditions):
+        criteria.append(TextStopCriteria(flan_tokenizer, conditions, limits))
+    criteria.extend(_deadline_kwargs("flan_t5").get("stopping_criteria", []))
+    if criteria:
+        kwargs["stopping_criteria"] = criteria
+    return kwargs
+
+
+def _flan_t5():
+    """Flan-T5 tokenizer and model, loading them on first use"""
+    loaded = model_registry.get("flan_t5")
+    if loaded is None:
+        raise RuntimeError("Flan-T5 model is not available")
+    return loaded
+
+
+class PromptAssembler:
+    """Builds Flan-T5 prompts as token IDs instead of re-tokenizing text.
+
+    The fixed text of each template is tokenized once, on first use, into
+    the pieces around its ``{field}`` placeholders. Request text such as a
+    CV chunk is tokenized once with ``encode``. The same IDs are then
+    spliced into every template that needs them. When a prompt is too long,
+    the longest field is cut instead of the end of the prompt, so the
+    instruction that closes each template ("Keywords:") always survives.
+    """
+
+    def __init__(self, templates, tokenizer=None, max_length=FLAN_T5_MAX_INPUT_TOKENS):
+        self.templates = templates
+        self.max_length = max_length
+        self._tokenizer = tokenizer
+        self._parts = None
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        # Only the tokenizer: web workers using a model server hold no weights
+        return self._tokenizer or load_tokenizer(FLAN_T5_MODEL)
+
+    def encode(self, text):
+        """Token IDs of ``text`` without special tokens"""
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def _compiled(self):
+        with self._lock:
+            if self._parts is None:
+                self._parts = {
+                    name: self._split(template)
+                    for name, template in self.templates.items()
+                }
+            return self._parts
+
+    def _split(self, template):
+        """Token ID lists for the fixed text, field names for placeholders"""
+        parts = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            if literal:
+                parts.append(self.encode(literal))
+            if field is not None:
+                parts.append(field)
+        return parts
+
+    def overhead(self, name):
+        """Tokens taken by a template's fixed text and the EOS token"""
+        parts = self._compiled()[name]
+        return sum(len(part) for part in parts if not isinstance(part, str)) + 1
+
+    def build(self, name, **fields):
+        """``input_ids`` of template ``name``; field values are token ID lists"""
+        parts = self._compiled()[name]
+        excess = (
+            self.overhead(name)
+            + sum(len(fields[part]) for part in parts if isinstance(part, str))
+            - self.max_length
+        )
+        if excess > 0:
+            longest = max(fields, key=lambda field: len(fields[field]))
+            fields = {**fields, longest: fields[longest][: -excess or None]}
+
+        input_ids = []
+        for part in parts:
+            input_ids.extend(fields[part] if isinstance(part, str) else part)
+        input_ids.append(self.tokenizer.eos_token_id)
+        return input_ids
+
+
+@_instrumented("flan_t5", "generate")
+def query_flan_t5(prompt: str, max_tokens=512, decoding="sample", stop=None):
+    """Query Flan-T5 model for CV analysis tasks.
+
+    ``decoding`` is a FLAN_T5_DECODING mode. ``stop(text)`` may end
+    generation early once it returns True for the text so far.
+    """
     try:
+        flan_tokenizer, flan_model = _flan_t5()
         inputs = flan_tokenizer(
-            prompt, return_tensors="pt", truncation=True, max_length=512
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=FLAN_T5_MAX_INPUT_TOKENS,
         )
         output_ids = flan_model.generate(
-            **inputs, max_new_tokens=max_tokens, do_sample=True, temperature=0.7
+            **inputs,
+            max_new_tokens=max_tokens,
+            **_flan_t5_generate_kwargs(flan_tokenizer, decoding, stop, [max_tokens]),
         )
+        LLM_PROMPT_TOKENS.observe(inputs["input_ids"].shape[-1], model="flan_t5")
+        LLM_GENERATED_TOKENS.observe(output_ids.shape[-1] - 1, model="flan_t5")
         response = flan_tokenizer.decode(output_ids[0], skip_special_tokens=True)
         # Remove the input prompt from response if it's included
         if prompt in response:
@@ -47,52 +485,644 @@ def query_flan_t5(prompt: str, max_tokens=512):
         return "Error generating response"
 
 
-def query_llama2_chat(prompt: str, max_tokens=256):
-    """Query LLaMA 2 model for chat responses using chat template"""
-    if llama_model is None or llama_tokenizer is None:
-        # Fallback to Flan-T5 if LLaMA 2 is not available
-        return query_flan_t5(prompt, max_tokens)
+def _flan_t5_padded(input_ids, pad):
+    """Right-padded (T5 style) input tensors for token ID lists"""
+    width = max(len(ids) for ids in input_ids)
+    return {
+        "input_ids": torch.tensor(
+            [ids + [pad] * (width - len(ids)) for ids in input_ids]
+        ),
+        "attention_mask": torch.tensor(
+            [[1] * len(ids) + [0] * (width - len(ids)) for ids in input_ids]
+        ),
+    }
+
+
+@_instrumented("flan_t5", "batch")
+def query_flan_t5_ids(input_ids, max_tokens=512, decoding="sample", stop=None):
+    """Query Flan-T5 with pre-tokenized prompts in a single padded generate call.
+
+    ``input_ids`` holds one token ID list per prompt, for example from
+    ``PromptAssembler.build``. ``max_tokens`` is either one limit shared by
+    every prompt or a list with one limit per prompt. The batch is generated
+    up to the largest limit and each output is cut back to its own limit, so
+    results match what separate ``query_flan_t5`` calls would return.
+    ``decoding`` and ``stop`` work as in ``query_flan_t5``; ``stop`` may also
+    be a list with one condition per prompt. The batch ends once every
+    prompt's condition holds.
+    """
+    if not input_ids:
+        return []
+    if isinstance(max_tokens, int):
+        max_tokens = [max_tokens] * len(input_ids)
+    if len(max_tokens) != len(input_ids):
+        raise ValueError("max_tokens must have one entry per prompt")
+    if isinstance(stop, list) and len(stop) != len(input_ids):
+        raise ValueError("stop must have one entry per prompt")
 
     try:
-        # Format messages for LLaMA 2 chat template with system role
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a helpful CV analysis assistant. Provide concise, actionable advice for improving CVs and job search strategies.",
-            },
-            {"role": "user", "content": prompt},
-        ]
+        flan_tokenizer, flan_model = _flan_t5()
+        pad = flan_tokenizer.pad_token_id
+        inputs = _flan_t5_padded(input_ids, pad)
+        output_ids = flan_model.generate(
+            **inputs,
+            max_new_tokens=max(max_tokens),
+            **_flan_t5_generate_kwargs(flan_tokenizer, decoding, stop, max_tokens),
+        )
+
+        responses = []
+        for prompt_ids, ids, limit in zip(input_ids, output_ids, max_tokens):
+            LLM_PROMPT_TOKENS.observe(len(prompt_ids), model="flan_t5")
+            LLM_GENERATED_TOKENS.observe(
+                int((ids[1 : limit + 1] != pad).sum()), model="flan_t5"
+            )
+            # Each output starts with the decoder start token
+            responses.append(
+                flan_tokenizer.decode(ids[: limit + 1], skip_special_tokens=True)
+            )
+        return responses
+    except Exception as e:
+        print(f"Error with Flan-T5 batch: {e}")
+        return ["Error generating response"] * len(input_ids)
+
+
+@functools.lru_cache(maxsize=8)
+def _structured_decoder(fields):
+    """StructuredDecoder for a tuple of Fields; building one scans the vocab"""
+    flan_tokenizer, _ = _flan_t5()
+    return StructuredDecoder(flan_tokenizer, fields, FLAN_T5_FIELD_END)
+
+
+@_instrumented("flan_t5", "structured")
+def query_flan_t5_structured(input_ids, fields, decoding="greedy"):
+    """Generate one schema-constrained analysis per pre-tokenized prompt.
+
+    ``fields`` is a sequence of ``constrained.Field``. Returns one dict per
+    prompt with a value for every field (see ``StructuredDecoder.parse``),
+    or None for every prompt if generation fails.
+    """
+    if not input_ids:
+        return []
+    try:
+        flan_tokenizer, flan_model = _flan_t5()
+        decoder = _structured_decoder(tuple(fields))
+        pad = flan_tokenizer.pad_token_id
+        limits = [decoder.max_tokens] * len(input_ids)
+        output_ids = flan_model.generate(
+            **_flan_t5_padded(input_ids, pad),
+            max_new_tokens=decoder.max_tokens,
+            logits_processor=LogitsProcessorList([StructuredLogitsProcessor(decoder)]),
+            **_flan_t5_generate_kwargs(flan_tokenizer, decoding, None, limits),
+        )
+
+        results = []
+        for prompt_ids, ids in zip(input_ids, output_ids):
+            LLM_PROMPT_TOKENS.observe(len(prompt_ids), model="flan_t5")
+            LLM_GENERATED_TOKENS.observe(int((ids[1:] != pad).sum()), model="flan_t5")
+            # Each output starts with the decoder start token
+            results.append(decoder.parse(ids[1:].tolist()))
+        return results
+    except Exception as e:
+        print(f"Error with Flan-T5 structured analysis: {e}")
+        return [None] * len(input_ids)
 
-        # Apply chat template and tokenize
-        inputs = llama_tokenizer.apply_chat_template(
-            messages,
-            add_generation_prompt=True,
-            tokenize=True,
-            return_dict=True,
+
+def query_flan_t5_batch(prompts, max_tokens=512, decoding="sample", stop=None):
+    """Query Flan-T5 with several text prompts in a single padded generate call"""
+    try:
+        flan_tokenizer, _ = _flan_t5()
+        input_ids = flan_tokenizer(
+            prompts, truncation=True, max_length=FLAN_T5_MAX_INPUT_TOKENS
+        )["input_ids"]
+    except Exception as e:
+        print(f"Error with Flan-T5 batch: {e}")
+        return ["Error generating response"] * len(prompts)
+
+    responses = query_flan_t5_ids(input_ids, max_tokens, decoding, stop)
+    # Remove the input prompt from responses that include it
+    return [
+        response.replace(prompt, "").strip() if prompt in response else response
+        for prompt, response in zip(prompts, responses)
+    ]
+
+
+@_instrumented("embedder", "embed")
+def embed_texts(texts, batch_size=32):
+    """Unit-length sentence embeddings of ``texts`` as a float32 NumPy array.
+
+    Token embeddings are mean-pooled over the attention mask, as the
+    sentence-transformers models are trained, so a dot product between two
+    rows is their cosine similarity.
+    """
+    loaded = model_registry.get("embedder")
+    if loaded is None:
+        raise RuntimeError("Sentence-embedding model is not available")
+    tokenizer, model = loaded
+
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start : start + batch_size],
+            padding=True,
+            truncation=True,
+            max_length=EMBEDDING_MAX_INPUT_TOKENS,
             return_tensors="pt",
-        ).to(llama_model.device)
+        )
+        with torch.inference_mode():
+            hidden = model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        batches.append(torch.nn.functional.normalize(pooled, dim=-1))
+    return torch.cat(batches).float().numpy()
+
+
+LLAMA2_SYSTEM_PROMPT = "You are a helpful CV analysis assistant. Provide concise, actionable advice for improving CVs and job search strategies."
+
+
+def _llama2_messages(prompt):
+    """Format messages for LLaMA 2 chat template with system role"""
+    return [
+        {"role": "system", "content": LLAMA2_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _llama2_chat_inputs(llama_tokenizer, llama_model, prompt):
+    """Wrap a prompt in the LLaMA 2 chat template and tokenize it"""
+    return llama_tokenizer.apply_chat_template(
+        _llama2_messages(prompt),
+        add_generation_prompt=True,
+        tokenize=True,
+        return_dict=True,
+        return_tensors="pt",
+    ).to(llama_model.device)
+
+
+def _llama2_sampling_kwargs(llama_tokenizer, max_tokens):
+    """Generation settings shared by the blocking and streaming chat paths"""
+    return {
+        "max_new_tokens": max_tokens,
+        "do_sample": True,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "pad_token_id": llama_tokenizer.eos_token_id,
+    }
+
+
+def _llama2_draft():
+    """Draft model for assisted decoding, or None to decode normally.
+
+    None when LLAMA2_DRAFT_MODEL is unset, when LLaMA 2 does not run on the
+    torch engine, while the draft model is still loading (the first call
+    starts loading it) and if it failed to load.
+    """
+    if not LLAMA2_DRAFT_MODEL or not llama2_engine.shares_kv_cache:
+        return None
+    return model_registry.get("llama2_draft", wait=False)
+
+
+SYSTEM_PREFIX_KEY = "__system__"
+
+
+class PrefixCache:
+    """LRU store of LLaMA 2 KV caches for shared prompt prefixes.
+
+    Each entry holds the token IDs of a prompt prefix and the key/value
+    tensors computed for them. A later prompt that starts with the same
+    tokens only needs to prefill its remaining tokens. Entries are evicted
+    least recently used first once their tensors exceed ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (token IDs, past_key_values, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, input_ids):
+        """Cached ``(prefix_length, past_key_values)`` usable for ``input_ids``"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token_ids, past, _ = entry
+                if len(token_ids) < len(input_ids) and (
+                    tuple(input_ids[: len(token_ids)]) == token_ids
+                ):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return len(token_ids), past
+            self.misses += 1
+            return None
+
+    def put(self, key, token_ids, past):
+        nbytes = sum(t.numel() * t.element_size() for layer in past for t in layer)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (tuple(token_ids), past, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        """Drop the entry for ``key`` (e.g. when its analysis is deleted)"""
+        with self._lock:
+            self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+
+prefix_cache = PrefixCache(
+    max_bytes=int(float(os.environ.get("PREFIX_CACHE_MAX_MB", "1024")) * 1024**2)
+)
+
+
+def _llama2_prefill_inputs(llama_tokenizer, llama_model, prompt, prefix_key, prefix):
+    """Tokenized chat inputs, reusing the cached KV tensors of the prompt prefix.
+
+    The cacheable prefix is the chat template up to and including ``prefix``
+    (which ``prompt`` must start with). On a cache miss the prefix is
+    prefilled once and stored under ``prefix_key``. Engines that keep the KV
+    cache to themselves prefill the whole prompt. The returned dict can be
+    passed straight to ``generate``.
+    """
+    inputs = _llama2_chat_inputs(llama_tokenizer, llama_model, prompt)
+    if prefix_cache.max_bytes <= 0 or not llama2_engine.shares_kv_cache:
+        return inputs
+
+    input_ids = inputs["input_ids"][0].tolist()
+    cached = prefix_cache.get(prefix_key, input_ids)
+    if cached is None:
+        rendered = llama_tokenizer.apply_chat_template(
+            _llama2_messages(prompt), add_generation_prompt=True, tokenize=False
+        )
+        start = rendered.find(prompt.strip()[:64])
+        if start < 0:
+            return inputs
+        end = start + len(prefix.lstrip())
+        prefix_ids = llama_tokenizer(rendered[:end], add_special_tokens=False)[
+            "input_ids"
+        ]
+        # The last prefix token may merge differently with the text after it;
+        # keep only the tokens both tokenizations agree on
+        length = 0
+        for cached_id, input_id in zip(prefix_ids, input_ids[:-1]):
+            if cached_id != input_id:
+                break
+            length += 1
+        if length == 0:
+            return inputs
 
-        # Generate response
         with torch.no_grad():
-            outputs = llama_model.generate(
-                **inputs,
-                max_new_tokens=max_tokens,
-                do_sample=True,
-                temperature=0.7,
-                top_p=0.9,
-                pad_token_id=llama_tokenizer.eos_token_id,
+            outputs = llama_model(
+                input_ids=inputs["input_ids"][:, :length], use_cache=True
+            )
+        past = outputs.past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        prefix_cache.put(prefix_key, input_ids[:length], past)
+        cached = (length, past)
+
+    # generate() only feeds the tokens after the cached prefix to the model
+    inputs["past_key_values"] = cached[1]
+    return inputs
+
+
+class ChatBatcher:
+    """Dynamic batching scheduler for concurrent LLaMA 2 chat requests.
+
+    Requests wait up to ``max_wait_ms`` for others to arrive; up to
+    ``max_batch_size`` prompts are then left-padded and generated together.
+    Rows that reach EOS stop early, and each caller gets back only its own
+    output, cut to its own ``max_tokens``. A batch is cut off at the latest
+    deadline of its requests, if they all have one.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=20):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, prompt, max_tokens):
+        """Queue a prompt and block until its response is ready"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="chat-batcher", daemon=True
+                )
+                self._thread.start()
+        future = Future()
+        self._queue.put((prompt, max_tokens, current_deadline(), future))
+        return future.result()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": (
+                round(self.requests / self.batches, 2) if self.batches else 0.0
+            ),
+        }
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        prompts = [prompt for prompt, _, _, _ in batch]
+        limits = [max_tokens for _, max_tokens, _, _ in batch]
+        deadlines = [deadline for _, _, deadline, _ in batch]
+        deadline = None if None in deadlines else max(deadlines)
+        try:
+            llama_tokenizer, llama_model = model_registry.get("llama2")
+            texts = [
+                llama_tokenizer.apply_chat_template(
+                    _llama2_messages(prompt),
+                    add_generation_prompt=True,
+                    tokenize=False,
+                )
+                for prompt in prompts
+            ]
+            # The rendered template already contains the BOS token
+            inputs = llama_tokenizer(
+                texts, return_tensors="pt", padding=True, add_special_tokens=False
+            ).to(llama_model.device)
+
+            with torch.no_grad():
+                outputs = llama_model.generate(
+                    **inputs,
+                    **_llama2_sampling_kwargs(llama_tokenizer, max(limits)),
+                    **_deadline_kwargs("llama2", deadline),
+                )
+
+            prompt_length = inputs["input_ids"].shape[-1]
+            for (_, limit, _, future), output, mask in zip(
+                batch, outputs, inputs["attention_mask"]
+            ):
+                generated = output[prompt_length : prompt_length + limit]
+                LLM_PROMPT_TOKENS.observe(int(mask.sum()), model="llama2")
+                LLM_GENERATED_TOKENS.observe(
+                    int((generated != llama_tokenizer.pad_token_id).sum()),
+                    model="llama2",
+                )
+                response = llama_tokenizer.decode(
+                    generated,
+                    skip_special_tokens=True,
+                )
+                future.set_result(response.strip())
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        self.batches += 1
+        self.requests += len(batch)
+
+
+def _chat_batcher_from_env():
+    """ChatBatcher configured by CHAT_MAX_BATCH_SIZE / CHAT_BATCH_WAIT_MS.
+
+    Batching is off (None) unless CHAT_MAX_BATCH_SIZE is greater than 1.
+    """
+    max_batch_size = int(os.environ.get("CHAT_MAX_BATCH_SIZE", "1"))
+    if max_batch_size <= 1:
+        return None
+    return ChatBatcher(
+        max_batch_size=max_batch_size,
+        max_wait_ms=float(os.environ.get("CHAT_BATCH_WAIT_MS", "20")),
+    )
+
+
+chat_batcher = _chat_batcher_from_env()
+
+
+@_instrumented("llama2", "chat")
+def query_llama2_chat(
+    prompt: str,
+    max_tokens=256,
+    prefix_key=SYSTEM_PREFIX_KEY,
+    prefix="",
+    with_model=False,
+):
+    """Query LLaMA 2 model for chat responses using chat template.
+
+    When LLaMA 2 is not loaded or fails, Flan-T5 answers instead. With
+    ``with_model`` the result is ``(response, model)``, where ``model`` is
+    "llama2" or "flan_t5" and says which of them wrote the response.
+
+    ``prefix`` is the start of ``prompt`` that repeats across requests with
+    the same ``prefix_key`` (for example the CV details of one analysis); its
+    KV cache is reused so only the rest of the prompt is prefilled. With the
+    defaults only the fixed system prompt is shared.
+
+    With a draft model loaded (LLAMA2_DRAFT_MODEL) and batching off, the
+    reply is generated with assisted decoding instead.
+    """
+    response, model = _query_llama2_chat(prompt, max_tokens, prefix_key, prefix)
+    return (response, model) if with_model else response
+
+
+def _query_llama2_chat(prompt, max_tokens, prefix_key, prefix):
+    """query_llama2_chat as ``(response, model that wrote it)``"""
+    # Never block a chat request on the 7B model: while it is still loading
+    # (or if it failed to load) fall back to Flan-T5
+    loaded = model_registry.get("llama2", wait=False)
+    if loaded is None:
+        LLM_FALLBACKS.inc(from_model="llama2", to_model="flan_t5", reason="not_ready")
+        return query_flan_t5(prompt, max_tokens), "flan_t5"
+    llama_tokenizer, llama_model = loaded
+
+    try:
+        if chat_batcher is not None:
+            return chat_batcher.submit(prompt, max_tokens), "llama2"
+
+        generate_kwargs = _llama2_sampling_kwargs(llama_tokenizer, max_tokens)
+        generate_kwargs.update(_deadline_kwargs("llama2"))
+        draft_model = _llama2_draft()
+        if draft_model is not None:
+            # The draft model keeps its own KV cache and cannot start from a
+            # cached LLaMA 2 prefix, so assisted decoding prefills in full
+            inputs = _llama2_chat_inputs(llama_tokenizer, llama_model, prompt)
+            generate_kwargs["assistant_model"] = draft_model
+        else:
+            inputs = _llama2_prefill_inputs(
+                llama_tokenizer, llama_model, prompt, prefix_key, prefix
             )
 
+        # Generate response
+        with torch.no_grad():
+            outputs = llama_model.generate(**inputs, **generate_kwargs)
+
         # Decode only the generated part (exclude input)
+        prompt_length = inputs["input_ids"].shape[-1]
+        LLM_PROMPT_TOKENS.observe(prompt_length, model="llama2")
+        LLM_GENERATED_TOKENS.observe(outputs.shape[-1] - prompt_length, model="llama2")
         response = llama_tokenizer.decode(
-            outputs[0][inputs["input_ids"].shape[-1] :], skip_special_tokens=True
+            outputs[0][prompt_length:], skip_special_tokens=True
         )
-        return response.strip()
+        return response.strip(), "llama2"
 
     except Exception as e:
         print(f"Error with LLaMA 2: {e}")
         # Fallback to Flan-T5
-        return query_flan_t5(prompt, max_tokens)
+        LLM_FALLBACKS.inc(from_model="llama2", to_model="flan_t5", reason="error")
+        return query_flan_t5(prompt, max_tokens), "flan_t5"
+
+
+def _stream_generate(model, tokenizer, inputs, **generate_kwargs):
+    """Run ``model.generate`` in a thread and yield decoded text as it arrives.
+
+    Closing the generator early (the client went away) stops generation at
+    the next decoding step and waits for the thread, so the model is idle
+    again once ``close()`` returns.
+    """
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+    cancelled = threading.Event()
+    criteria = StoppingCriteriaList(generate_kwargs.pop("stopping_criteria", []))
+    criteria.append(CancelCriteria(cancelled))
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(
+                    **inputs,
+                    streamer=streamer,
+                    stopping_criteria=criteria,
+                    **generate_kwargs,
+                )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # unblock the consumer
+
+    thread = threading.Thread(target=run, name="generate-stream", daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        cancelled.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def stream_flan_t5(prompt: str, max_tokens=512):
+    """Streaming variant of query_flan_t5: yields text chunks as they decode"""
+    try:
+        flan_tokenizer, flan_model = _flan_t5()
+        inputs = flan_tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=FLAN_T5_MAX_INPUT_TOKENS,
+        )
+        yield from _stream_generate(
+            flan_model,
+            flan_tokenizer,
+            inputs,
+            max_new_tokens=max_tokens,
+            do_sample=True,
+            temperature=0.7,
+            **_deadline_kwargs("flan_t5"),
+        )
+    except Exception as e:
+        print(f"Error with Flan-T5: {e}")
+        yield "Error generating response"
+
+
+def stream_llama2_chat(
+    prompt: str,
+    max_tokens=256,
+    prefix_key=SYSTEM_PREFIX_KEY,
+    prefix="",
+    with_model=False,
+):
+    """Streaming variant of query_llama2_chat: yields text chunks as they decode.
+
+    Falls back to Flan-T5 like query_llama2_chat, as long as LLaMA 2 fails
+    before producing any text. With ``with_model`` it yields ``(model, text)``
+    pairs instead, and a final ``(None, "")`` when LLaMA 2 failed part way
+    through, so the reply is incomplete.
+    """
+    pairs = _stream_llama2_chat(prompt, max_tokens, prefix_key, prefix)
+    with closing(pairs):
+        for model, text in pairs:
+            if with_model:
+                yield model, text
+            elif text:
+                yield text
+
+
+def _stream_llama2_chat(prompt, max_tokens, prefix_key, prefix):
+    """stream_llama2_chat as ``(model, text)`` pairs"""
+    loaded = model_registry.get("llama2", wait=False)
+    if loaded is None:
+        LLM_FALLBACKS.inc(from_model="llama2", to_model="flan_t5", reason="not_ready")
+        with closing(stream_flan_t5(prompt, max_tokens)) as texts:
+            for text in texts:
+                yield "flan_t5", text
+        return
+    llama_tokenizer, llama_model = loaded
+
+    produced = False
+    try:
+        inputs = _llama2_prefill_inputs(
+            llama_tokenizer, llama_model, prompt, prefix_key, prefix
+        )
+        texts = _stream_generate(
+            llama_model,
+            llama_tokenizer,
+            inputs,
+            **_llama2_sampling_kwargs(llama_tokenizer, max_tokens),
+            **_deadline_kwargs("llama2"),
+        )
+        with closing(texts):
+            for text in texts:
+                produced = True
+                yield "llama2", text
+    except Exception as e:
+        print(f"Error with LLaMA 2: {e}")
+        if produced:
+            yield None, ""
+        else:
+            # Fallback to Flan-T5
+            LLM_FALLBACKS.inc(from_model="llama2", to_model="flan_t5", reason="error")
+            with closing(stream_flan_t5(prompt, max_tokens)) as texts:
+                for text in texts:
+                    yield "flan_t5", text
 
 
 def query_hf_model(prompt: str, max_tokens=512):
@@ -0,0 +1,239 @@
+"""
+Client for model_server.py with the same call signatures as llm.py
+
+When MODEL_SERVER_SOCKET is set, app.py imports its model functions from
+here instead of from llm.py. Each call is forwarded to the model server
+process over a pooled Unix-socket connection, so web workers hold no model
+weights. Failures follow llm.py's conventions: the query functions return
+"Error generating response", and ``embed_texts`` and the streaming call
+raise. A call whose pooled connection has gone away, for example after a
+model server restart, is retried once on a fresh connection.
+
+Set MODEL_SERVER_AUTHKEY to the same value for the server and its clients
+to authenticate connections. MODEL_CLIENT_POOL_SIZE caps idle connections
+per web worker. Every call carries the request's admission deadline, so the
+server cuts generation off at the same time llm.py would.
+"""
+
+import os
+import queue
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from admission import current_deadline
+from llm import SYSTEM_PREFIX_KEY
+
+MODEL_SERVER_SOCKET = os.environ.get(
+    "MODEL_SERVER_SOCKET", "/tmp/cv-grinder-models.sock"
+)
+MODEL_SERVER_AUTHKEY = os.environ.get("MODEL_SERVER_AUTHKEY", "").encode() or None
+MODEL_CLIENT_POOL_SIZE = int(os.environ.get("MODEL_CLIENT_POOL_SIZE", "8"))
+
+ERROR_RESPONSE = "Error generating response"
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the model server is unreachable or a call fails there"""
+
+
+_idle = queue.LifoQueue(maxsize=MODEL_CLIENT_POOL_SIZE)
+
+
+@contextmanager
+def _connection(fresh=False):
+    """Borrow a connection to the model server; broken ones are discarded"""
+    conn = None
+    if not fresh:
+        try:
+            conn = _idle.get_nowait()
+        except queue.Empty:
+            pass
+    if conn is None:
+        try:
+            conn = Client(
+                MODEL_SERVER_SOCKET, family="AF_UNIX", authkey=MODEL_SERVER_AUTHKEY
+            )
+        except (AuthenticationError, OSError) as e:
+            raise ModelServerError(f"Model server unavailable: {e}")
+
+    try:
+        yield conn
+    except BaseException:
+        conn.close()
+        raise
+    try:
+        _idle.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def _call(name, *args, **kwargs):
+    """Run ``name`` on the model server and return its result"""
+    for attempt in range(2):
+        try:
+            with _connection(fresh=attempt > 0) as conn:
+                conn.send((name, args, kwargs, current_deadline()))
+                status, value = conn.recv()
+        except (EOFError, OSError) as e:
+            if attempt == 0:
+                continue
+            raise ModelServerError(f"Model server connection lost: {e}")
+        if status == "error":
+            raise ModelServerError(value)
+        return value
+
+
+def _stream(name, *args, **kwargs):
+    """Run a streaming call on the model server, yielding its items.
+
+    The connection is closed rather than reused if the caller stops early,
+    since the rest of the stream is still in flight.
+    """
+    with _connection() as conn:
+        try:
+            conn.send((name, args, kwargs, current_deadline()))
+            while True:
+                status, value = conn.recv()
+                if status == "chunk":
+                    yield value
+                elif status == "done":
+                    return
+                else:
+                    raise ModelServerError(value)
+        except (EOFError, OSError) as e:
+            raise ModelServerError(f"Model server connection lost: {e}")
+
+
+def query_flan_t5(prompt: str, max_tokens=512, decoding="sample", stop=None):
+    """llm.query_flan_t5, run on the model server"""
+    try:
+        return _call("query_flan_t5", prompt, max_tokens, decoding, stop)
+    except ModelServerError as e:
+        print(f"Error with model server: {e}")
+        return ERROR_RESPONSE
+
+
+def query_flan_t5_ids(input_ids, max_tokens=512, decoding="sample", stop=None):
+    """llm.query_flan_t5_ids, run on the model server"""
+    try:
+        return _call("query_flan_t5_ids", input_ids, max_tokens, decoding, stop)
+    except ModelServerError as e:
+        print(f"Error with model server: {e}")
+        return [ERROR_RESPONSE] * len(input_ids)
+
+
+def query_flan_t5_structured(input_ids, fields, decoding="greedy"):
+    """llm.query_flan_t5_structured, run on the model server"""
+    try:
+        return _call("query_flan_t5_structured", input_ids, fields, decoding)
+    except ModelServerError as e:
+        print(f"Error with model server: {e}")
+        return [None] * len(input_ids)
+
+
+def query_llama2_chat(
+    prompt: str,
+    max_tokens=256,
+    prefix_key=SYSTEM_PREFIX_KEY,
+    prefix="",
+    with_model=False,
+):
+    """llm.query_llama2_chat, run on the model server"""
+    try:
+        return _call(
+            "query_llama2_chat", prompt, max_tokens, prefix_key, prefix, with_model
+        )
+    except ModelServerError as e:
+        print(f"Error with model server: {e}")
+        return (ERROR_RESPONSE, None) if with_model else ERROR_RESPONSE
+
+
+def stream_llama2_chat(
+    prompt: str,
+    max_tokens=256,
+    prefix_key=SYSTEM_PREFIX_KEY,
+    prefix="",
+    with_model=False,
+):
+    """llm.stream_llama2_chat, run on the model server"""
+    yield from _stream(
+        "stream_llama2_chat", prompt, max_tokens, prefix_key, prefix, with_model
+    )
+
+
+def query_hf_model(prompt: str, max_tokens=512):
+    """llm.query_hf_model, run on the model server"""
+    try:
+        return _call("query_hf_model", prompt, max_tokens)
+    except ModelServerError as e:
+        print(f"Error with model server: {e}")
+        return ERROR_RESPONSE
+
+
+def embed_texts(texts, batch_size=32):
+    """llm.embed_texts, run on the model server"""
+    return _call("embed_texts", texts, batch_size)
+
+
+class RemoteModelRegistry:
+    """The model server's ModelRegistry, as seen from a web worker"""
+
+    def __init__(self):
+        self._names = ("flan_t5", "llama2")
+
+    def status(self):
+        try:
+            status = _call("registry_status")
+        except ModelServerError as e:
+            return {
+                name: {"state": "unreachable", "error": str(e)} for name in self._names
+            }
+        self._names = tuple(status)
+        return status
+
+    def state(self, name):
+        try:
+            return _call("registry_state", name)
+        except ModelServerError:
+            return "unreachable"
+
+    def warm_up(self, names=None, background=True):
+        """Start loading models on the server; it always loads in the background"""
+        try:
+            _call("registry_warm_up", names)
+        except ModelServerError as e:
+            print(f"⚠️ Warning: Could not warm up models on the model server: {e}")
+
+
+class RemotePrefixCache:
+    """The model server's PrefixCache, as seen from a web worker"""
+
+    def stats(self):
+        try:
+            return _call("prefix_cache_stats")
+        except ModelServerError as e:
+            return {"error": str(e)}
+
+    def invalidate(self, key):
+        try:
+            _call("prefix_cache_invalidate", key)
+        except ModelServerError as e:
+            print(f"⚠️ Warning: Could not invalidate prefix cache entry: {e}")
+
+
+model_registry = RemoteModelRegistry()
+prefix_cache = RemotePrefixCache()
+
+
+def warm_up_from_env():
+    """No-op: the model server applies MODEL_WARMUP when it starts"""
+
+
+def render_server_metrics():
+    """The model server's LLM metrics, or nothing if it is unreachable"""
+    try:
+        return _call("metrics")
+    except ModelServerError as e:
+        print(f"⚠️ Warning: Could not fetch model server metrics: {e}")
+        return ""
@@ -0,0 +1,282 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and histograms
+
+Metrics register themselves in a module-level registry and are rendered in
+the Prometheus text exposition format by ``render()``, which app.py serves
+on /metrics. Updates take one small lock per metric and do no formatting,
+so they are cheap enough to sit on the inference hot path.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+_registry = []
+
+# Latency buckets in seconds: from parsing work (ms) up to CPU LLM passes (minutes)
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    120,
+    300,
+)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """Count the enclosed block as in flight while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of ``time``"""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def render(self):
+        with self._lock:
+            values = {
+                key: (list(state[0]), state[1], state[2])
+                for key, state in self._values.items()
+            }
+        lines = self._header()
+        bounds = self.buckets + (float("inf"),)
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    self.labelnames, key, [("le", _format_value(bound))]
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render(only=None, exclude=()):
+    """Registered metrics in the Prometheus text exposition format.
+
+    ``only`` and ``exclude`` select metrics by name; by default all are
+    rendered.
+    """
+    lines = []
+    for metric in _registry:
+        if (only is None or metric.name in only) and metric.name not in exclude:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Shared metrics recorded by llm.py and app.py
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Wall-clock time of LLM calls",
+    ["model", "call"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight", "LLM calls currently running", ["model", "call"]
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Prompt tokens per LLM sequence",
+    ["model"],
+    buckets=TOKEN_BUCKETS,
+)
+LLM_GENERATED_TOKENS = Histogram(
+    "llm_generated_tokens",
+    "Generated tokens per LLM sequence",
+    ["model"],
+    buckets=TOKEN_BUCKETS,
+)
+LLM_FALLBACKS = Counter(
+    "llm_fallback_total",
+    "Chat requests served by a fallback model",
+    ["from_model", "to_model", "reason"],
+)
+LLM_DEADLINE_STOPS = Counter(
+    "llm_deadline_stops_total",
+    "Generations cut off because their request deadline passed",
+    ["model"],
+)
+MODEL_MEMORY_BYTES = Gauge(
+    "model_memory_bytes", "Memory held by loaded model weights", ["model"]
+)
+# Recorded by the process that runs the models: the model server, if one is used
+MODEL_METRICS = (
+    LLM_REQUEST_SECONDS.name,
+    LLM_IN_FLIGHT.name,
+    LLM_PROMPT_TOKENS.name,
+    LLM_GENERATED_TOKENS.name,
+    LLM_FALLBACKS.name,
+    LLM_DEADLINE_STOPS.name,
+    MODEL_MEMORY_BYTES.name,
+)
+ANALYSIS_STAGE_SECONDS = Histogram(
+    "analysis_stage_duration_seconds",
+    "Wall-clock time of each CV analysis stage",
+    ["stage"],
+)
+ANALYSIS_FALLBACKS = Counter(
+    "analysis_fallback_total",
+    "Analysis stages that returned the hard-coded fallback result",
+    ["stage"],
+)
+EXTRACTION_SECONDS = Histogram(
+    "cv_extraction_duration_seconds",
+    "Time to extract text from an uploaded CV file",
+    ["format"],
+)
+CHAT_TTFT_SECONDS = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Time to the first generated chat token",
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests shed with HTTP 503 because a model was overloaded or too slow",
+    ["model", "reason"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requests waiting for a model slot", ["model"]
+)
+CHAT_CACHE_LOOKUPS = Counter(
+    "chat_cache_lookups_total",
+    "Context-free chat questions looked up in the response cache",
+    ["result"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Flask request handling time",
+    ["endpoint", "status"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Flask requests currently being handled", ["endpoint"]
+)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Inference server process that owns the models for all web workers
+
+Without it, every gunicorn worker imports llm.py and loads its own copy of
+Flan-T5 and LLaMA 2. Instead, run ``python model_server.py`` once per host
+and start the web workers with MODEL_SERVER_SOCKET set to the same path.
+The workers then forward their model calls through llm_client.py. The host
+holds one set of weights, and chat requests from every worker share one
+ChatBatcher queue and one prefix KV cache.
+
+Requests arrive on a Unix socket through multiprocessing.connection, which
+frames the messages and, with MODEL_SERVER_AUTHKEY set, authenticates
+clients. The socket is created readable and writable by its owner only.
+Each connection is served by its own thread. torch releases the GIL while
+it computes, so requests from different workers overlap just like the
+request threads of a single Flask process. MODEL_WARMUP is applied at
+startup. Each request is run under the deadline its client sent, so
+generation stops when the web request's deadline passes.
+"""
+
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import llm
+import metrics
+from admission import deadline_scope
+from llm_client import MODEL_SERVER_AUTHKEY, MODEL_SERVER_SOCKET
+
+# Calls a client can make, each returning one result
+CALLS = {
+    "query_flan_t5": llm.query_flan_t5,
+    "query_flan_t5_ids": llm.query_flan_t5_ids,
+    "query_flan_t5_structured": llm.query_flan_t5_structured,
+    "query_llama2_chat": llm.query_llama2_chat,
+    "query_hf_model": llm.query_hf_model,
+    "embed_texts": llm.embed_texts,
+    "registry_status": llm.model_registry.status,
+    "registry_state": llm.model_registry.state,
+    "registry_warm_up": lambda names: llm.model_registry.warm_up(names),
+    "prefix_cache_stats": llm.prefix_cache.stats,
+    "prefix_cache_invalidate": llm.prefix_cache.invalidate,
+    "metrics": lambda: metrics.render(only=metrics.MODEL_METRICS),
+}
+
+# Calls that yield their results one at a time
+STREAMS = {
+    "stream_llama2_chat": llm.stream_llama2_chat,
+}
+
+
+def serve_connection(conn):
+    """Answer one client's requests, in order, until it disconnects"""
+    with conn:
+        while True:
+            try:
+                name, args, kwargs, deadline = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if name in STREAMS:
+                    stream = STREAMS[name](*args, **kwargs)
+                    try:
+                        with deadline_scope(deadline):
+                            for item in stream:
+                                conn.send(("chunk", item))
+                    finally:
+                        # Stops generation if the client went away mid-stream
+                        stream.close()
+                    conn.send(("done", None))
+                elif name in CALLS:
+                    with deadline_scope(deadline):
+                        result = CALLS[name](*args, **kwargs)
+                    conn.send(("ok", result))
+                else:
+                    conn.send(("error", f"Unknown call: {name}"))
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                print(f"❌ Model server call {name} failed: {e}")
+                conn.send(("error", str(e)))
+
+
+def main():
+    if os.path.exists(MODEL_SERVER_SOCKET):
+        # Left behind by a previous run
+        os.remove(MODEL_SERVER_SOCKET)
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(
+            MODEL_SERVER_SOCKET, family="AF_UNIX", authkey=MODEL_SERVER_AUTHKEY
+        )
+    finally:
+        os.umask(umask)
+
+    llm.warm_up_from_env()
+    print(f"🚀 Model server listening on {MODEL_SERVER_SOCKET}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                print(f"⚠️ Rejected model server client: {e}")
+                continue
+            threading.Thread(
+                target=serve_connection, args=(conn,), name="model-client", daemon=True
+            ).start()
+    except KeyboardInterrupt:
+        print("👋 Model server stopped")
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()
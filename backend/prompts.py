@@ -0,0 +1,66 @@
+"""
+Prompt templates for the Flan-T5 analysis stages
+
+Kept apart from app.py so benchmarks can use the production prompts
+without importing the app, which opens the store, starts worker threads
+and purges stale cache entries. Each template has a {cv_text} field;
+QUESTIONS_PROMPT also has {role}.
+"""
+
+KEYWORDS_PROMPT = """
+    Extract technical skills, programming languages, frameworks, and tools mentioned in this CV.
+    Return only a comma-separated list of keywords.
+    
+    CV Text: {cv_text}
+    
+    Keywords:"""
+
+ROLE_PROMPT = """
+    Based on this CV, what is the most likely job role/position this person is applying for?
+    Return only the job title (e.g., "Software Engineer", "Data Scientist", "Product Manager").
+    
+    CV Text: {cv_text}
+    
+    Job Role:"""
+
+SUGGESTIONS_PROMPT = """
+    Analyze this CV and provide 4 specific improvement suggestions.
+    Focus on content, formatting, and missing elements.
+    Write each suggestion as one sentence.
+    
+    CV Text: {cv_text}
+    
+    Suggestions:"""
+
+QUESTIONS_PROMPT = """
+    Generate 5 interview questions for a {role} position based on this CV.
+    Focus on the candidate's experience and skills mentioned in the CV.
+    
+    CV Text: {cv_text}
+    Role: {role}
+    
+    Questions:"""
+
+STRENGTHS_PROMPT = """
+    Analyze this CV and identify:
+    1. Three main strengths
+    2. Three areas that need improvement
+    
+    Format your response as:
+    STRENGTHS:
+    - strength 1
+    - strength 2
+    - strength 3
+    AREAS TO IMPROVE:
+    - area 1
+    - area 2  
+    - area 3
+    
+    CV Text: {cv_text}"""
+
+STRUCTURED_PROMPT = """
+    Analyze this CV. Give its technical skills, the most likely job role,
+    4 improvement suggestions, 3 strengths, 3 areas to improve and
+    5 interview questions for that role.
+    
+    CV Text: {cv_text}"""
@@ -0,0 +1,106 @@
+"""
+Per-analysis passage index for retrieval-augmented chat
+
+When a CV is analyzed, its text is split into short passages along section
+boundaries and each passage is embedded once. The passages and their
+embeddings are stored with the analysis. Each chat turn about that analysis
+embeds only the user's question. A NumPy dot product against the stored
+embeddings then picks the few passages worth putting in the LLaMA prompt,
+so the prompt stays small however long the CV is.
+
+CHAT_RETRIEVAL_K passages are retrieved per turn (0 turns retrieval and
+indexing off). Passages scoring below CHAT_RETRIEVAL_MIN_SCORE are left
+out, and RETRIEVAL_PASSAGE_WORDS caps the length of each passage.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from chunking import is_section_heading, split_sections
+
+CHAT_RETRIEVAL_K = int(os.environ.get("CHAT_RETRIEVAL_K", "3"))
+CHAT_RETRIEVAL_MIN_SCORE = float(os.environ.get("CHAT_RETRIEVAL_MIN_SCORE", "0.2"))
+RETRIEVAL_PASSAGE_WORDS = int(os.environ.get("RETRIEVAL_PASSAGE_WORDS", "80"))
+
+
+def split_passages(cv_text, max_words=RETRIEVAL_PASSAGE_WORDS):
+    """Split CV text into passages of about ``max_words`` words.
+
+    Short sections become one passage each. Longer sections are split
+    between lines, and lines that are too long are split between words.
+    Every passage after the first in a section starts with the section
+    heading, so it still says which part of the CV it comes from. The
+    heading counts towards ``max_words``, and a passage never holds only
+    the heading.
+    """
+    passages = []
+    for section in split_sections(cv_text):
+        lines = [line.strip() for line in section.splitlines() if line.strip()]
+        heading = lines[0] if is_section_heading(lines[0]) else None
+        seed = heading.split() if heading else []
+        if len(seed) >= max_words:
+            seed = []  # No room to repeat it
+
+        words = list(seed)
+        for line in lines[1:] if seed else lines:
+            line_words = line.split()
+            if len(words) + len(line_words) > max_words >= len(seed) + len(line_words):
+                # The line fits in a passage of its own: start one
+                if len(words) > len(seed):
+                    passages.append(" ".join(words))
+                    words = list(seed)
+            while len(words) + len(line_words) > max_words:
+                # The line is too long for any passage: fill this one up
+                take = max_words - len(words)
+                words.extend(line_words[:take])
+                line_words = line_words[take:]
+                passages.append(" ".join(words))
+                words = list(seed)
+            words.extend(line_words)
+        if len(words) > len(seed):
+            passages.append(" ".join(words))
+    return passages
+
+
+class PassageIndex:
+    """CV passages and their unit-length embeddings, searched by dot product"""
+
+    def __init__(self, passages, embeddings):
+        self.passages = list(passages)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    @classmethod
+    def build(cls, cv_text, embed):
+        """Index ``cv_text``; ``embed(texts)`` returns one row per text"""
+        passages = split_passages(cv_text)
+        if not passages:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        return cls(passages, embed(passages))
+
+    def search(self, query_embedding, k=CHAT_RETRIEVAL_K, min_score=None):
+        """Top ``k`` ``(passage, score)`` pairs for a query, best first"""
+        if min_score is None:
+            min_score = CHAT_RETRIEVAL_MIN_SCORE
+        if not self.passages or k <= 0:
+            return []
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        k = min(k, len(scores))
+        # Partial sort: only the k best scores are ordered
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (self.passages[i], float(scores[i])) for i in top if scores[i] >= min_score
+        ]
+
+    def to_record(self):
+        """``(passages_json, dim, embeddings_bytes)`` for storage"""
+        dim = self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+        return json.dumps(self.passages), dim, self.embeddings.tobytes()
+
+    @classmethod
+    def from_record(cls, passages_json, dim, embeddings_bytes):
+        passages = json.loads(passages_json)
+        embeddings = np.frombuffer(embeddings_bytes, dtype=np.float32)
+        return cls(passages, embeddings.reshape(len(passages), dim))
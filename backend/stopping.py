@@ -0,0 +1,108 @@
+"""
+Stop conditions for analysis generation, and the item splitting they share
+with the parsers in app.py
+
+Flan-T5's vocabulary has no newline token, so its list items are told
+apart by what it can write: commas between keywords, "?" after a question,
+sentence ends between suggestions and "-" bullets under STRENGTHS: /
+AREAS TO IMPROVE: headings, all on one line. A "\\n" still separates items,
+so responses written one item per line parse the same way.
+
+Each condition is called with the text generated so far for one prompt and
+returns True once the stage's parser has everything it will use: N
+keywords, N questions, N suggestions or N bullets in the AREAS TO IMPROVE
+block. llm.py checks them after every decoding step, so generation ends
+there instead of running on to ``max_new_tokens``.
+
+Only text before the last separator counts, because the item after it may
+still be growing. The conditions are plain picklable objects, so they can
+be sent to the model server with a request.
+"""
+
+import re
+
+# Regex separators for split_items and ItemsComplete
+COMMA = r",|\n"
+QUESTION_END = r"(?<=\?)|\n"
+# A sentence end followed by a space, so "Node.js" and "3.5" stay whole
+SENTENCE_END = r"(?<=[.!?])\s+|\n"
+
+# Numbering or a bullet in front of an item ("1.", "2)", "-", "•", "*")
+_ITEM_MARKER = re.compile(r"^(?:\d+[.)]|[-•*])\s*")
+
+
+def clean_item(item):
+    """An item without surrounding space and leading numbering or bullet"""
+    return _ITEM_MARKER.sub("", item.strip()).strip()
+
+
+def split_items(text, separator):
+    """The non-empty items of ``text`` split at the regex ``separator``"""
+    items = (clean_item(item) for item in re.split(separator, text))
+    return [item for item in items if item]
+
+
+def section_items(text, headings, bullets=("-", "•")):
+    """``[(HEADING, items)]`` for each of ``headings`` found in ``text``.
+
+    Headings may sit anywhere, not just at a line start, and an item starts
+    at a bullet at the start of the text or after whitespace, so hyphenated
+    words are not split. Items are in order; empty ones are kept, so the
+    last item of the last section is the one that may still be growing.
+    """
+    heading_pattern = "|".join(re.escape(heading) for heading in headings)
+    bullet_pattern = "|".join(re.escape(bullet) for bullet in bullets)
+    parts = re.split(
+        rf"({heading_pattern})|(?:^|(?<=\s))(?:{bullet_pattern})",
+        text,
+        flags=re.IGNORECASE,
+    )
+    sections = []
+    # re.split alternates text and the captured heading (None for a bullet)
+    for index, part in enumerate(parts):
+        if index % 2:
+            if part is not None:
+                sections.append((part.upper(), []))
+            elif sections:
+                sections[-1][1].append("")
+        elif sections and sections[-1][1]:
+            sections[-1][1][-1] += part
+    return [(heading, [item.strip() for item in items]) for heading, items in sections]
+
+
+class ItemsComplete:
+    """Done once ``count`` non-empty items are followed by ``separator``.
+
+    ``separator`` is a regex, as for split_items. With ``must_contain`` set,
+    only items containing that text are counted.
+    """
+
+    def __init__(self, separator, count, must_contain=None):
+        self.separator = separator
+        self.count = count
+        self.must_contain = must_contain
+
+    def __call__(self, text):
+        complete = 0
+        for item in re.split(self.separator, text)[:-1]:
+            if self.must_contain is not None and self.must_contain not in item:
+                continue
+            if clean_item(item):
+                complete += 1
+        return complete >= self.count
+
+
+class SectionComplete:
+    """Done once the block under one of ``headings`` has ``count`` bullets"""
+
+    def __init__(self, headings, count, bullets=("-", "•")):
+        self.headings = tuple(headings)
+        self.count = count
+        self.bullets = tuple(bullets)
+
+    def __call__(self, text):
+        sections = section_items(text, self.headings, self.bullets)
+        if not sections:
+            return False
+        items = sections[-1][1][:-1]
+        return sum(1 for item in items if item) >= self.count
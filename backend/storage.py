@@ -0,0 +1,490 @@
+"""
+Storage backends for sessions and CV analyses
+
+- MemoryStore: process-local dicts, the default for development
+- SQLiteStore: durable SQLite database in WAL mode, safe to share between
+  several gunicorn workers on one host
+
+Both expose the same methods, so app.py does not care which one is in use.
+They also record which lines of a bulk upload have been analyzed, so an
+interrupted bulk run can resume where it stopped. Runs expire once they
+have not been updated for a while (see prune_bulk_progress). The stores
+also keep each analysis's passage index for chat retrieval and each
+session's chat history (see conversation.py). Deleting an analysis deletes
+its index.
+Select the backend with STORAGE_BACKEND (memory | sqlite) and the database
+file with STORAGE_PATH.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from retrieval import PassageIndex
+
+# Columns that session analyses can be sorted by
+SORTABLE_FIELDS = ("created_at", "ats_score", "filename", "identified_role")
+
+
+def empty_chat_memory():
+    return {"summary": "", "summarized_upto": 0, "turns": []}
+
+
+def analysis_summary(analysis):
+    """Fields returned when listing a session's analyses"""
+    return {
+        "id": analysis["id"],
+        "filename": analysis["filename"],
+        "ats_score": analysis["ats_score"],
+        "identified_role": analysis["identified_role"],
+        "created_at": analysis["created_at"],
+    }
+
+
+class MemoryStore:
+    """In-memory storage for development (lost on restart)"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._analyses = {}
+        self._bulk_progress = {}
+        self._bulk_updated = {}
+        self._indexes = {}
+        self._chat_memory = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, session):
+        with self._lock:
+            self._sessions[session["id"]] = {**session, "analyses": []}
+
+    def session_exists(self, session_id):
+        return session_id in self._sessions
+
+    def save_analysis(self, analysis):
+        """Store an analysis and attach it to its session, if the session exists"""
+        with self._lock:
+            self._analyses[analysis["id"]] = analysis
+            session = self._sessions.get(analysis["session_id"])
+            if session is not None:
+                session["analyses"].append(analysis["id"])
+
+    def get_analysis(self, analysis_id):
+        return self._analyses.get(analysis_id)
+
+    def delete_analysis(self, analysis_id):
+        """Remove an analysis and its passage index; False if it did not exist"""
+        with self._lock:
+            analysis = self._analyses.pop(analysis_id, None)
+            self._indexes.pop(analysis_id, None)
+            if analysis is None:
+                return False
+            session = self._sessions.get(analysis["session_id"])
+            if session is not None and analysis_id in session["analyses"]:
+                session["analyses"].remove(analysis_id)
+            return True
+
+    def save_index(self, analysis_id, index):
+        """Attach a PassageIndex to a stored analysis"""
+        with self._lock:
+            if analysis_id in self._analyses:
+                self._indexes[analysis_id] = index
+
+    def get_index(self, analysis_id):
+        return self._indexes.get(analysis_id)
+
+    def list_session_analyses(
+        self, session_id, limit=50, offset=0, sort="created_at", order="asc"
+    ):
+        """Return ``(summaries, total)`` for one page of a session's analyses"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return [], 0
+            items = [
+                self._analyses[analysis_id]
+                for analysis_id in session["analyses"]
+                if analysis_id in self._analyses
+            ]
+        items.sort(key=lambda a: (a[sort] is None, a[sort]), reverse=order == "desc")
+        page = items[offset : offset + limit]
+        return [analysis_summary(a) for a in page], len(items)
+
+    def save_bulk_progress(self, bulk_id, record_index, digest, analysis_id):
+        """Record that one line of a bulk upload has been analyzed"""
+        with self._lock:
+            self._bulk_progress.setdefault(bulk_id, {})[record_index] = {
+                "digest": digest,
+                "analysis_id": analysis_id,
+            }
+            self._bulk_updated[bulk_id] = time.time()
+
+    def get_bulk_progress(self, bulk_id, start, stop):
+        """``{record_index: {"digest", "analysis_id"}}`` for lines ``[start, stop)``"""
+        with self._lock:
+            progress = self._bulk_progress.get(bulk_id, {})
+            return {i: progress[i] for i in range(start, stop) if i in progress}
+
+    def count_bulk_progress(self, bulk_id):
+        """Number of analyzed lines of a bulk upload"""
+        with self._lock:
+            return len(self._bulk_progress.get(bulk_id, {}))
+
+    def delete_bulk_progress(self, bulk_id):
+        """Forget a bulk upload's progress; False if there was none"""
+        with self._lock:
+            self._bulk_updated.pop(bulk_id, None)
+            return self._bulk_progress.pop(bulk_id, None) is not None
+
+    def prune_bulk_progress(self, max_age):
+        """Forget bulk uploads not updated for ``max_age`` seconds; returns how many"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [b for b, t in self._bulk_updated.items() if t < cutoff]
+            for bulk_id in expired:
+                del self._bulk_updated[bulk_id]
+                self._bulk_progress.pop(bulk_id, None)
+            return len(expired)
+
+    def append_chat_turn(self, session_id, user, assistant):
+        """Add a turn to a session's chat; returns its unsummarized turn count"""
+        with self._lock:
+            memory = self._chat_memory.setdefault(session_id, empty_chat_memory())
+            turns = memory["turns"]
+            index = turns[-1]["index"] + 1 if turns else memory["summarized_upto"]
+            turns.append({"index": index, "user": user, "assistant": assistant})
+            return len(turns)
+
+    def get_chat_memory(self, session_id):
+        """``{"summary", "summarized_upto", "turns"}`` of a session's chat"""
+        with self._lock:
+            memory = self._chat_memory.get(session_id)
+            if memory is None:
+                return empty_chat_memory()
+            return {**memory, "turns": list(memory["turns"])}
+
+    def save_chat_summary(self, session_id, summary, base, upto):
+        """Replace the summary with one covering the turns before ``upto``.
+
+        The folded turns are dropped. Returns False, changing nothing, unless
+        the stored summary still covers exactly the turns before ``base``.
+        """
+        with self._lock:
+            memory = self._chat_memory.get(session_id)
+            if memory is None or memory["summarized_upto"] != base:
+                return False
+            memory["summary"] = summary
+            memory["summarized_upto"] = upto
+            memory["turns"] = [t for t in memory["turns"] if t["index"] >= upto]
+            return True
+
+    def clear_chat_memory(self, session_id):
+        with self._lock:
+            return self._chat_memory.pop(session_id, None) is not None
+
+
+class SQLiteStore:
+    """SQLite storage in WAL mode with a small connection pool"""
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    created_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    filename TEXT,
+                    ats_score INTEGER,
+                    identified_role TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_session_id
+                    ON analyses (session_id);
+                CREATE INDEX IF NOT EXISTS idx_analyses_created_at
+                    ON analyses (created_at);
+                CREATE INDEX IF NOT EXISTS idx_analyses_session_created
+                    ON analyses (session_id, created_at);
+                CREATE TABLE IF NOT EXISTS bulk_progress (
+                    bulk_id TEXT NOT NULL,
+                    record_index INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    analysis_id TEXT NOT NULL,
+                    PRIMARY KEY (bulk_id, record_index)
+                );
+                CREATE TABLE IF NOT EXISTS bulk_runs (
+                    bulk_id TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_bulk_runs_updated_at
+                    ON bulk_runs (updated_at);
+                CREATE TABLE IF NOT EXISTS analysis_indexes (
+                    analysis_id TEXT PRIMARY KEY,
+                    passages TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    embeddings BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    session_id TEXT NOT NULL,
+                    turn_index INTEGER NOT NULL,
+                    user_message TEXT NOT NULL,
+                    assistant_message TEXT NOT NULL,
+                    PRIMARY KEY (session_id, turn_index)
+                );
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    summarized_upto INTEGER NOT NULL
+                );
+                """
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection; commits on success, rolls back on error"""
+        conn = self._pool.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def create_session(self, session):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (id, created_at) VALUES (?, ?)",
+                (session["id"], session["created_at"]),
+            )
+
+    def session_exists(self, session_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return row is not None
+
+    def save_analysis(self, analysis):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(id, session_id, created_at, filename, ats_score, identified_role, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    analysis["id"],
+                    analysis["session_id"],
+                    analysis["created_at"],
+                    analysis["filename"],
+                    analysis["ats_score"],
+                    analysis["identified_role"],
+                    json.dumps(analysis),
+                ),
+            )
+
+    def get_analysis(self, analysis_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM analyses WHERE id = ?", (analysis_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_analysis(self, analysis_id):
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM analysis_indexes WHERE analysis_id = ?", (analysis_id,)
+            )
+            cursor = conn.execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
+        return cursor.rowcount > 0
+
+    def save_index(self, analysis_id, index):
+        passages, dim, embeddings = index.to_record()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_indexes "
+                "(analysis_id, passages, dim, embeddings) "
+                "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM analyses WHERE id = ?)",
+                (analysis_id, passages, dim, embeddings, analysis_id),
+            )
+
+    def get_index(self, analysis_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT passages, dim, embeddings FROM analysis_indexes "
+                "WHERE analysis_id = ?",
+                (analysis_id,),
+            ).fetchone()
+        return PassageIndex.from_record(*row) if row else None
+
+    def list_session_analyses(
+        self, session_id, limit=50, offset=0, sort="created_at", order="asc"
+    ):
+        """Return ``(summaries, total)`` for one page of a session's analyses"""
+        if sort not in SORTABLE_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}")
+        direction = "DESC" if order == "desc" else "ASC"
+        with self._connection() as conn:
+            (total,) = conn.execute(
+                "SELECT COUNT(*) FROM analyses WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT id, filename, ats_score, identified_role, created_at "
+                f"FROM analyses WHERE session_id = ? ORDER BY {sort} {direction}, id "
+                "LIMIT ? OFFSET ?",
+                (session_id, limit, offset),
+            ).fetchall()
+        keys = ("id", "filename", "ats_score", "identified_role", "created_at")
+        return [dict(zip(keys, row)) for row in rows], total
+
+    def save_bulk_progress(self, bulk_id, record_index, digest, analysis_id):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO bulk_progress "
+                "(bulk_id, record_index, digest, analysis_id) VALUES (?, ?, ?, ?)",
+                (bulk_id, record_index, digest, analysis_id),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO bulk_runs (bulk_id, updated_at) VALUES (?, ?)",
+                (bulk_id, time.time()),
+            )
+
+    def get_bulk_progress(self, bulk_id, start, stop):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT record_index, digest, analysis_id FROM bulk_progress "
+                "WHERE bulk_id = ? AND record_index >= ? AND record_index < ?",
+                (bulk_id, start, stop),
+            ).fetchall()
+        return {
+            index: {"digest": digest, "analysis_id": analysis_id}
+            for index, digest, analysis_id in rows
+        }
+
+    def count_bulk_progress(self, bulk_id):
+        with self._connection() as conn:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM bulk_progress WHERE bulk_id = ?", (bulk_id,)
+            ).fetchone()
+        return count
+
+    def delete_bulk_progress(self, bulk_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM bulk_runs WHERE bulk_id = ?", (bulk_id,))
+            removed = conn.execute(
+                "DELETE FROM bulk_progress WHERE bulk_id = ?", (bulk_id,)
+            ).rowcount
+        return removed > 0
+
+    def prune_bulk_progress(self, max_age):
+        cutoff = time.time() - max_age
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM bulk_progress WHERE bulk_id IN "
+                "(SELECT bulk_id FROM bulk_runs WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            removed = conn.execute(
+                "DELETE FROM bulk_runs WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        return removed
+
+    def append_chat_turn(self, session_id, user, assistant):
+        with self._connection() as conn:
+            # One statement, so concurrent workers never pick the same index
+            conn.execute(
+                "INSERT INTO chat_turns "
+                "(session_id, turn_index, user_message, assistant_message) "
+                "SELECT ?, COALESCE(MAX(turn_index) + 1, "
+                "(SELECT summarized_upto FROM chat_summaries WHERE session_id = ?), "
+                "0), ?, ? FROM chat_turns WHERE session_id = ?",
+                (session_id, session_id, user, assistant, session_id),
+            )
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM chat_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return count
+
+    def get_chat_memory(self, session_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT summary, summarized_upto FROM chat_summaries "
+                "WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            summary, upto = row if row else ("", 0)
+            rows = conn.execute(
+                "SELECT turn_index, user_message, assistant_message FROM chat_turns "
+                "WHERE session_id = ? AND turn_index >= ? ORDER BY turn_index",
+                (session_id, upto),
+            ).fetchall()
+        keys = ("index", "user", "assistant")
+        return {
+            "summary": summary,
+            "summarized_upto": upto,
+            "turns": [dict(zip(keys, row)) for row in rows],
+        }
+
+    def save_chat_summary(self, session_id, summary, base, upto):
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE chat_summaries SET summary = ?, summarized_upto = ? "
+                "WHERE session_id = ? AND summarized_upto = ?",
+                (summary, upto, session_id, base),
+            )
+            if cursor.rowcount == 0:
+                if base != 0:
+                    return False
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO chat_summaries "
+                    "(session_id, summary, summarized_upto) VALUES (?, ?, ?)",
+                    (session_id, summary, upto),
+                )
+                if cursor.rowcount == 0:
+                    return False
+            conn.execute(
+                "DELETE FROM chat_turns WHERE session_id = ? AND turn_index < ?",
+                (session_id, upto),
+            )
+        return True
+
+    def clear_chat_memory(self, session_id):
+        with self._connection() as conn:
+            removed = conn.execute(
+                "DELETE FROM chat_summaries WHERE session_id = ?", (session_id,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM chat_turns WHERE session_id = ?", (session_id,)
+            ).rowcount
+        return removed > 0
+
+
+def store_from_env():
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = os.environ.get("STORAGE_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        return SQLiteStore(
+            os.environ.get("STORAGE_PATH", "cv_grinder.db"),
+            pool_size=int(os.environ.get("STORAGE_POOL_SIZE", "4")),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,406 @@
+"""
+Skill/role taxonomy and a compiled multi-pattern matcher for CV screening
+
+Every skill and role alias is tokenized and compiled into one token trie.
+``SkillMatcher.match`` then scans a CV in a single pass. It returns:
+- the skills found
+- the skills missing for the target role
+- a weighted role-match score
+- the ATS score
+No LLM call is made. Patterns match on whole tokens, so "Java" does not
+match "JavaScript" and "led" does not match "skilled". ``match_many``
+scores large batches and can spread them over worker processes for bulk
+screening.
+
+The built-in taxonomy can be replaced with a JSON file that has the same
+"skills"/"roles" shape; point SKILL_TAXONOMY_PATH at it.
+"""
+
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Canonical skill name -> aliases, matched case-insensitively on whole tokens.
+# Only the aliases are matched, so ambiguous names ("Go", ".NET") stay safe.
+SKILLS = {
+    "Python": ["python"],
+    "Java": ["java"],
+    "JavaScript": ["javascript", "js", "ecmascript"],
+    "TypeScript": ["typescript"],
+    "Go": ["golang"],
+    "Rust": ["rust"],
+    "C++": ["c++", "cpp"],
+    "C#": ["c#", "csharp"],
+    ".NET": ["dotnet", "asp.net", ".net core", ".net framework"],
+    "Ruby": ["ruby", "ruby on rails", "rails"],
+    "PHP": ["php", "laravel"],
+    "Kotlin": ["kotlin"],
+    "Swift": ["swift", "swiftui"],
+    "Scala": ["scala"],
+    "SQL": ["sql", "postgresql", "postgres", "mysql", "sqlite", "t-sql"],
+    "PostgreSQL": ["postgresql", "postgres"],
+    "MySQL": ["mysql"],
+    "MongoDB": ["mongodb", "mongo"],
+    "Redis": ["redis"],
+    "Kafka": ["kafka"],
+    "Spark": ["spark", "pyspark"],
+    "Hadoop": ["hadoop"],
+    "Airflow": ["airflow"],
+    "dbt": ["dbt"],
+    "Snowflake": ["snowflake"],
+    "Docker": ["docker", "containers", "containerization"],
+    "Kubernetes": ["kubernetes", "k8s", "eks", "gke"],
+    "Terraform": ["terraform"],
+    "Ansible": ["ansible"],
+    "AWS": ["aws", "amazon web services", "ec2", "s3"],
+    "Azure": ["azure"],
+    "GCP": ["gcp", "google cloud"],
+    "CI/CD": ["ci/cd", "ci cd", "continuous integration", "continuous delivery"],
+    "Jenkins": ["jenkins"],
+    "GitHub Actions": ["github actions"],
+    "Git": ["git", "github", "gitlab"],
+    "Linux": ["linux", "unix", "bash"],
+    "REST APIs": ["restful", "rest api", "rest apis"],
+    "GraphQL": ["graphql"],
+    "Microservices": ["microservices", "microservice"],
+    "Unit Testing": [
+        "unit testing",
+        "unit tests",
+        "tdd",
+        "pytest",
+        "junit",
+        "jest",
+    ],
+    "Test Automation": [
+        "test automation",
+        "automated testing",
+        "integration testing",
+    ],
+    "Selenium": ["selenium"],
+    "Cypress": ["cypress"],
+    "Django": ["django"],
+    "Flask": ["flask"],
+    "FastAPI": ["fastapi"],
+    "Spring": ["spring boot", "spring framework"],
+    "Node.js": ["node.js", "nodejs"],
+    "React": ["react", "react.js", "reactjs"],
+    "Angular": ["angular"],
+    "Vue": ["vue", "vue.js", "vuejs"],
+    "Next.js": ["next.js", "nextjs"],
+    "Redux": ["redux"],
+    "Webpack": ["webpack"],
+    "HTML": ["html", "html5"],
+    "CSS": ["css", "css3", "sass", "tailwind"],
+    "Pandas": ["pandas"],
+    "NumPy": ["numpy"],
+    "scikit-learn": ["scikit-learn", "sklearn"],
+    "TensorFlow": ["tensorflow", "keras"],
+    "PyTorch": ["pytorch", "torch"],
+    "Machine Learning": ["machine learning", "ml"],
+    "Deep Learning": ["deep learning", "neural networks"],
+    "NLP": ["nlp", "natural language processing"],
+    "MLOps": ["mlops"],
+    "MLflow": ["mlflow"],
+    "Statistics": ["statistics", "statistical", "hypothesis testing"],
+    "A/B Testing": ["a/b testing", "ab testing", "experimentation"],
+    "Tableau": ["tableau"],
+    "Power BI": ["power bi", "powerbi"],
+    "Prometheus": ["prometheus"],
+    "Grafana": ["grafana"],
+    "Android": ["android"],
+    "iOS": ["ios"],
+    "React Native": ["react native"],
+    "Flutter": ["flutter"],
+    "Agile": ["agile", "scrum", "kanban"],
+    "Jira": ["jira"],
+    "Roadmapping": ["roadmap", "roadmaps", "roadmapping", "product roadmap"],
+    "Stakeholder Management": ["stakeholder management", "stakeholders"],
+    "User Research": ["user research", "user interviews", "usability testing"],
+    "Analytics": ["analytics", "product analytics", "mixpanel", "amplitude"],
+    "Figma": ["figma"],
+}
+
+# Role -> aliases used to recognise the identified role, plus the skills the
+# role needs. Core skills weigh twice as much as extras in the role match.
+# Order matters only as a tie-break; the generic role comes last.
+ROLES = {
+    "Backend Developer": {
+        "aliases": ["backend", "backend developer", "backend engineer", "back end"],
+        "core": ["SQL", "REST APIs", "Docker", "Unit Testing", "Microservices"],
+        "extra": ["PostgreSQL", "Redis", "Kafka", "Kubernetes", "AWS", "CI/CD"],
+    },
+    "Frontend Developer": {
+        "aliases": ["frontend", "frontend developer", "frontend engineer", "front end"],
+        "core": ["JavaScript", "TypeScript", "React", "HTML", "CSS"],
+        "extra": ["Unit Testing", "Redux", "Next.js", "Webpack", "GraphQL", "Figma"],
+    },
+    "Full Stack Developer": {
+        "aliases": ["full stack", "fullstack", "full-stack"],
+        "core": ["JavaScript", "React", "Node.js", "SQL", "REST APIs"],
+        "extra": ["TypeScript", "Docker", "AWS", "Unit Testing", "GraphQL", "CI/CD"],
+    },
+    "Data Scientist": {
+        "aliases": ["data scientist", "data science"],
+        "core": ["Python", "SQL", "Statistics", "Machine Learning", "Pandas"],
+        "extra": ["scikit-learn", "A/B Testing", "Deep Learning", "Tableau", "Spark"],
+    },
+    "Data Engineer": {
+        "aliases": ["data engineer", "data engineering", "etl developer"],
+        "core": ["Python", "SQL", "Spark", "Airflow", "Kafka"],
+        "extra": ["AWS", "Snowflake", "dbt", "Docker", "Hadoop", "PostgreSQL"],
+    },
+    "Machine Learning Engineer": {
+        "aliases": ["machine learning engineer", "ml engineer", "ai engineer"],
+        "core": ["Python", "Machine Learning", "PyTorch", "Docker", "MLOps"],
+        "extra": ["TensorFlow", "Kubernetes", "AWS", "Deep Learning", "NLP", "MLflow"],
+    },
+    "DevOps Engineer": {
+        "aliases": [
+            "devops",
+            "devops engineer",
+            "sre",
+            "site reliability engineer",
+            "platform engineer",
+            "cloud engineer",
+        ],
+        "core": ["Linux", "Docker", "Kubernetes", "CI/CD", "Terraform"],
+        "extra": ["AWS", "Ansible", "Prometheus", "Grafana", "Python", "Azure"],
+    },
+    "Mobile Developer": {
+        "aliases": [
+            "mobile developer",
+            "mobile engineer",
+            "android developer",
+            "android engineer",
+            "ios developer",
+            "ios engineer",
+        ],
+        "core": ["Kotlin", "Swift", "Android", "iOS", "Git"],
+        "extra": ["React Native", "Flutter", "Unit Testing", "CI/CD", "REST APIs"],
+    },
+    "Product Manager": {
+        "aliases": ["product manager", "product owner", "product management"],
+        "core": [
+            "Roadmapping",
+            "Stakeholder Management",
+            "Agile",
+            "User Research",
+            "Analytics",
+        ],
+        "extra": ["SQL", "A/B Testing", "Jira", "Figma"],
+    },
+    "QA Engineer": {
+        "aliases": ["qa", "qa engineer", "quality assurance", "test engineer", "sdet"],
+        "core": ["Unit Testing", "Test Automation", "Selenium", "CI/CD"],
+        "extra": ["Cypress", "Python", "Java", "Jira", "Agile"],
+    },
+    "Software Engineer": {
+        "aliases": [
+            "software engineer",
+            "software developer",
+            "developer",
+            "engineer",
+            "programmer",
+            "sde",
+        ],
+        "core": ["Git", "Unit Testing", "SQL", "REST APIs", "Docker"],
+        "extra": ["CI/CD", "AWS", "Microservices", "Kubernetes", "Linux", "GraphQL"],
+    },
+}
+
+# ATS signals, matched on whole tokens like the skills
+ACTION_VERBS = ["achieved", "developed", "managed", "led"]
+EXPERIENCE_TERMS = ["experience"]
+
+# Words stay together across dots ("node.js") and "+"/"#" ("c++", "c#");
+# hyphens and slashes split, so "python-based" still yields "python".
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*")
+
+_CORE_WEIGHT = 2
+_EXTRA_WEIGHT = 1
+
+
+def tokenize(text):
+    """Lowercased word tokens used for both patterns and CV text"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def load_taxonomy(path=None):
+    """``(skills, roles)`` from a JSON file, or the built-in taxonomy"""
+    path = path or os.environ.get("SKILL_TAXONOMY_PATH")
+    if not path:
+        return SKILLS, ROLES
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["skills"], data["roles"]
+
+
+class SkillMatcher:
+    """Token-trie matcher compiled from a skill/role taxonomy"""
+
+    def __init__(self, skills=None, roles=None):
+        if skills is None or roles is None:
+            skills, roles = load_taxonomy()
+        self.skills = skills
+        self.roles = roles
+        for role, spec in roles.items():
+            unknown = set(spec["core"]) | set(spec["extra"])
+            unknown -= set(skills)
+            if unknown:
+                raise ValueError(f"Role {role} uses unknown skills: {sorted(unknown)}")
+
+        # One trie for CV text (skills and ATS signals), one for role titles
+        self._text_trie = {}
+        for skill, aliases in skills.items():
+            for alias in aliases:
+                self._add(self._text_trie, alias, ("skill", skill))
+        for verb in ACTION_VERBS:
+            self._add(self._text_trie, verb, ("verb", verb))
+        for term in EXPERIENCE_TERMS:
+            self._add(self._text_trie, term, ("experience", term))
+
+        self._role_trie = {}
+        for role, spec in roles.items():
+            for alias in spec["aliases"] + [role]:
+                self._add(self._role_trie, alias, ("role", role))
+
+    @staticmethod
+    def _add(trie, pattern, value):
+        tokens = tokenize(pattern)
+        if not tokens:
+            return
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, set()).add(value)
+
+    @staticmethod
+    def _scan(trie, tokens):
+        """Yield ``(value, length)`` for every pattern occurrence in ``tokens``"""
+        for start, token in enumerate(tokens):
+            node = trie.get(token)
+            end = start + 1
+            while node is not None:
+                for value in node.get(None, ()):
+                    yield value, end - start
+                if end == len(tokens):
+                    break
+                node = node.get(tokens[end])
+                end += 1
+
+    def resolve_role(self, role_text, found_skills=()):
+        """Map free-text role (e.g. the LLM's answer) to a taxonomy role.
+
+        The longest matching alias wins. When nothing matches, the role
+        with the highest role match for ``found_skills`` is used.
+        """
+        best, best_length = None, 0
+        order = list(self.roles)
+        for (_, role), length in self._scan(self._role_trie, tokenize(role_text or "")):
+            if length > best_length or (
+                length == best_length and order.index(role) < order.index(best)
+            ):
+                best, best_length = role, length
+        if best is not None:
+            return best
+
+        scores = [
+            (self.role_match(role, found_skills), -i, role)
+            for i, role in enumerate(order)
+        ]
+        score, _, role = max(scores)
+        return role if score else order[-1]
+
+    def role_match(self, role, found_skills):
+        """Weighted share (0-100) of the role's skills present in the CV"""
+        spec = self.roles[role]
+        found = set(found_skills)
+        total = _CORE_WEIGHT * len(spec["core"]) + _EXTRA_WEIGHT * len(spec["extra"])
+        matched = _CORE_WEIGHT * len(found & set(spec["core"])) + _EXTRA_WEIGHT * len(
+            found & set(spec["extra"])
+        )
+        return round(100 * matched / total) if total else 0
+
+    def missing_skills(self, role, found_skills, limit=5):
+        """Role skills absent from the CV, core skills first"""
+        spec = self.roles[role]
+        found = set(found_skills)
+        missing = [s for s in spec["core"] + spec["extra"] if s not in found]
+        return missing[:limit]
+
+    def match(self, cv_text, role=None, keywords=()):
+        """Score one CV in a single scan.
+
+        ``role`` is free text such as the identified role; when omitted the
+        role is inferred from the skills. ``keywords`` (e.g. the LLM's
+        extracted keywords) only feed the ATS score.
+        """
+        tokens = tokenize(cv_text)
+        found_skills = []
+        seen = set()
+        verbs = experience = False
+        for (kind, value), _ in self._scan(self._text_trie, tokens):
+            if kind == "skill" and value not in seen:
+                seen.add(value)
+                found_skills.append(value)
+            elif kind == "verb":
+                verbs = True
+            elif kind == "experience":
+                experience = True
+
+        resolved = self.resolve_role(role, found_skills)
+
+        score = 70  # Base score
+        if len(cv_text) > 500:
+            score += 5
+        if keywords:
+            joined = f" {' '.join(tokens)} "
+            phrases = (" ".join(tokenize(k)) for k in keywords)
+            if any(p and f" {p} " in joined for p in phrases):
+                score += 10
+        if experience:
+            score += 5
+        if verbs:
+            score += 10
+
+        return {
+            "role": resolved,
+            "found_skills": found_skills,
+            "missing_skills": self.missing_skills(resolved, found_skills),
+            "role_match": self.role_match(resolved, found_skills),
+            "ats_score": min(score, 95),  # Cap at 95
+        }
+
+    def match_many(self, cv_texts, roles=None, workers=1, chunksize=256):
+        """Score a batch of CVs; ``roles`` is an optional parallel list.
+
+        With ``workers`` above 1 the batch is split across that many
+        processes, which pays off for thousands of CVs.
+        """
+        roles = roles if roles is not None else [None] * len(cv_texts)
+        if workers <= 1:
+            return [self.match(text, role) for text, role in zip(cv_texts, roles)]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.skills, self.roles),
+        ) as executor:
+            return list(
+                executor.map(_match_in_worker, cv_texts, roles, chunksize=chunksize)
+            )
+
+
+_worker_matcher = None
+
+
+def _init_worker(skills, roles):
+    global _worker_matcher
+    _worker_matcher = SkillMatcher(skills, roles)
+
+
+def _match_in_worker(cv_text, role):
+    return _worker_matcher.match(cv_text, role)
+
+
+skill_matcher = SkillMatcher()